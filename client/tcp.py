@@ -1,6 +1,6 @@
 import socket
 from threading import Thread
-from queue import Queue
+from queue import Queue, Empty
 import threading
 import time
 import signal
@@ -8,16 +8,24 @@ import os
 import sys
 
 from core.file_handler import FileHandler
-from core.constants import NUM_SOCKET, NUM_CHUNK, BUFFER_SIZE, INPUT_SCAN_INTERVAL
+from core.hash_cache import HashCache, check_local
+from core.input_watch import InputWatcher
+from core.scheduler import DownloadScheduler, Download
+from core.sparse import recv_records
+from core.tls import client_context, connect_all
+from core.constants import (NUM_SOCKET, NUM_CHUNK, BUFFER_SIZE, SPARSE_TRANSFER, CONDITIONAL_GET, TLS_ENABLED,
+                            TLS_CA, MAX_ACTIVE_DOWNLOADS, DOWNLOAD_RATE_LIMIT)
 
 
 class Client:
 
-    def __init__(self, HOST, PORT, folder_path, input_path, use_signals=True):
-        self.socket = [] * NUM_SOCKET
-        for i in range(NUM_SOCKET):
-            self.socket.append(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
-            self.socket[i].connect((HOST, PORT))
+    def __init__(self, HOST, PORT, folder_path, input_path, use_signals=True, tls=TLS_ENABLED, ca=TLS_CA,
+                 concurrency=MAX_ACTIVE_DOWNLOADS, rate=DOWNLOAD_RATE_LIMIT):
+        self.host = HOST
+        self.port = PORT
+        self.tls = tls
+        self.ca = ca
+        self.socket = self.open_sockets()
 
         print("\n\033[1;32;40m[NOTIFICATION] Connected to Server.\n\033[0m")
 
@@ -30,6 +38,11 @@ class Client:
         self.file_list = []
         self.folder_path = folder_path
         self.input_path = input_path
+        # digests of the local copies, for conditional GETs
+        self.hashes = HashCache(folder_path)
+        # several files at once, each on its own 1+4 sockets
+        self.scheduler = DownloadScheduler(self.open_connection, concurrency, rate, on_update=self.report)
+        self.connections = 0
 
         try:
             self.rcv_file_list()
@@ -52,25 +65,57 @@ class Client:
         except Exception as e:
             print(f"Error in main: {e}")
 
+    def open_sockets(self):
+        if self.tls:
+            # one full handshake, the other sockets resume its session
+            sockets, resumed = connect_all(client_context(self.ca), self.host, self.port, NUM_SOCKET)
+            print(f"TLS: {sockets[0].version()}, {resumed} of {NUM_SOCKET - 1} sessions resumed")
+            return sockets
+
+        sockets = []
+        for i in range(NUM_SOCKET):
+            sockets.append(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+            sockets[i].connect((self.host, self.port))
+        return sockets
+
+    def open_connection(self):
+        """A connection for a scheduler worker: the first one gets the client's own sockets"""
+        self.connections += 1
+        if self.connections == 1:
+            return Connection(self, self.socket)
+        try:
+            sockets = self.open_sockets()
+            # the file list every new connection starts with
+            sockets[4].recv(1024)
+        except OSError as e:
+            print(f"Cannot open connection {self.connections}: {e}")
+            return None
+        return Connection(self, sockets)
+
+    def report(self, download):
+        if self.scheduler.concurrency == 1:
+            return
+        if download.state == Download.ACTIVE:
+            print(f"Downloading {download.name} ({self.scheduler.active} active, {len(self.scheduler.queue)} queued)")
+        elif download.state == Download.DONE and download.unchanged:
+            print(f"{download.name} not modified, kept the local copy")
+        elif download.state == Download.DONE:
+            print(f"{download.name} downloaded successfully ({download.rate / 1e6:.1f} MB/s)")
+        elif download.state == Download.FAILED:
+            print(f"{download.name} failed")
+
     def get_file_size(self, filename):
-        return int(next((size for name, size in self.file_list if name == filename), None))
+        size = next((size for name, size in self.file_list if name == filename), None)
+        return None if size is None else int(size)
 
     def read_input_file(self):
-        start = 0
-
         try:
-            while self.running:
-                with open(self.input_path, "r") as f:
-                    f.seek(start)
-                    new_files = [line.strip() for line in f.readlines()]
-                    start = f.tell()
-
-                for file in new_files:
-                    if file == "": continue
+            # woken by inotify as soon as a line is appended
+            with InputWatcher(self.input_path) as watcher:
+                for file in watcher.follow():
+                    if not self.running:
+                        break
                     self.need_file.put(file)
-
-                f.close()
-                time.sleep(INPUT_SCAN_INTERVAL)
         except (KeyboardInterrupt, ConnectionAbortedError, BrokenPipeError):
             self.stop()
         except Exception as e:
@@ -79,18 +124,11 @@ class Client:
     def send_request(self):
         try:
             while self.running:
-                if not self.need_file.empty():
-                    filename = self.need_file.get()
-                    msg = f"GET {filename}"
-                    print(f"Client: {msg}")
-                    self.socket[4].send(msg.encode())
-
-                    # response file exist or not
-                    server_response = self.socket[4].recv(1024).decode()
-                    print("\033[1;31;40m" + "Server: " + server_response + "\033[0m")
-                    if "not exist" not in server_response:
-                        file_size = self.get_file_size(filename)
-                        FileClient(filename, file_size, self, self.folder_path).rcv_file()
+                try:
+                    filename = self.need_file.get(timeout=1.0)
+                except Empty:
+                    continue
+                self.scheduler.submit(filename, self.get_file_size(filename))
 
         except (KeyboardInterrupt, ConnectionAbortedError, BrokenPipeError):
             self.stop()
@@ -116,21 +154,83 @@ class Client:
 
     def stop(self, *args, **kwargs):
         self.running = False
+        self.scheduler.close()
         print("\n\033[1;32;40m[NOTIFICATION] Disconnected!\n\033[0m")
         if self.use_signals:
             os._exit(0)
 
+class Connection:
+    """One 1+4 socket connection to the server, downloading one file at a time"""
+
+    def __init__(self, client, sockets):
+        self.client = client
+        self.socket = sockets
+        self.use_signals = client.use_signals
+        self.meter = None
+
+    def download_file(self, filename):
+        # STAT first: a local copy the server has the same version of is kept
+        remote = None
+        if CONDITIONAL_GET:
+            unchanged, remote = check_local(self.client.hashes, filename, self.stat)
+            if unchanged:
+                print(f"Client: {filename} not modified, kept the local copy")
+                if self.meter:
+                    self.meter.unchanged = True
+                return True
+
+        # SPARSE: holes and zero blocks come as zero ranges
+        msg = f"{'SPARSE' if SPARSE_TRANSFER else 'GET'} {filename}"
+        print(f"Client: {msg}")
+        self.socket[4].send(msg.encode())
+
+        # response file exist or not
+        server_response = self.socket[4].recv(1024).decode()
+        print("\033[1;31;40m" + "Server: " + server_response + "\033[0m")
+        if "not exist" in server_response:
+            return False
+        file_size = self.client.get_file_size(filename)
+        # one file: its parts are shown; several: the scheduler reports them
+        show_progress = self.client.scheduler.concurrency == 1
+        receiver = FileClient(filename, file_size, self, self.client.folder_path, show_progress)
+        ok = receiver.rcv_file()
+        # stamped with the server's version: the next run's STAT needs no hashing
+        if ok and remote is not None and all(receiver.file_handler.done_chunk):
+            self.client.hashes.adopt(filename, remote)
+        return ok
+
+    def stat(self, request):
+        self.socket[4].send(f"{request}\n".encode())
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = self.socket[4].recv(1024)
+            if not data:
+                raise ConnectionAbortedError("server closed the connection")
+            reply += data
+        return reply.decode().strip()
+
+    def disconnect(self):
+        for sock in self.socket:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
 class FileClient:
-    def __init__(self, filename, file_size, Client, folder_path):
+    def __init__(self, filename, file_size, Client, folder_path, show_progress=True):
         self.filename = filename
         self.socket = Client.socket
         self.client_instance = Client
+        self.meter = getattr(Client, "meter", None)
+        self.show_progress = show_progress
         self.num_chunk = NUM_CHUNK
         self.running = True
 
         # Use FileHandler for chunk management and progress tracking
         self.file_handler = FileHandler(file_size, filename, folder_path, self.num_chunk)
         self.chunks = self.file_handler.chunks
+        # chunks are written in place as they arrive
+        self.file_handler.open_output()
 
     def rcv_file(self):
         try:
@@ -142,13 +242,15 @@ class FileClient:
                 thread.start()
 
             # Use FileHandler's display_progress method
-            progress_thread = Thread(target=self.file_handler.display_progress, daemon=True)
-            progress_thread.start()
+            if self.show_progress:
+                progress_thread = Thread(target=self.file_handler.display_progress, daemon=True)
+                progress_thread.start()
 
             for thread in threads:
                 thread.join()
 
-            progress_thread.join()
+            if self.show_progress:
+                progress_thread.join()
 
             # Use FileHandler's merge method
             self.file_handler.merge()
@@ -157,6 +259,7 @@ class FileClient:
             client_msg = f"{self.filename} received successfully"
             self.socket[4].send(client_msg.encode())
             print(f"Client: {client_msg}")
+            return True
         except (KeyboardInterrupt, ConnectionAbortedError, BrokenPipeError):
             self.stop()
         except Exception as e:
@@ -168,18 +271,23 @@ class FileClient:
         start, end, size = self.chunks[chunk_id]
         rcv_size = 0
         try:
-            data = b""
-            while start < end:
-                packet = self.socket[chunk_id].recv(min(BUFFER_SIZE, end - start))
-                if not packet: break
-                data += packet
-                start += len(packet)
-                rcv_size += len(packet)
-                # Use FileHandler's update_progress method
-                self.file_handler.update_progress(chunk_id, rcv_size, size)
+            if SPARSE_TRANSFER:
+                recv_records(self.socket[chunk_id], self.file_handler.output, start, size,
+                             lambda n: self.file_handler.update_progress(chunk_id, n, size), self.meter)
+            else:
+                while start < end:
+                    packet = self.socket[chunk_id].recv(min(BUFFER_SIZE, end - start))
+                    if not packet: break
+                    self.file_handler.output.write(start, packet)
+                    start += len(packet)
+                    rcv_size += len(packet)
+                    if self.meter:
+                        self.meter.add(len(packet))
+                    # Use FileHandler's update_progress method
+                    self.file_handler.update_progress(chunk_id, rcv_size, size)
 
             # Use FileHandler's finish_chunk method
-            self.file_handler.finish_chunk(chunk_id, data)
+            self.file_handler.finish_chunk(chunk_id)
 
         except (KeyboardInterrupt, ConnectionAbortedError, BrokenPipeError):
             self.stop()
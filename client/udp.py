@@ -1,18 +1,29 @@
-from queue import Queue
+from queue import Queue, Empty
 import socket
 from threading import Thread
 import threading
 import time
+import random
 import sys
 import os
 
 from core.file_handler import FileHandler
-from core.constants import NUM_CHUNK, PACKET_SIZE, TIMEOUT, MAX_TRIES, INPUT_SCAN_INTERVAL
+from core.hash_cache import HashCache, check_local
+from core.input_watch import InputWatcher
+from core.scheduler import DownloadScheduler, Download
+from core.constants import (NUM_CHUNK, PACKET_SIZE, TIMEOUT, MAX_TRIES, UDP_FAST_PATH, MAX_ACTIVE_DOWNLOADS,
+                            DOWNLOAD_RATE_LIMIT, CONDITIONAL_GET)
+from core.udp_io import BatchIO
+from core.mtu import choose_packet_size
+from core.protocol import split_message, CONTINUE, PACKET_OVERHEAD
+from core.reassembly import ChunkReassembler
+from core.rtt import RTTEstimator
 from utils.checksum import calculate_checksum, is_valid_utf8
 
 
 class FileClient:
-    def __init__(self, host=None, port=None, output_path=None, file_input=None):
+    def __init__(self, host=None, port=None, output_path=None, file_input=None, show_progress=True,
+                 concurrency=MAX_ACTIVE_DOWNLOADS, rate=DOWNLOAD_RATE_LIMIT):
         if host is None:
             host = input("Enter Server IP address: ")
         if port is None:
@@ -30,110 +41,164 @@ class FileClient:
         self.file_name = 0
         self.output_path = output_path
         self.file_input = file_input
+        self.hashes = HashCache(output_path)  # digests of the local copies, for conditional GETs
         self.MAX_TRIES = MAX_TRIES
         self.chunk_size = 0
+        self.transfer_id = 0
+        self.packet_size = PACKET_SIZE  # negotiated with the server in connect()
+        self.rtt = RTTEstimator()        # control channel RTT, drives retransmissions
         self.need_file = Queue()
         self.list_file = ""
         self.file_handler = None  # Will be initialized per file
-
-        Thread(target = self.read_input_file, daemon=True).start()
+        self.show_progress = show_progress
+        self.concurrency = concurrency
+        self.rate = rate
+        self.control = None       # control socket of a scheduler worker
+        self.meter = None         # set by the scheduler while this worker downloads
+        self.scheduler = None
 
     def stop(self):
         print("\n\033[1;32;40m[NOTIFICATION] Disconnected!\n\033[0m")
         os._exit(0)
 
     def read_input_file(self):
-        start = 0
-
         try:
-            while True:
-                try:
-                    with open(self.file_input, "r") as f:
-                        f.seek(start)
-                        new_files = [line.strip() for line in f.readlines()]
-                        start = f.tell()
-
-                    for file in new_files:
-                        if file == "": continue
-                        if file in new_files:
-                            self.need_file.put(file)
-                    f.close()
-                    time.sleep(INPUT_SCAN_INTERVAL)
-                except KeyboardInterrupt:
-                    return
+            # woken by inotify as soon as a line is appended
+            with InputWatcher(self.file_input) as watcher:
+                for file in watcher.follow():
+                    self.need_file.put(file)
+        except KeyboardInterrupt:
+            return
         except Exception as e:
             print(f"Error in send_request: {e}")
 
+    def get_file_size(self, file_name):
+        for line in (self.list_file or "").splitlines():
+            name, _, size = line.rpartition(" - ")
+            if name == file_name and size[:-1].isdigit():
+                return int(size[:-1])
+        return None
+
+    def open_connection(self):
+        """A worker for the download scheduler: a client of its own, with its own control socket"""
+        # one file at a time: its parts are shown; several: the scheduler reports them
+        worker = FileClient(self.server_address[0], self.server_address[1], self.output_path, self.file_input,
+                            show_progress=self.show_progress and self.concurrency == 1)
+        worker.control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        worker.control.settimeout(self.TIMEOUT)
+        try:
+            worker.connect(worker.control)
+        except OSError as e:
+            worker.control.close()
+            print(f"Cannot open connection: {e}")
+            return None
+        return worker
+
+    def download_file(self, file_name):
+        return self.download(self.control, file_name)
+
+    def disconnect(self):
+        try:
+            self.send_message(self.control, "EXIT")
+        except OSError:
+            pass
+        self.control.close()
+
+    def report(self, download):
+        if self.concurrency == 1:
+            return
+        if download.state == Download.ACTIVE:
+            print(f"Downloading {download.name} ({self.scheduler.active} active, {len(self.scheduler.queue)} queued)")
+        elif download.state == Download.DONE and download.unchanged:
+            print(f"{download.name} not modified, kept the local copy")
+        elif download.state == Download.DONE:
+            print(f"{download.name} downloaded successfully ({download.rate / 1e6:.1f} MB/s)")
+        elif download.state == Download.FAILED:
+            print(f"{download.name} failed")
+
     def get_file_name(self):
-        if not self.need_file.empty():
-            return self.need_file.get()
-        else:
+        try:
+            return self.need_file.get(timeout=0.1)
+        except Empty:
             return None
 
 
-    def recv_chunk(self, chunk_id):
+    def recv_chunk(self, chunk_id, nonce):
+        finished = False
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client_sock:
+                # one FETCH: the reply carries size, transfer id and the first window of data
+                FETCH_MSG = f"FETCH {nonce} {chunk_id} {self.packet_size} {self.file_name}"
+                meta, early = self.send_fetch_message(client_sock, FETCH_MSG)
+                if meta is None:
+                    return
+                file_size, transfer_id, packet_size = meta
+                with self.lock:
+                    # the first chunk to hear back sets up the output file
+                    if self.file_handler is None:
+                        self.file_size = file_size
+                        self.transfer_id = transfer_id
+                        self.chunk_size = self.file_size // int(self.num_chunk)
+                        self.file_handler = FileHandler(self.file_size, self.file_name, self.output_path, self.num_chunk)
+                        self.file_handler.open_output()
+                        for failed in self.failed_chunks:
+                            self.file_handler.fail_chunk(failed)
+                        self.file_ready.set()
                 client_sock.settimeout(self.TIMEOUT)
-                # send PING_MSG
-                PING_MSG = "23120088"
-                self.send_ping_message(client_sock, PING_MSG)
+                # GRO hands us trains of data packets in one recvmsg
+                batch_io = BatchIO(client_sock, UDP_FAST_PATH)
+                pending = early
                 # Get chunk boundaries from FileHandler
                 start, end, total_chunk = self.file_handler.chunks[chunk_id]
-                # receive chunk
-                ack = 0
-                received_bytes = 0
-                chunk_data = b""
-                fl = True
-                while True:
+                # any valid packet is written at its offset, whatever order it comes in
+                chunk = ChunkReassembler(self.file_handler.output, start, total_chunk,
+                                         packet_size - PACKET_OVERHEAD)
+                last_ack = b"-1"
+                while not chunk.complete():
                     try:
                         # receive packet
-                        packet, _ = client_sock.recvfrom(PACKET_SIZE)
+                        if not pending:
+                            pending, _ = batch_io.recv_batch(PACKET_SIZE)
+                        packet = pending.pop(0)
+                        if packet.startswith(b"META "):
+                            continue
                         if packet.count(b"|") >= 3:
                             seq_s, checksum, id, data = packet.split(b"|", maxsplit=3)
-                            if is_valid_utf8(seq_s) and is_valid_utf8(checksum) and is_valid_utf8(id):
-                                seq_s = seq_s.decode()
-                                checksum = checksum.decode()
-                                id = int(id.decode())
-                            else:
-                                response = f"{ack - 1}"
-                                client_sock.sendto(response.encode(), self.server_address)
-                                continue
-                            if fl:
-                                if chunk_id != id:
-                                    chunk_id = id
-                                    start, end, total_chunk = self.file_handler.chunks[chunk_id]
-                                fl = False
-                            # response msg
-                            if calculate_checksum(data) == checksum:
-                                if int(seq_s) == ack:
-                                    received_bytes += len(data)
+                            if (seq_s.isdigit() and id.isdigit() and is_valid_utf8(checksum)
+                                    and int(id) == chunk_id and calculate_checksum(data) == checksum.decode()):
+                                if chunk.add(int(seq_s), data):
+                                    if self.meter:
+                                        self.meter.add(len(data))
                                     # Use FileHandler's update_progress method
-                                    self.file_handler.update_progress(chunk_id, received_bytes, total_chunk)
-                                    # send ack back
-                                    response = f"{seq_s}"
-                                    client_sock.sendto(response.encode(), self.server_address)
-                                    # store bytes
-                                    chunk_data += data
-                                    # stop when receive full chunk
-                                    if received_bytes >= total_chunk:
-                                        break
-                                    ack += 1
-                                    continue
-                        # send last ack received
-                        response = f"{ack - 1}"
-                        client_sock.sendto(response.encode(), self.server_address)
+                                    self.file_handler.update_progress(chunk_id, chunk.received_bytes, total_chunk)
+                                # ack every valid packet, duplicates too (our ACK may have been lost)
+                                client_sock.sendto(seq_s, self.server_address)
+                                last_ack = seq_s
+                                continue
+                        # corrupted: repeating the last ACK makes the server resend at once
+                        client_sock.sendto(last_ack, self.server_address)
                     except KeyboardInterrupt:
                         break
                     except socket.timeout:
                         continue
-                # Use FileHandler's finish_chunk method
-                self.file_handler.finish_chunk(chunk_id, chunk_data)
+                if chunk.complete():
+                    # Use FileHandler's finish_chunk method
+                    self.file_handler.finish_chunk(chunk_id)
+                    finished = True
                 client_sock.close()
         except KeyboardInterrupt:
             return
         except Exception as e:
             print(f"Error downloading chunk {chunk_id}: {e}")
+        finally:
+            # a failed chunk must not keep display_progress waiting for it
+            if not finished:
+                with self.lock:
+                    self.failed_chunks.add(chunk_id)
+                    if self.file_handler is not None:
+                        self.file_handler.fail_chunk(chunk_id)
+            # a missing file (or a dead server) must not leave download() waiting
+            self.file_ready.set()
 
     def start_client(self):
         try:
@@ -141,63 +206,22 @@ class FileClient:
                 client_socket.settimeout(self.TIMEOUT)
                 # PING_MSG
                 try:
-                    self.send_ping_message(client_socket, "23120088")
-                    print("\n\033[1;32;40m[NOTIFICATION] Sent PING_MSG to Server!\n\033[0m")
-                    # receive file_list
-                    self.list_file = self.recv_message(client_socket)
+                    self.connect(client_socket)
                     if self.list_file is not None:
                         print(self.list_file, "\n")
 
+                    Thread(target = self.read_input_file, daemon=True).start()
+                    # several files at once, each worker on its own sockets
+                    self.scheduler = DownloadScheduler(self.open_connection, self.concurrency, self.rate,
+                                                       on_update=self.report)
                     while True:
                         try:
                             # send file_name
-                            self.file_name = self.get_file_name()
-                            if self.file_name is not None:
-                                msg = f"GET {self.file_name}"
-                                print(f"Client: {msg}")
-                                self.send_message(client_socket, msg)
-                                # receive response (exist: file_size, not exist: NOT)
-                                response = self.recv_message(client_socket)
-                                if response != "NOT":
-                                    # receive file_size
-                                    self.file_size = int(response)
-                                    self.chunk_size = self.file_size // int(self.num_chunk)
-                                    # Initialize FileHandler for this file
-                                    self.file_handler = FileHandler(self.file_size, self.file_name, self.output_path, self.num_chunk)
-                                    # receive to download
-                                    server_msg = self.recv_message(client_socket)
-                                    print("\033[1;31;40m" + server_msg + "\033[0m")
-                                    # threading
-                                    threads = []
-
-                                    for chunk_id in range(self.num_chunk):
-                                        thread = threading.Thread(target=self.recv_chunk, args=(chunk_id,))
-                                        if thread is not None:
-                                            threads.append(thread)
-                                            thread.start()
-
-                                    # Use FileHandler's display_progress method
-                                    progress_thread = Thread(target=self.file_handler.display_progress, daemon=True)
-                                    progress_thread.start()
-
-                                    for thread in threads:
-                                        thread.join()
-
-                                    progress_thread.join()
-                                    # receive successfully file
-                                    server_msg = self.recv_message(client_socket)
-                                    print("\033[1;31;40m" + server_msg + "\033[0m")
-                                    # send cofirm msg
-                                    msg = f"{self.file_name} received successfully"
-                                    self.send_message(client_socket, msg)
-                                    # print
-                                    print(f"Client: {msg}")
-                                    # Use FileHandler's merge method
-                                    self.file_handler.merge()
-                                else:
-                                    server_msg = f"{self.file_name} does not exist!"
-                                    print("\033[1;31;40m" + "Server: " + server_msg + "\033[0m")
+                            file_name = self.get_file_name()
+                            if file_name is not None:
+                                self.scheduler.submit(file_name, self.get_file_size(file_name))
                         except KeyboardInterrupt:
+                            self.scheduler.close()
                             FIN = "EXIT"
                             self.send_message(client_socket, FIN)
                             break
@@ -209,14 +233,99 @@ class FileClient:
         except ConnectionResetError:
             print(f"Server {self.server_address} is not alive.")
 
+    def connect(self, client_socket : socket):
+        # propose the largest packet that crosses the path unfragmented
+        proposed, method = choose_packet_size(client_socket, self.server_address, PACKET_SIZE)
+        response = self.send_ping_message(client_socket, f"23120088 {proposed}")
+        self.log("\n\033[1;32;40m[NOTIFICATION] Sent PING_MSG to Server!\n\033[0m")
+        if response is not None and response[3:].isdigit():
+            self.packet_size = int(response[3:])
+        self.log(f"Packet size: {self.packet_size} bytes (proposed {proposed} from {method})")
+        # receive file_list
+        self.list_file = self.recv_message(client_socket)
+
+    def download(self, client_socket : socket, file_name):
+        # STAT over the control session first: a local copy the server has the same version of is kept
+        remote = None
+        if CONDITIONAL_GET:
+            unchanged, remote = check_local(self.hashes, file_name, lambda request: self.stat(client_socket, request))
+            if unchanged:
+                self.log(f"Client: {file_name} not modified, kept the local copy")
+                if self.meter:
+                    self.meter.unchanged = True
+                return True
+
+        self.file_name = file_name
+        self.file_handler = None
+        self.failed_chunks = set()
+        self.file_ready = threading.Event()
+        self.log(f"Client: FETCH {self.file_name}")
+        # every chunk socket asks for itself, the shared nonce groups them into one transfer
+        nonce = random.getrandbits(32)
+        threads = []
+
+        for chunk_id in range(self.num_chunk):
+            thread = threading.Thread(target=self.recv_chunk, args=(chunk_id, nonce))
+            threads.append(thread)
+            thread.start()
+
+        self.file_ready.wait()
+        if self.file_handler is None:
+            for thread in threads:
+                thread.join()
+        if self.file_handler is None:
+            server_msg = f"{self.file_name} does not exist!"
+            self.log("\033[1;31;40m" + "Server: " + server_msg + "\033[0m")
+            return False
+        self.log("\033[1;31;40m" + f"Server: Downloading {self.file_name}!" + "\033[0m")
+
+        # Use FileHandler's display_progress method
+        if self.show_progress:
+            progress_thread = Thread(target=self.file_handler.display_progress, daemon=True)
+            progress_thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if self.show_progress:
+            progress_thread.join()
+        # Use FileHandler's merge method
+        self.file_handler.merge()
+        failed = [i + 1 for i, done in enumerate(self.file_handler.done_chunk) if not done]
+        if failed:
+            self.log(f"Client: {self.file_name} failed, parts {failed} incomplete")
+            return False
+        # print
+        self.log(f"Client: {self.file_name} received successfully")
+        # stamped with the server's version: the next run's STAT needs no hashing
+        if remote is not None:
+            self.hashes.adopt(self.file_name, remote)
+        return True
+
+    def stat(self, client_socket : socket, request):
+        self.send_message(client_socket, request)
+        return self.recv_message(client_socket) or ""
+
+    def log(self, message):
+        if self.show_progress:
+            print(message)
+
     def send_ping_message(self, client_socket : socket, message):
+        sends = 0
         while True:
             try:
+                client_socket.settimeout(self.rtt.rto)
                 client_socket.sendto(message.encode(), self.server_address)
+                sent_at = time.perf_counter()
+                sends += 1
                 ack, _ = client_socket.recvfrom(PACKET_SIZE)
-                if ack.decode() == "OK":
-                    return
+                # "OK <packet_size>" for a PING, "OK" from older servers
+                if ack == b"OK" or ack.startswith(b"OK "):
+                    if sends == 1:
+                        self.rtt.sample(time.perf_counter() - sent_at)
+                    return ack.decode()
             except socket.timeout:
+                self.rtt.backoff()
                 continue
             except ConnectionResetError:
                 return
@@ -225,18 +334,58 @@ class FileClient:
             except KeyboardInterrupt:
                 return
 
+    def send_fetch_message(self, client_socket : socket, message):
+        # (file_size, transfer_id, packet_size) and the data that came with it, None if missing
+        early = []
+        sends = 0
+        for _ in range(self.MAX_TRIES):
+            try:
+                client_socket.settimeout(self.rtt.rto)
+                client_socket.sendto(message.encode(), self.server_address)
+                sent_at = time.perf_counter()
+                sends += 1
+                while True:
+                    reply, _ = client_socket.recvfrom(PACKET_SIZE)
+                    if reply == b"NOT":
+                        return None, []
+                    if reply.startswith(b"META "):
+                        if sends == 1:
+                            self.rtt.sample(time.perf_counter() - sent_at)
+                        file_size, transfer_id, packet_size = reply.split()[1:]
+                        return (int(file_size), int(transfer_id), int(packet_size)), early
+                    # window data overtaking a lost META
+                    early.append(reply)
+            except socket.timeout:
+                self.rtt.backoff()
+                continue
+            except ConnectionResetError:
+                return None, []
+            except ValueError:
+                continue
+        return None, []
+
     def send_message(self, client_socket : socket, message):
+        for piece in split_message(message.encode(), self.packet_size):
+            self.send_piece(client_socket, piece)
+
+    def send_piece(self, client_socket : socket, message):
         cnt = 1
-        message = message.encode()
+        sends = 0
         checksum = calculate_checksum(message).encode()
         packet = b"|".join([checksum, message])
         while True:
             try:
+                client_socket.settimeout(self.rtt.rto)
                 client_socket.sendto(packet, self.server_address)
+                sent_at = time.perf_counter()
+                sends += 1
                 ack, _ = client_socket.recvfrom(PACKET_SIZE)
                 if ack.decode() == "OK":
+                    if sends == 1:
+                        self.rtt.sample(time.perf_counter() - sent_at)
                     return
             except socket.timeout:
+                self.rtt.backoff()
                 # cnt = cnt + 1
                 # if cnt >= self.MAX_TRIES:
                 #     print("Can't send msg to server")
@@ -250,15 +399,24 @@ class FileClient:
                 return
 
     def recv_message(self, client_socket : socket):
+        # nothing to retransmit here, just poll for the server's next message
+        client_socket.settimeout(self.TIMEOUT)
+        pieces = []
         while True:
             try:
                 packet, _ = client_socket.recvfrom(PACKET_SIZE)
-                checksum, message = packet.split(b"|")
+                if packet.count(b"|") < 1:
+                    continue
+                checksum, message = packet.split(b"|", 1)
                 checksum = checksum.decode()
                 if calculate_checksum(message) == checksum:
                     response = "OK"
                     client_socket.sendto(response.encode(), self.server_address)
-                    return message.decode()
+                    # long messages arrive in pieces, all but the last flagged CONTINUE
+                    if message.startswith(CONTINUE):
+                        pieces.append(message[len(CONTINUE):])
+                        continue
+                    return (b"".join(pieces) + message).decode()
                 response = "NOK"
                 client_socket.sendto(response.encode(), self.server_address)
             except socket.timeout:
@@ -6,9 +6,93 @@ NUM_CHUNK = 4
 BUFFER_SIZE = 10 * 1024
 PACKET_SIZE = 1024 * 8
 
+# Worker threads serving UDP requests (GUI/logic server): control messages
+# (PING, STAT) and chunk transfers have their own pools, so transfers cannot starve PING
+UDP_WORKERS = 16
+UDP_TRANSFER_WORKERS = 16
+
+# Linux UDP GSO/GRO batching (falls back to per-packet I/O automatically)
+UDP_FAST_PATH = True
+
+# NAK (blast) transfer mode: initial paced send rate, packets per send and report interval
+BLAST_RATE = 64 * 1024 * 1024
+BLAST_BATCH = 16
+NAK_INTERVAL = 0.05
+
+# Packet pacing: token bucket burst and bounds of the loss-driven rate
+UDP_PACING = True
+PACING_BURST = 32 * 1024
+MIN_BLAST_RATE = 1024 * 1024
+MAX_BLAST_RATE = 256 * 1024 * 1024
+
+# CLI UDP FETCH: data packets sent along with the metadata reply, before any ACK
+FETCH_WINDOW = 8
+
+# Server block cache (all TCP and UDP read paths): block size and memory budget
+BLOCK_SIZE = 64 * 1024
+BLOCK_CACHE_SIZE = 64 * 1024 * 1024
+
+# Client output files: contiguous small writes are coalesced into aligned writes
+# of WRITE_BUFFER (0: write each piece as it comes); FSYNC_POLICY is "none",
+# "file" (once, when the file is complete) or a byte count (every N bytes written)
+WRITE_BUFFER = 1024 * 1024
+FSYNC_POLICY = "none"
+
+# Sender read-ahead: "kernel" (sequential access hint only), "hint" (plus
+# POSIX_FADV_WILLNEED windows of READAHEAD_BLOCKS) or "thread" (plus a thread
+# loading them; for storage the kernel does not read ahead on, costs CPU under
+# the GIL), and file size from which sent pages leave the page cache
+READAHEAD_MODE = "kernel"
+READAHEAD_BLOCKS = 16
+DROP_BEHIND_SIZE = 256 * 1024 * 1024
+
+# Sparse transfer: holes and all-zero blocks go as zero ranges (TCP "SPARSE"
+# requests, UDP NAK-mode zero packets) and are recreated as holes by the client
+SPARSE_TRANSFER = True
+
+# Conditional GET: clients first send a STAT with the size, mtime and MD5 of
+# their local copy and keep it if the server has the same version. Both sides
+# keep file digests in sidecar files under HASH_CACHE_DIR of their folder
+CONDITIONAL_GET = True
+HASH_CACHE_DIR = ".hash-cache"
+# UDP logic clients wait this long, once, for a STAT reply before downloading
+# anyway (a server without conditional GET, or one still hashing a large file)
+STAT_TIMEOUT = 1.0
+
+# Same-host fast path for the TCP logic layer: Unix socket directory (share it
+# between containers to use it across them) and descriptor passing
+LOCAL_TRANSPORT = True
+LOCAL_SOCKET_DIR = "/tmp"
+LOCAL_PASS_FDS = True
+
+# TLS on the TCP control and data sockets (off by default: needs a certificate).
+# Clients trust TLS_CA (None: the system CAs; for a self-signed server, its
+# certificate); a handshake not done within TLS_HANDSHAKE_TIMEOUT seconds fails
+TLS_ENABLED = False
+TLS_CERT = "certs/server.crt"
+TLS_KEY = "certs/server.key"
+TLS_CA = None
+TLS_HANDSHAKE_TIMEOUT = 5.0
+
+# Client download scheduler: files downloading at once (each on its own
+# connection), total receive rate in bytes/s (None: no limit) and queue order,
+# "fifo", "priority" or "shortest" (smaller files first within a priority)
+MAX_ACTIVE_DOWNLOADS = 3
+DOWNLOAD_RATE_LIMIT = None
+DOWNLOAD_ORDER = "priority"
+
+# Prefork server mode: how often workers report stats to the supervisor
+STATS_INTERVAL = 10
+
 # Timing Configuration
+# Input file polling, only where inotify is not available
 INPUT_SCAN_INTERVAL = 5
 TIMEOUT = 0.2
+SESSION_TIMEOUT = 300
+
+# Adaptive retransmission timeout bounds (TIMEOUT is the initial RTO)
+MIN_RTO = 0.005
+MAX_RTO = 3.0
 
 # Retry Configuration
 MAX_TRIES = 100
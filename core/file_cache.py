@@ -0,0 +1,417 @@
+"""
+File Cache - shared open-file table and block cache for server read paths
+Concurrent transfers of the same file share one descriptor (reference
+counted), and recently read blocks are kept in one process-wide cache under a
+byte budget, so hot files, repeated and retransmitted reads are served from
+memory whichever server (TCP or UDP) reads them. Senders read through a
+ReadAhead, which has the next blocks loaded in the background while they
+wait on the network
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from core.constants import BLOCK_SIZE, BLOCK_CACHE_SIZE, READAHEAD_BLOCKS, READAHEAD_MODE, DROP_BEHIND_SIZE
+
+# Unreferenced files kept open in case they are requested again soon
+MAX_IDLE_FILES = 32
+# Part of the cache budget for blocks hit more than once
+PROTECTED_SHARE = 0.8
+
+
+def advise(fd, offset, length, advice):
+    """posix_fadvise hint (advice: name such as "POSIX_FADV_WILLNEED"), ignored where unsupported"""
+    if fd is None or not hasattr(os, "posix_fadvise") or not hasattr(os, advice):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+    except OSError:
+        pass
+
+
+class OpenFile:
+    """One open descriptor shared by every transfer of a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        # transfers read front to back: larger kernel read-ahead
+        advise(self.fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+        st = os.fstat(self.fd)
+        self.size = st.st_size
+        # identifies this version of the file in the block cache
+        self.key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        self.refs = 0
+        # drop-behind held back while transfers shared the file: done once it is unreferenced
+        self.drop_deferred = False
+        self.lock = threading.Lock()
+
+    def pread(self, offset, size):
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, size, offset)
+        # no pread (Windows): seek + read must not interleave between threads
+        with self.lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class OpenFileTable:
+    """Reference-counted open files keyed by path"""
+
+    def __init__(self, max_idle=MAX_IDLE_FILES):
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.files = {}              # path -> OpenFile
+        self.idle = OrderedDict()    # path -> None, unreferenced files, oldest first
+
+    def acquire(self, path):
+        """Open (or share) path for one transfer; raises OSError if it cannot be opened"""
+        with self.lock:
+            handle = self.files.get(path)
+            if handle is not None and not self._is_current(handle):
+                # replaced or modified on disk since we opened it
+                self._drop(path)
+                handle = None
+            if handle is None:
+                handle = OpenFile(path)
+                self.files[path] = handle
+            handle.refs += 1
+            self.idle.pop(path, None)
+            return handle
+
+    def release(self, handle):
+        """End of a transfer; the file stays open a while in case it is requested again"""
+        with self.lock:
+            handle.refs -= 1
+            if handle.refs > 0:
+                return
+            if handle.drop_deferred:
+                advise(handle.fd, 0, handle.size, "POSIX_FADV_DONTNEED")
+                handle.drop_deferred = False
+            if self.files.get(handle.path) is not handle:
+                # superseded by a newer version of the file
+                handle.close()
+                return
+            self.idle[handle.path] = None
+            while len(self.idle) > self.max_idle:
+                path, _ = self.idle.popitem(last=False)
+                self._drop(path)
+
+    def close(self):
+        with self.lock:
+            for handle in self.files.values():
+                handle.close()
+            self.files.clear()
+            self.idle.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"open": len(self.files), "idle": len(self.idle)}
+
+    def _is_current(self, handle):
+        try:
+            st = os.stat(handle.path)
+        except OSError:
+            return False
+        return (handle.path, st.st_ino, st.st_mtime_ns, st.st_size) == handle.key
+
+    def _drop(self, path):
+        handle = self.files.pop(path)
+        self.idle.pop(path, None)
+        if handle.refs <= 0:
+            handle.close()
+
+
+class _Load:
+    """A block being read from disk; other readers of it wait instead of reading too"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.block = None
+
+
+class BlockCache:
+    """
+    BLOCK_SIZE blocks of open files under a memory budget in bytes. Eviction is
+    a segmented LRU: new blocks enter a probation segment and move to the
+    protected one on their second hit, so one client streaming a large file
+    through the cache does not push out blocks other clients keep reading.
+    Concurrent misses on the same block cause a single disk read
+    """
+
+    def __init__(self, budget=BLOCK_CACHE_SIZE, block_size=BLOCK_SIZE):
+        self.budget = budget
+        self.block_size = block_size
+        self.protected_budget = int(budget * PROTECTED_SHARE)
+        self.lock = threading.Lock()
+        self.probation = OrderedDict()  # (file key, block index) -> bytes, least recent first
+        self.protected = OrderedDict()
+        self.protected_size = 0
+        self.size = 0
+        self.loading = {}               # key -> _Load in progress
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0                 # misses that waited for another reader's disk read
+        self.evictions = 0
+        self.hit_bytes = 0              # bytes served from memory
+        self.disk_bytes = 0             # bytes read from disk
+
+    def read(self, handle, offset, size):
+        """size bytes of handle at offset (fewer at end of file)"""
+        return b"".join(self.blocks(handle, offset, size))
+
+    def blocks(self, handle, offset, size):
+        """The same bytes as read(), as zero-copy views of the cached blocks"""
+        size = max(0, min(size, handle.size - offset))
+        while size > 0:
+            index, start = divmod(offset, self.block_size)
+            block = self._block(handle, index)
+            piece = memoryview(block)[start:start + size]
+            if not piece:
+                # file shrank under us
+                return
+            yield piece
+            offset += len(piece)
+            size -= len(piece)
+
+    def _block(self, handle, index):
+        key = (handle.key, index)
+        with self.lock:
+            block = self._lookup(key)
+            if block is not None:
+                self.hits += 1
+                self.hit_bytes += len(block)
+                return block
+            load = self.loading.get(key)
+            if load is None:
+                load = self.loading[key] = _Load()
+                owner = True
+            else:
+                owner = False
+                self.joined += 1
+
+        if not owner:
+            load.done.wait()
+            if load.block is not None:
+                with self.lock:
+                    self.hits += 1
+                    self.hit_bytes += len(load.block)
+                return load.block
+            # the reader we waited for failed: try ourselves
+            return handle.pread(index * self.block_size, self.block_size)
+
+        try:
+            block = handle.pread(index * self.block_size, self.block_size)
+            load.block = block
+        finally:
+            with self.lock:
+                del self.loading[key]
+                if load.block is not None:
+                    self.misses += 1
+                    self.disk_bytes += len(load.block)
+                    self._insert(key, load.block)
+            load.done.set()
+        return block
+
+    def _lookup(self, key):
+        block = self.protected.get(key)
+        if block is not None:
+            self.protected.move_to_end(key)
+            return block
+        block = self.probation.pop(key, None)
+        if block is not None:
+            # second hit: promote, demoting the oldest protected blocks past its share
+            self.protected[key] = block
+            self.protected_size += len(block)
+            while self.protected_size > self.protected_budget and len(self.protected) > 1:
+                old_key, old = self.protected.popitem(last=False)
+                self.protected_size -= len(old)
+                self.probation[old_key] = old
+        return block
+
+    def _insert(self, key, block):
+        if len(block) > self.budget or key in self.probation or key in self.protected:
+            return
+        self.probation[key] = block
+        self.size += len(block)
+        while self.size > self.budget:
+            segment = self.probation if self.probation else self.protected
+            _, evicted = segment.popitem(last=False)
+            if segment is self.protected:
+                self.protected_size -= len(evicted)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "joined": self.joined,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "hit_bytes": self.hit_bytes,
+                "disk_bytes": self.disk_bytes,
+                "evictions": self.evictions,
+                "bytes": self.size,
+                "budget": self.budget,
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """The process-wide block cache every server read path goes through"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = BlockCache()
+        return _shared_cache
+
+
+class ReadAhead:
+    """
+    A sender's reader for one range of a file, keeping the next depth blocks
+    loading while the sender is busy on the network. mode:
+        "kernel": the kernel's own read-ahead (files are opened SEQUENTIAL)
+        "hint":   also POSIX_FADV_WILLNEED for the next blocks, half a window at a time
+        "thread": also a background thread loading them through the cache
+    Pages already sent of files of at least drop_behind bytes are dropped
+    from the page cache, so one multi-GB transfer does not evict everything
+    else; while other transfers hold the file too, that waits until the last
+    one releases it. Use as a context manager
+    """
+
+    def __init__(self, cache, handle, offset, size, depth=READAHEAD_BLOCKS, drop_behind=DROP_BEHIND_SIZE,
+                 mode=READAHEAD_MODE):
+        self.cache = cache
+        self.handle = handle
+        self.block_size = cache.block_size
+        self.offset = offset
+        self.end = max(offset, min(offset + size, handle.size))
+        self.depth = depth
+        self.first = offset // self.block_size
+        self.last = (self.end - 1) // self.block_size
+        self.position = self.first   # block the sender is at
+        self.ready = {}              # block index -> block loaded ahead of the sender
+        self.loaded = self.first     # next block the prefetcher loads
+        self.condition = threading.Condition()
+        self.closed = False
+        self.drop = handle.size >= drop_behind
+        self.dropped = self.first * self.block_size   # pages before this were dropped
+        self.hinted = self.first                      # blocks before this were hinted
+        self.hints = mode in ("hint", "thread") and depth > 0
+        self.thread = None
+        if self.hints and self.end > offset:
+            self._hint(self.first)
+        if mode == "thread" and depth > 0 and self.end > offset:
+            self.thread = threading.Thread(target=self._prefetch, daemon=True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        """The whole range in order, as zero-copy views of the blocks"""
+        offset = self.offset
+        while offset < self.end:
+            index, start = divmod(offset, self.block_size)
+            piece = memoryview(self._get(index))[start:start + self.end - offset]
+            if not piece:
+                # file shrank under us
+                return
+            yield piece
+            offset += len(piece)
+
+    def read(self, offset, size):
+        """size bytes at offset, in any order (retransmissions go back)"""
+        size = max(0, min(size, self.handle.size - offset))
+        if size == 0:
+            return b""
+        first, start = divmod(offset, self.block_size)
+        last = (offset + size - 1) // self.block_size
+        if first == last:
+            return self._get(first)[start:start + size]
+        data = b"".join(self._get(index) for index in range(first, last + 1))
+        return data[start:start + size]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.ready.clear()
+            self.condition.notify_all()
+        # the descriptor may be closed once we return: no read may still be running on it
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.drop:
+            self._drop_behind(self.end)
+
+    def _drop_behind(self, upto):
+        """Drop the pages from dropped up to upto, unless other transfers may be about to read them"""
+        if self.handle.refs > 1:
+            self.handle.drop_deferred = True
+            return
+        advise(self.handle.fd, self.dropped, upto - self.dropped, "POSIX_FADV_DONTNEED")
+        self.dropped = upto
+
+    def _get(self, index):
+        block = None
+        if self.thread is not None:
+            with self.condition:
+                if index > self.position:
+                    for behind in [i for i in self.ready if i < index]:
+                        del self.ready[behind]
+                    self.position = index
+                    # wake the prefetcher once half the window is free, not for every block
+                    if self.loaded <= index + self.depth // 2:
+                        self.condition.notify_all()
+                block = self.ready.get(index)
+        if self.hints and index + self.depth // 2 >= self.hinted:
+            self._hint(index)
+        if block is None:
+            # not loaded yet, or gone back: read now (joining the prefetcher's read if it is on it)
+            block = self.cache._block(self.handle, index)
+        if self.drop and index * self.block_size - self.dropped >= self.depth * self.block_size:
+            self._drop_behind(index * self.block_size)
+        return block
+
+    def _hint(self, index):
+        """Ask the kernel for the blocks up to depth past index, a half window at a time"""
+        start = max(index, self.hinted)
+        end = min(index + self.depth, self.last + 1)
+        if end > start:
+            advise(self.handle.fd, start * self.block_size, (end - start) * self.block_size, "POSIX_FADV_WILLNEED")
+            self.hinted = end
+
+    def _prefetch(self):
+        index = self.first
+        while True:
+            with self.condition:
+                while not self.closed and index <= self.last and index >= self.position + self.depth:
+                    self.condition.wait()
+                index = max(index, self.position)
+                if self.closed or index > self.last:
+                    return
+                self.loaded = index
+            try:
+                block = self.cache._block(self.handle, index)
+            except OSError:
+                # the sender reads it itself and sees the error
+                return
+            index += 1
+            with self.condition:
+                if not self.closed and index > self.position:
+                    self.ready[index - 1] = block
+                self.loaded = index
@@ -1,5 +1,8 @@
 import threading
 import sys
+import os
+
+from core.reassembly import OutputFile
 
 class FileHandler:
 
@@ -14,6 +17,8 @@ class FileHandler:
         self.chunks_data = [None] * num_chunk
         self.chunk_progress = [0.0] * num_chunk
         self.done_chunk = [False] * num_chunk
+        self.failed_chunk = [False] * num_chunk
+        self.output = None
 
         self.chunks = self.split_chunks()
 
@@ -42,18 +47,35 @@ class FileHandler:
         with self.lock:
             self.chunk_progress[chunk_id] = (received / total) * 100
 
+    # =========================
+    # OUTPUT FILE (UDP/TCP ghi thẳng vào file theo offset)
+    # =========================
+    def open_output(self):
+        """Preallocated output file that receivers write into at each packet's offset"""
+        self.output = OutputFile(os.path.join(self.output_path, self.file_name), self.file_size)
+        return self.output
+
     # =========================
     # MARK DONE
     # =========================
-    def finish_chunk(self, chunk_id, data):
+    def finish_chunk(self, chunk_id, data=None):
         self.done_chunk[chunk_id] = True
         self.chunks_data[chunk_id] = data
 
+    def fail_chunk(self, chunk_id):
+        # given up on: display_progress stops waiting for it, done_chunk stays False
+        self.failed_chunk[chunk_id] = True
+
     # =========================
     # MERGE FILE
     # =========================
     def merge(self):
-        output_file = self.output_path + "\\" + self.file_name
+        if self.output is not None:
+            # chunks were written in place
+            self.output.close()
+            return
+
+        output_file = os.path.join(self.output_path, self.file_name)
 
         with open(output_file, "wb") as f:
             for chunk in self.chunks_data:
@@ -65,7 +87,7 @@ class FileHandler:
     # =========================
     def display_progress(self):
 
-        while any(done is False for done in self.done_chunk):
+        while not all(done or failed for done, failed in zip(self.done_chunk, self.failed_chunk)):
 
             msg = ""
 
@@ -82,5 +104,6 @@ class FileHandler:
             sys.stdout.write(f"\033[{self.num_chunk}A\033[0G\033[J")
 
         print("\n".join(
-            [f"{self.file_name} part {i+1} downloaded successfully" for i in range(self.num_chunk)]
+            [f"{self.file_name} part {i+1} " + ("downloaded successfully" if self.done_chunk[i] else "failed")
+             for i in range(self.num_chunk)]
         ))
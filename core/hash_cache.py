@@ -0,0 +1,185 @@
+"""
+Hash Cache - MD5 of a folder's files, kept in sidecar files
+Each digest is written to HASH_CACHE_DIR/<file>.md5 with the size and mtime
+it was computed for, so a file is hashed once per version, across restarts.
+Servers answer STAT requests from it; clients use it for their local copies,
+which they stamp with the server's mtime so the next check needs no hashing
+"""
+
+import os
+import socket
+import stat
+import threading
+
+from core.constants import HASH_CACHE_DIR, STAT_TIMEOUT
+from utils.checksum import file_checksum
+
+
+class HashCache:
+    """(size, mtime_ns, md5) of the files of one folder"""
+
+    def __init__(self, folder_path, directory=HASH_CACHE_DIR):
+        self.folder_path = folder_path
+        self.directory = os.path.join(folder_path, directory)
+        self.entries = {}  # name -> (size, mtime_ns, md5) last hashed or read from its sidecar
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        # names come from the network: nothing outside the folder
+        if not name or name in (".", "..") or os.path.basename(name) != name:
+            raise FileNotFoundError(f"{name} is not in {self.folder_path}")
+        return os.path.join(self.folder_path, name)
+
+    def cached(self, name):
+        """(size, mtime_ns, md5) of name without hashing, md5 None if this version is not known; None if no such file"""
+        try:
+            st = os.stat(self.path(name))
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None:
+            entry = self._read_sidecar(name)
+            if entry is not None:
+                with self.lock:
+                    self.entries[name] = entry
+        md5 = entry[2] if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns) else None
+        return st.st_size, st.st_mtime_ns, md5
+
+    def stat(self, name):
+        """(size, mtime_ns, md5) of name, hashing it if this version is not known. Raises OSError"""
+        entry = self.cached(name)
+        if entry is None:
+            raise FileNotFoundError(f"{name} does not exist")
+        size, mtime_ns, md5 = entry
+        if md5 is None:
+            path = self.path(name)
+            md5 = file_checksum(path)
+            st = os.stat(path)
+            # written to while we read it: the digest belongs to no version, do not keep it
+            if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                self.store(name, size, mtime_ns, md5)
+        return size, mtime_ns, md5
+
+    def store(self, name, size, mtime_ns, md5):
+        """Remember md5 for this version of name, in memory and in its sidecar"""
+        with self.lock:
+            self.entries[name] = (size, mtime_ns, md5)
+        sidecar = self._sidecar(name)
+        temp = f"{sidecar}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, "w") as f:
+                f.write(f"{size} {mtime_ns} {md5}\n")
+            os.replace(temp, sidecar)
+        except OSError:
+            # read-only folder: the digest stays in memory only
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+    def adopt(self, name, remote):
+        """
+        The local copy of name holds the server's version remote = (size, mtime_ns, md5):
+        give it the server's mtime and remember the md5, False if it cannot be
+        """
+        size, mtime_ns, md5 = remote
+        try:
+            path = self.path(name)
+            st = os.stat(path)
+            if st.st_size != size:
+                return False
+            os.utime(path, ns=(st.st_atime_ns, mtime_ns))
+        except OSError:
+            return False
+        self.store(name, size, mtime_ns, md5)
+        return True
+
+    def _sidecar(self, name):
+        return os.path.join(self.directory, name + ".md5")
+
+    def _read_sidecar(self, name):
+        try:
+            with open(self._sidecar(name)) as f:
+                size, mtime_ns, md5 = f.read().split()
+            return int(size), int(mtime_ns), md5
+        except (OSError, ValueError):
+            return None
+
+
+# =========================
+# STAT EXCHANGE
+# =========================
+# "STAT <size> <mtime_ns> <md5> <file>" describes the client's copy ("-" for
+# what it does not know); the server answers "SAME|DIFF <size> <mtime_ns> <md5>"
+# with its own version, or "<file> does not exist!"
+def stat_request(name, local):
+    """STAT request for the local copy (size, mtime_ns, md5) of name, local None if there is none"""
+    fields = ("-" if value is None else str(value) for value in (local or (None, None, None)))
+    return f"STAT {' '.join(fields)} {name}"
+
+
+def stat_reply(hashes, request):
+    """Server side: reply to a STAT request from the HashCache of the served folder"""
+    try:
+        _, size, mtime_ns, md5, name = request.split(" ", 4)
+    except ValueError:
+        return "Bad STAT request"
+    try:
+        remote = hashes.stat(name)
+    except OSError:
+        return f"{name} does not exist!"
+    # a known md5 decides; otherwise the same size and mtime (a copy we stamped) do
+    same = size == str(remote[0]) and (md5 == remote[2] if md5 != "-" else mtime_ns == str(remote[1]))
+    return f"{'SAME' if same else 'DIFF'} {remote[0]} {remote[1]} {remote[2]}"
+
+
+def parse_stat_reply(reply):
+    """(verdict, (size, mtime_ns, md5)) of a STAT reply, (None, None) if the server has no such file"""
+    fields = reply.split()
+    if len(fields) != 4 or fields[0] not in ("SAME", "DIFF") or not (fields[1].isdigit() and fields[2].isdigit()):
+        return None, None
+    return fields[0], (int(fields[1]), int(fields[2]), fields[3])
+
+
+def stat_datagram(server_address, request, timeout=STAT_TIMEOUT):
+    """
+    STAT over UDP: one datagram and its reply. Not resent: if no reply comes
+    within timeout this returns "" and the client downloads as usual
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(request.encode(), server_address)
+        try:
+            data, _ = sock.recvfrom(64 * 1024)
+        except OSError:
+            # timed out, or refused
+            return ""
+    return data.decode(errors="ignore")
+
+
+def check_local(hashes, name, exchange):
+    """
+    Conditional GET, client side: is the local copy of name the server's version?
+    exchange(request) sends the STAT request and returns the server's reply
+
+    Returns:
+        (True if the local copy can be kept, server's (size, mtime_ns, md5) or None)
+    """
+    local = hashes.cached(name)
+    verdict, remote = parse_stat_reply(exchange(stat_request(name, local)))
+    if remote is None:
+        return False, None
+    if verdict == "DIFF" and local is not None and local[2] is None and local[0] == remote[0]:
+        # same size but never hashed here, and another mtime: hash it once to find out
+        try:
+            verdict = "SAME" if hashes.stat(name)[2] == remote[2] else "DIFF"
+        except OSError:
+            pass
+    if verdict != "SAME":
+        return False, remote
+    hashes.adopt(name, remote)
+    return True, remote
@@ -0,0 +1,226 @@
+"""
+Hybrid Transfer - TCP control channel plus UDP bulk data
+The TCP control socket negotiates the transfer and carries the client's
+missing-range reports, while the data itself is streamed over UDP in the
+NAK-mode packet format through the pacer, so a lost packet costs one repair
+instead of stalling a TCP stream
+"""
+
+import select
+import socket
+import time
+from collections import deque
+from itertools import chain
+
+from core.udp_io import BatchIO
+from core.udp_async import create_packet
+from core.mtu import choose_packet_size, probe_reply
+from core.protocol import encode_ranges, decode_ranges, PACKET_OVERHEAD
+from core.reassembly import ChunkReassembler
+from core.pacing import Pacer
+from core.constants import PACKET_SIZE, UDP_PACING, BLAST_BATCH, NAK_INTERVAL, TIMEOUT, MAX_TRIES
+from utils.checksum import calculate_checksum
+
+# Longest missing-range list in one NAK line on the control socket
+MAX_REPORT = 64 * 1024
+
+
+class ControlLines:
+    """Newline-delimited reports on the TCP control socket"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def send(self, line):
+        self.sock.sendall(line.encode() + b"\n")
+
+    def read(self):
+        """Complete lines received so far (call when the socket is readable)"""
+        data = self.sock.recv(MAX_REPORT)
+        if not data:
+            raise ConnectionError("control connection closed")
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return [line.decode(errors="ignore") for line in lines]
+
+
+class HybridSender:
+    """Server side: one UDP socket per transfer, NAK repairs read from the control socket"""
+
+    def __init__(self, control, host, on_log=None):
+        self.control = ControlLines(control)
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.pacing = UDP_PACING
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.io = BatchIO(self.sock)
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def close(self):
+        try:
+            self.sock.close()
+        except:
+            pass
+
+    def wait_hello(self, transfer_id):
+        """
+        Wait for "HELLO <transfer_id> <packet_size>" from the client's data socket,
+        echoing its path MTU probes meanwhile
+
+        Returns:
+            (client address, packet size), or None if the client never showed up
+        """
+        hello = f"HELLO {transfer_id} ".encode()
+        deadline = time.monotonic() + MAX_TRIES * TIMEOUT
+        while time.monotonic() < deadline:
+            readable, _, _ = select.select([self.sock], [], [], TIMEOUT)
+            if not readable:
+                continue
+            data, address = self.sock.recvfrom(PACKET_SIZE)
+            reply = probe_reply(data)
+            if reply is not None:
+                self.sock.sendto(reply, address)
+            elif data.startswith(hello) and data[len(hello):].isdigit():
+                return address, min(int(data[len(hello):]), PACKET_SIZE)
+        return None
+
+    def send(self, handle_read, file_size, client_address, packet_size):
+        """
+        Stream the file paced, then resend what the client reports missing until DONE
+
+        Args:
+            handle_read: read(offset, size) -> bytes of the file
+
+        Returns:
+            stats dict: packets, resent, rate
+        """
+        data_size = packet_size - PACKET_OVERHEAD
+        count = -(-file_size // data_size)
+        pending = deque(range(count))   # sequence numbers still to (re)send
+        queued = set(pending)
+        resent = 0
+        delivered = 0                   # packets the client reported as received
+        reported = False
+        report_at = time.perf_counter()
+        last_report = time.monotonic()
+        pacer = Pacer() if self.pacing else Pacer(rate=None)
+        batch_size = pacer.batch_size(packet_size, BLAST_BATCH)
+
+        while True:
+            batch = []
+            while pending and len(batch) < batch_size:
+                sequence = pending.popleft()
+                queued.discard(sequence)
+                offset = sequence * data_size
+                batch.append(create_packet(handle_read(offset, min(data_size, file_size - offset)), sequence, 0))
+            if batch:
+                pacer.wait(sum(len(p) for p in batch))
+                self.io.send_batch(batch, client_address)
+
+            # Reports: polled while streaming, waited for once everything is out
+            readable, _, _ = select.select([self.control.sock, self.sock], [], [], 0 if pending else NAK_INTERVAL)
+            if not readable:
+                if not pending and time.monotonic() - last_report > MAX_TRIES * NAK_INTERVAL:
+                    raise TimeoutError("no report from the client")
+                continue
+
+            missing = []                # ranges of sequence numbers to resend
+            if self.sock in readable:
+                data, _ = self.sock.recvfrom(PACKET_SIZE)
+                if data.startswith(b"HELLO ") and not reported:
+                    # Still saying hello: nothing has reached the client yet
+                    missing.append(range(count))
+            if self.control.sock in readable:
+                last_report = time.monotonic()
+                for line in self.control.read():
+                    fields = line.split(" ")
+                    if fields[0] == "DONE":
+                        return {"packets": count, "resent": resent, "rate": str(pacer)}
+                    if fields[0] == "NAK" and len(fields) >= 2 and fields[1].isdigit():
+                        reported = True
+                        # Received count gives a delivery rate sample for the pacer
+                        now = time.perf_counter()
+                        pacer.on_delivery((int(fields[1]) - delivered) * packet_size, now - report_at)
+                        delivered, report_at = int(fields[1]), now
+                        if len(fields) == 3:
+                            missing.append(decode_ranges(fields[2], count))
+
+            for sequence in chain.from_iterable(missing):
+                if sequence not in queued:
+                    pending.append(sequence)
+                    queued.add(sequence)
+                    resent += 1
+
+
+class HybridReceiver:
+    """Client side: UDP data socket, gaps reported over the control socket"""
+
+    def __init__(self, control, server_address, transfer_id, rcvbuf=4 * 1024 * 1024, on_progress=None):
+        self.control = ControlLines(control)
+        self.server_address = server_address
+        self.transfer_id = transfer_id
+        self.on_progress = on_progress or (lambda p: None)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.io = BatchIO(self.sock)
+        # Largest packet that crosses the path unfragmented, probing the sender's data socket
+        self.packet_size, _ = choose_packet_size(self.sock, server_address, PACKET_SIZE)
+        self.sock.settimeout(NAK_INTERVAL)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except:
+            pass
+
+    def receive(self, output, file_size):
+        """Receive the whole file into output, return the reassembler"""
+        chunk = ChunkReassembler(output, 0, file_size, self.packet_size - PACKET_OVERHEAD)
+        hello = f"HELLO {self.transfer_id} {self.packet_size}".encode()
+        self.sock.sendto(hello, self.server_address)
+        highest = -1
+        last_packet = last_report = time.monotonic()
+
+        while not chunk.complete():
+            try:
+                datagrams, _ = self.io.recv_batch(PACKET_SIZE)
+            except socket.timeout:
+                datagrams = []
+            now = time.monotonic()
+
+            for packet in datagrams:
+                if packet.count(b"|") < 3:
+                    continue
+                seq_str, checksum, _, data = packet.split(b"|", maxsplit=3)
+                if not seq_str.isdigit() or calculate_checksum(data) != checksum.decode(errors="ignore"):
+                    continue
+                if not chunk.add(int(seq_str), data):
+                    continue
+                highest = max(highest, int(seq_str))
+                last_packet = now
+                self.on_progress(chunk.received_bytes / file_size * 100)
+
+            if chunk.complete():
+                break
+            if now - last_packet > MAX_TRIES * NAK_INTERVAL:
+                raise TimeoutError("server stopped sending")
+
+            if highest < 0:
+                # Nothing yet, the hello may have been lost
+                if now - last_report >= TIMEOUT:
+                    self.sock.sendto(hello, self.server_address)
+                    last_report = now
+            elif now - last_report >= NAK_INTERVAL:
+                # While packets keep coming only the gaps behind the newest one are losses
+                limit = highest + 1 if now - last_packet < NAK_INTERVAL else chunk.count
+                ranges = encode_ranges(chunk.missing_ranges(limit), MAX_REPORT)
+                self.control.send(f"NAK {chunk.received.count} {ranges}" if ranges
+                                  else f"NAK {chunk.received.count}")
+                last_report = now
+
+        self.control.send("DONE")
+        return chunk
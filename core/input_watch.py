@@ -0,0 +1,173 @@
+"""
+Input Watch - follow the client's input file as lines are appended
+On Linux the file's directory is watched with inotify (through ctypes), so a
+request starts as soon as its line is written; elsewhere the file is polled
+every INPUT_SCAN_INTERVAL. Like tail -F, a truncated file is read again from
+its start and a replaced (rotated) one is reopened once the old one is drained
+"""
+
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+
+from core.constants import INPUT_SCAN_INTERVAL
+
+# inotify(7) flags and events
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT = struct.Struct("iIII")   # wd, mask, cookie, name length
+# A last line without its newline is taken once the file is quiet this long
+SETTLE_TIME = 0.5
+
+
+def _libc_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _libc_inotify()
+
+
+class InputWatcher:
+    """New names appended to an input file, one per line. Use as a context manager"""
+
+    def __init__(self, path, interval=INPUT_SCAN_INTERVAL):
+        self.path = path
+        self.name = os.path.basename(path).encode()
+        self.interval = interval
+        self.file = None
+        self.identity = None    # (st_dev, st_ino) of the open file
+        self.partial = b""      # last line, its newline not written yet
+        self.changed_at = 0.0   # when data last came in
+        self.closed = False
+        self.inotify_fd = self._watch(os.path.dirname(os.path.abspath(path)))
+
+    @property
+    def event_driven(self):
+        return self.inotify_fd is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _watch(self, directory):
+        """inotify descriptor watching directory, None where there is no inotify"""
+        if _libc is None:
+            return None
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        # the directory, not the file: a rotated file is a new inode under the same name
+        if _libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def close(self):
+        self.closed = True
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def follow(self):
+        """Names as their lines are appended, until closed"""
+        while not self.closed:
+            names = self.read_new()
+            yield from names
+            if not names:
+                self.wait(SETTLE_TIME if self.partial else self.interval)
+
+    def read_new(self):
+        """
+        Names in the complete lines appended since the last call. A last line
+        without its newline is kept back while it may still be being written
+        """
+        data = self._read()
+        now = time.monotonic()
+        if data:
+            self.partial += data
+            self.changed_at = now
+        elif self.partial and now - self.changed_at >= SETTLE_TIME:
+            # nothing more came: the file just does not end with a newline
+            self.partial += b"\n"
+        *lines, self.partial = self.partial.split(b"\n")
+        return [name for name in (line.decode(errors="ignore").strip() for line in lines) if name]
+
+    def wait(self, timeout):
+        """Sleep until the input file may have changed, at most timeout seconds"""
+        fd = self.inotify_fd
+        if fd is None:
+            time.sleep(timeout)
+            return
+        deadline = time.monotonic() + timeout
+        while not self.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                readable, _, _ = select.select([fd], [], [], remaining)
+                if not readable:
+                    return
+                events = os.read(fd, 64 * 1024)
+            except (OSError, ValueError):
+                # nothing to read after all, or closed under us
+                return
+            if self.name in self._event_names(events):
+                return
+
+    def _event_names(self, events):
+        names = set()
+        offset = 0
+        while offset + EVENT.size <= len(events):
+            _, _, _, length = EVENT.unpack_from(events, offset)
+            offset += EVENT.size
+            names.add(events[offset:offset + length].rstrip(b"\0"))
+            offset += length
+        return names
+
+    def _read(self):
+        """Bytes appended since the last read, following truncation and rotation"""
+        data = b""
+        if self.file is not None:
+            if os.fstat(self.file.fileno()).st_size < self.file.tell():
+                # truncated: what is there now is new
+                self.file.seek(0)
+                self.partial = b""
+            data = self.file.read()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # removed, maybe about to be recreated: keep reading the old one meanwhile
+            return data
+        if (st.st_dev, st.st_ino) != self.identity:
+            # first open, or rotated: the old file is drained, start the new one from its beginning
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, "rb")
+            self.identity = (st.st_dev, st.st_ino)
+            if (self.partial or data) and not (self.partial + data).endswith(b"\n"):
+                data += b"\n"
+            data += self.file.read()
+        return data
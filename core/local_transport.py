@@ -0,0 +1,140 @@
+"""
+Local Transport - same-host fast path over a Unix domain socket
+One AF_UNIX connection replaces the 1+4 TCP sockets. Files go over it with
+sendfile, or the open descriptor itself is passed with SCM_RIGHTS and the
+client copies it in the kernel without the data crossing a socket at all
+"""
+
+import errno
+import os
+import socket
+import struct
+
+from core.constants import LOCAL_SOCKET_DIR
+
+# Length prefix of every control message
+HEADER = struct.Struct("!I")
+# Bytes copied per call when the client copies from a passed descriptor
+COPY_SIZE = 8 * 1024 * 1024
+# copy_file_range errors meaning "not between these two files": copy through user space instead
+NO_KERNEL_COPY = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+
+# Unix sockets, and descriptor passing on top of them, are POSIX only
+HAS_UNIX = hasattr(socket, "AF_UNIX")
+HAS_FD_PASSING = HAS_UNIX and hasattr(socket, "send_fds")
+
+
+def socket_path(port, directory=LOCAL_SOCKET_DIR):
+    """Unix socket the server listening on TCP port also listens on"""
+    return os.path.join(directory, f"file-transfer-{port}.sock")
+
+
+def is_local_host(host):
+    """True if host is one of this machine's addresses"""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    if any(address.startswith("127.") or address == "::1" for address in addresses):
+        return True
+    try:
+        own = set(socket.gethostbyname_ex(socket.gethostname())[2])
+    except OSError:
+        return False
+    return bool(addresses & own)
+
+
+def listen(path):
+    """Bind a Unix listening socket at path, replacing a stale socket file"""
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    return sock
+
+
+# =========================
+# FRAMING
+# =========================
+def send_message(sock, message, fds=()):
+    """Length-prefixed message, optionally carrying descriptors"""
+    data = HEADER.pack(len(message)) + message.encode()
+    if fds:
+        socket.send_fds(sock, [data], list(fds))
+    else:
+        sock.sendall(data)
+
+
+def recv_message(sock):
+    """(message, descriptors); message is None once the peer has closed"""
+    fds = []
+    header = _recv_exact(sock, HEADER.size, fds)
+    if header is None:
+        return None, fds
+    body = _recv_exact(sock, HEADER.unpack(header)[0], fds)
+    if body is None:
+        return None, fds
+    return body.decode(), fds
+
+
+def _recv_exact(sock, size, fds):
+    data = b""
+    while len(data) < size:
+        if HAS_FD_PASSING:
+            chunk, received, _, _ = socket.recv_fds(sock, size - len(data), 1)
+            fds.extend(received)
+        else:
+            chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+# =========================
+# FILE DATA
+# =========================
+def copy_fd(src_fd, dst_fd, size, on_progress=None):
+    """
+    Copy size bytes between descriptors in the kernel where possible. Across
+    filesystems (a container's folder on another mount) copy_file_range fails
+    on its first call, and the rest goes through pread/pwrite
+    """
+    copied = 0
+    kernel_copy = hasattr(os, "copy_file_range")
+    while copied < size:
+        count = min(COPY_SIZE, size - copied)
+        n = None
+        if kernel_copy:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, count, copied, copied)
+            except OSError as e:
+                if copied or e.errno not in NO_KERNEL_COPY:
+                    raise
+                kernel_copy = False
+        if n is None:
+            data = os.pread(src_fd, count, copied)
+            n = os.pwrite(dst_fd, data, copied) if data else 0
+        if n == 0:
+            break
+        copied += n
+        if on_progress:
+            on_progress(copied / size * 100)
+    return copied
+
+
+def recv_file(sock, dst_fd, size, on_progress=None):
+    """Read size streamed bytes from sock into dst_fd"""
+    buffer = bytearray(min(COPY_SIZE, max(size, 1)))
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[:min(len(buffer), size - received)])
+        if n == 0:
+            break
+        os.write(dst_fd, view[:n])
+        received += n
+        if on_progress:
+            on_progress(received / size * 100)
+    return received
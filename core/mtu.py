@@ -0,0 +1,95 @@
+"""
+Path MTU Discovery - pick a UDP packet size that avoids IP fragmentation
+Uses the kernel's path MTU (IP_MTU_DISCOVER/IP_MTU) on Linux and falls back
+to echoed probe datagrams of decreasing size everywhere else
+"""
+
+import socket
+import sys
+
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+# IPv4 header + UDP header
+IP_UDP_HEADERS = 28
+# 576-byte minimum IPv4 reassembly size minus headers, always safe
+MIN_PACKET_SIZE = 548
+# Probe candidates: jumbo, Ethernet, PPPoE, common tunnels, IPv6 minimum
+PROBE_SIZES = (8192, 1472, 1452, 1372, 1232, MIN_PACKET_SIZE)
+PROBE_MSG = "PROBE"
+
+
+def set_dont_fragment(sock):
+    """Ask the kernel to never fragment this socket's datagrams (best effort)"""
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def path_mtu(address):
+    """
+    Kernel path MTU toward address (Linux only).
+
+    Returns:
+        MTU in bytes, or None when the platform cannot report it
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            set_dont_fragment(sock)
+            sock.connect(address)
+            return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+
+
+def probe_reply(data):
+    """Server side: the echo for a probe datagram, or None if data is not a probe"""
+    if not data.startswith(PROBE_MSG.encode() + b" "):
+        return None
+    size = data.split(b" ", 2)[1]
+    return PROBE_MSG.encode() + b" " + size if size.isdigit() else None
+
+
+def probe_packet_size(sock, address, limit, timeout=0.2, tries=2):
+    """
+    Largest candidate size whose probe the peer echoes back.
+    Oversized probes are either refused locally (EMSGSIZE) or dropped on the path.
+    """
+    set_dont_fragment(sock)
+    old_timeout = sock.gettimeout()
+    sock.settimeout(timeout)
+    try:
+        for size in [s for s in PROBE_SIZES if s <= limit] or [MIN_PACKET_SIZE]:
+            probe = f"{PROBE_MSG} {size} ".encode().ljust(size, b".")
+            expected = f"{PROBE_MSG} {size}".encode()
+            for _ in range(tries):
+                try:
+                    sock.sendto(probe, address)
+                    reply, _ = sock.recvfrom(limit)
+                    if reply == expected:
+                        return size
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+        return MIN_PACKET_SIZE
+    finally:
+        sock.settimeout(old_timeout)
+
+
+def choose_packet_size(sock, address, limit):
+    """
+    Packet size for talking to address, capped at limit.
+
+    Returns:
+        (packet_size, method) where method is "IP_MTU" or "probe"
+    """
+    mtu = path_mtu(address)
+    if mtu:
+        return max(MIN_PACKET_SIZE, min(limit, mtu - IP_UDP_HEADERS)), "IP_MTU"
+    return min(limit, probe_packet_size(sock, address, limit)), "probe"
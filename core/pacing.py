@@ -0,0 +1,98 @@
+"""
+Packet Pacing - token bucket that spreads UDP sends over time
+Sleeps for the coarse part of a wait and spins the last stretch, so pacing
+holds at rates where time.sleep granularity alone would cause bursts
+"""
+
+import time
+from collections import deque
+
+from core.constants import BLAST_RATE, MIN_BLAST_RATE, MAX_BLAST_RATE, PACING_BURST
+
+# Waits shorter than this are spun instead of slept
+SPIN_THRESHOLD = 0.0002
+# Loss share of a multicast repair round above which the rate is cut
+LOSS_THRESHOLD = 0.01
+
+
+class Pacer:
+    """
+    Token bucket pacing at a target rate that follows receiver feedback
+
+    Unicast senders feed it delivery rate samples (bytes the receiver got per
+    interval): the rate is the recent maximum times a gain that cycles above
+    1 to probe for more bandwidth and below 1 to drain any queue it built.
+    The multicast sender only sees merged loss per repair round and uses
+    on_loss, a plain AIMD. rate=None disables pacing.
+    """
+
+    GAIN_CYCLE = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0)
+    RATE_WINDOW = 10
+    DECREASE = 0.7
+    INCREASE = 1.1
+
+    def __init__(self, rate=BLAST_RATE, burst=PACING_BURST, min_rate=MIN_BLAST_RATE, max_rate=MAX_BLAST_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = burst
+        self.stamp = time.perf_counter()
+        self.samples = deque(maxlen=self.RATE_WINDOW)
+        self.phase = 0
+
+    @property
+    def enabled(self):
+        return self.rate is not None
+
+    def batch_size(self, packet_size, max_packets):
+        """Packets per send call so that one call stays within the burst"""
+        if not self.enabled:
+            return max_packets
+        return max(1, min(max_packets, self.burst // max(packet_size, 1)))
+
+    def wait(self, nbytes):
+        """Block until nbytes may be sent, then take them from the bucket"""
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= nbytes
+        if self.tokens >= 0:
+            return
+
+        # In debt: wait until the bucket is back at zero
+        deadline = now - self.tokens / self.rate
+        if deadline - now > SPIN_THRESHOLD:
+            time.sleep(deadline - now - SPIN_THRESHOLD)
+        while time.perf_counter() < deadline:
+            pass
+        self.tokens = 0
+        self.stamp = deadline
+
+    def on_delivery(self, delivered, interval):
+        """Delivery rate sample: delivered bytes reached the receiver within interval seconds"""
+        if not self.enabled or interval <= 0:
+            return
+        self.samples.append(delivered / interval)
+        self.phase = (self.phase + 1) % len(self.GAIN_CYCLE)
+        self._set_rate(max(self.samples) * self.GAIN_CYCLE[self.phase])
+
+    def on_loss(self, sent, lost):
+        """Merged loss of one round (packets sent, packets reported lost)"""
+        if not self.enabled or sent <= 0:
+            return
+        if lost / sent > LOSS_THRESHOLD:
+            self._set_rate(self.rate * self.DECREASE)
+        else:
+            self._set_rate(self.rate * self.INCREASE)
+
+    def _set_rate(self, rate):
+        self.rate = max(self.min_rate, min(self.max_rate, rate))
+
+    def __str__(self):
+        if not self.enabled:
+            return "unpaced"
+        return f"{self.rate / 1e6:.1f} MB/s"
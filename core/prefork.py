@@ -0,0 +1,155 @@
+"""
+Prefork - N server worker processes sharing one port with SO_REUSEPORT
+Each worker binds its own socket to the port and the kernel spreads
+connections (TCP) or flows (UDP) over them, so every worker has its own GIL.
+A supervisor restarts workers that die and merges the stats they report
+"""
+
+import ctypes
+import multiprocessing
+import queue
+import socket
+import struct
+import time
+
+from core.constants import STATS_INTERVAL
+
+# Linux setsockopt to steer a reuseport group with a classic BPF program
+SO_ATTACH_REUSEPORT_CBPF = 51
+# Classic BPF: negative load offsets relative to the IP header
+SKF_NET_OFF = -0x100000
+# A crashed worker is restarted at most this often per slot
+RESTART_DELAY = 1.0
+
+
+def share_port(sock):
+    """Let sock share its port with the other workers' sockets (call before bind)"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("SO_REUSEPORT is not supported on this platform")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def steer_by_source(sock, workers):
+    """
+    Pick the group's socket by IPv4 source address modulo workers (Linux, best
+    effort), so protocols that spread one client over several connections keep
+    them on one worker. Call after listen: a bound TCP socket that is not yet
+    listening cannot carry the program without blocking later binds
+    """
+    program = [
+        (0x20, 0, 0, (SKF_NET_OFF + 12) & 0xFFFFFFFF),  # A = source address
+        (0x94, 0, 0, workers),                          # A %= workers
+        (0x16, 0, 0, 0),                                # return A
+    ]
+    filters = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *insn) for insn in program))
+    fprog = struct.pack("HP", len(program), ctypes.addressof(filters))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+        return True
+    except OSError:
+        # no reuseport BPF: plain hashing, clients may end up split over workers
+        return False
+
+
+def merge_stats(reports):
+    """Sum numeric stats of all workers, key by key"""
+    total = {}
+    for stats in reports:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+class Supervisor:
+    """Start N workers, restart the ones that exit, aggregate what they report"""
+
+    def __init__(self, target, workers, args=(), on_log=None, stats_interval=STATS_INTERVAL):
+        """
+        Args:
+            target: target(worker_id, stats_queue, *args), runs one worker process
+                    and puts (worker_id, stats dict) on stats_queue now and then
+        """
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.stats_interval = stats_interval
+        self.stats_queue = multiprocessing.Queue()
+        self.processes = {}      # worker id -> Process
+        self.started_at = {}     # worker id -> last start time
+        self.stats = {}          # worker id -> latest stats
+        self.restarts = 0
+        self.running = False
+
+    def log(self, message):
+        """Send log message to callback"""
+        self.on_log(message)
+
+    def start(self):
+        self.running = True
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+    def _spawn(self, worker_id):
+        process = multiprocessing.Process(target=self.target,
+                                          args=(worker_id, self.stats_queue) + tuple(self.args),
+                                          daemon=True)
+        process.start()
+        self.processes[worker_id] = process
+        self.started_at[worker_id] = time.monotonic()
+
+    def check(self):
+        """Restart dead workers and collect pending stats reports"""
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive() or not self.running:
+                continue
+            if time.monotonic() - self.started_at[worker_id] < RESTART_DELAY:
+                continue
+            self.log(f"[SUPERVISOR] Worker {worker_id} (pid {process.pid}) exited "
+                     f"with code {process.exitcode}, restarting")
+            self.stats.pop(worker_id, None)
+            self.restarts += 1
+            self._spawn(worker_id)
+
+        while True:
+            try:
+                worker_id, stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.stats[worker_id] = stats
+
+    def get_stats(self):
+        """Stats summed over the workers, plus the supervisor's own counters"""
+        total = merge_stats(self.stats.values())
+        total["workers"] = sum(p.is_alive() for p in self.processes.values())
+        total["restarts"] = self.restarts
+        if total.get("cache_hits", 0) + total.get("cache_misses", 0):
+            # ratios do not sum: derive the overall one from the summed counters
+            total["cache_hit_ratio"] = round(total["cache_hits"] / (total["cache_hits"] + total["cache_misses"]), 3)
+        return total
+
+    def run(self):
+        """Supervise until interrupted, logging the merged stats every stats_interval"""
+        if not self.running:
+            self.start()
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while self.running:
+                time.sleep(0.2)
+                self.check()
+                if time.monotonic() >= next_report:
+                    stats = self.get_stats()
+                    self.log("[SUPERVISOR] " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items())))
+                    next_report += self.stats_interval
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self):
+        self.running = False
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=2.0)
@@ -0,0 +1,82 @@
+"""
+Packet Layer - framing helpers shared by UDP senders and receivers
+"""
+
+
+def segment_runs(packets, max_segments, max_bytes):
+    """
+    Group consecutive packets into runs that the kernel can cut at a fixed
+    segment size (UDP GSO): every packet of a run has the run's segment size
+    except the last one, which may be shorter.
+
+    Yields:
+        (segment_size, [packet, ...]) tuples, in the original packet order
+    """
+    run = []
+    size = 0
+    total = 0
+
+    for packet in packets:
+        if run and (len(run[-1]) != size or len(packet) > size
+                    or len(run) >= max_segments or total + len(packet) > max_bytes):
+            yield size, run
+            run = []
+
+        if not run:
+            size = len(packet)
+            total = 0
+
+        run.append(packet)
+        total += len(packet)
+
+    if run:
+        yield size, run
+
+
+def split_segments(buffer, segment_size):
+    """Split a coalesced (UDP GRO) receive buffer back into datagrams"""
+    if segment_size <= 0 or len(buffer) <= segment_size:
+        return [buffer]
+    return [buffer[i:i + segment_size] for i in range(0, len(buffer), segment_size)]
+
+
+# seq|md5|chunk| header room in a data packet: data size = packet size - PACKET_OVERHEAD
+PACKET_OVERHEAD = 100
+
+# Leading byte of a control message piece that has more pieces after it
+CONTINUE = b"\x1f"
+# md5 hex digest + "|" in front of every control message piece
+MESSAGE_OVERHEAD = 33
+
+
+def split_message(message, packet_size):
+    """Cut an encoded control message into pieces that fit in packet_size"""
+    room = packet_size - MESSAGE_OVERHEAD - len(CONTINUE)
+    if len(message) + MESSAGE_OVERHEAD <= packet_size:
+        return [message]
+    pieces = [CONTINUE + message[i:i + room] for i in range(0, len(message), room)]
+    pieces[-1] = pieces[-1][len(CONTINUE):]
+    return pieces
+
+
+def encode_ranges(ranges, room):
+    """'a-b,c,...' for as many ranges as fit in room bytes"""
+    parts = []
+    size = 0
+    for first, last in ranges:
+        part = str(first) if first == last else f"{first}-{last}"
+        if size + len(part) + 1 > room:
+            break
+        parts.append(part)
+        size += len(part) + 1
+    return ",".join(parts)
+
+
+def decode_ranges(text, count):
+    """Yield every sequence number below count listed by encode_ranges, skipping garbage"""
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            continue
+        # ranges come from the network: never expand past the packets there are
+        yield from range(int(first), min(int(last or first) + 1, count))
@@ -0,0 +1,272 @@
+"""
+Reassembly - out-of-order UDP receive straight into the output file
+Every valid packet is written at its own offset with a positional write and
+marked in a compact bit array, so arrival order does not matter and memory
+stays at one bit per packet whatever the file size. The output file is
+allocated up front and small writes are coalesced into large aligned ones
+"""
+
+import ctypes
+import os
+import threading
+
+from core.constants import WRITE_BUFFER, FSYNC_POLICY
+
+# Runs of coalesced writes pending at once; the oldest is written out past this
+MAX_RUNS = 64
+# fallocate(2) mode bits for punching holes
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+
+def _libc_fallocate():
+    # fallocate(2) fails on filesystems without it, where glibc's
+    # posix_fallocate would instead write every block to emulate it
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (OSError, AttributeError, TypeError):
+        return None
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    return fallocate
+
+
+_fallocate = _libc_fallocate()
+
+
+def preallocate(fd, size):
+    """Reserve size bytes on disk in one go so the file is not fragmented; best effort"""
+    if size <= 0:
+        return False
+    if _fallocate is not None:
+        return _fallocate(fd, 0, 0, size) == 0
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return True
+        except OSError:
+            return False
+    return False
+
+
+def punch_hole(fd, offset, length):
+    """Free a range of the file so it reads back as zeros without taking disk space; best effort"""
+    if _fallocate is None or length <= 0:
+        return False
+    return _fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length) == 0
+
+
+class BitArray:
+    """Fixed-size set of sequence numbers, one bit each"""
+
+    def __init__(self, size):
+        self.size = size
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def add(self, index):
+        """Mark index, return False if it was already there"""
+        mask = 1 << (index & 7)
+        if self.bits[index >> 3] & mask:
+            return False
+        self.bits[index >> 3] |= mask
+        self.count += 1
+        return True
+
+    def add_range(self, first, last):
+        """Mark first..last, return how many of them were not there yet"""
+        added = 0
+        index = first
+        while index <= last and index & 7:
+            added += self.add(index)
+            index += 1
+        whole = (last + 1 - index) >> 3
+        if whole > 0:
+            # whole bytes at once: count what is already set, then set them all
+            i = index >> 3
+            new = whole * 8 - bin(int.from_bytes(self.bits[i:i + whole], "little")).count("1")
+            self.bits[i:i + whole] = b"\xff" * whole
+            self.count += new
+            added += new
+            index += whole * 8
+        while index <= last:
+            added += self.add(index)
+            index += 1
+        return added
+
+    def full(self):
+        return self.count == self.size
+
+    def missing_ranges(self, limit=None):
+        """(first, last) runs of unmarked indexes below limit"""
+        limit = self.size if limit is None else min(limit, self.size)
+        # as one big int, each run is found with a couple of C-speed bit operations
+        value = int.from_bytes(self.bits, "little")
+        holes = ~value & ((1 << limit) - 1)
+        ranges = []
+        while holes:
+            first = (holes & -holes).bit_length() - 1
+            after = value >> first
+            last = first + (after & -after).bit_length() - 2 if after else limit - 1
+            last = min(last, limit - 1)
+            ranges.append((first, last))
+            holes = holes >> (last + 1) << (last + 1)
+        return ranges
+
+
+class OutputFile:
+    """
+    Output file of known size, written anywhere by concurrent chunk receivers.
+    A write that continues an earlier one joins its pending run, and runs go
+    to disk in buffer_size pieces aligned to buffer_size, so each receiver's
+    stream of small writes becomes a few large ones. close() writes out what
+    is pending
+
+    Args:
+        fsync: "none", "file" (at close) or a byte count (every N bytes written)
+    """
+
+    def __init__(self, path, file_size, fsync=FSYNC_POLICY, buffer_size=WRITE_BUFFER):
+        self.path = path
+        self.file_size = file_size
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.runs = {}          # end offset -> [start offset, buffer, bytes filled], oldest first
+        self.unsynced = 0       # bytes written since the last fsync
+        self.writes = 0         # write calls that reached the file
+        self.zero_bytes = 0     # bytes left as zeros instead of written
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self.fd, file_size)
+        self.preallocated = preallocate(self.fd, file_size)
+
+    def write(self, offset, data):
+        writes = []
+        with self.lock:
+            run = self.runs.pop(offset, None)
+            if run is None and len(data) >= self.buffer_size:
+                writes.append((offset, data))
+                data = b""
+            elif run is None and len(self.runs) >= MAX_RUNS:
+                oldest = next(iter(self.runs))
+                writes.append(self._take(self.runs.pop(oldest)))
+            view = memoryview(data)
+            while view:
+                if run is None:
+                    # a run fills up to the next buffer_size boundary, so every full one is aligned
+                    run = [offset, bytearray(self.buffer_size - offset % self.buffer_size), 0]
+                start, buffer, filled = run
+                n = min(len(view), len(buffer) - filled)
+                buffer[filled:filled + n] = view[:n]
+                run[2] = filled + n
+                offset += n
+                view = view[n:]
+                if run[2] == len(buffer):
+                    writes.append((start, buffer))
+                    run = None
+            if run is not None:
+                self.runs[offset] = run
+            self.writes += len(writes)
+        for start, buffer in writes:
+            self._write(start, buffer)
+
+    def _take(self, run):
+        start, buffer, filled = run
+        return start, memoryview(buffer)[:filled]
+
+    def flush(self):
+        """Write out every pending run"""
+        with self.lock:
+            writes = [self._take(run) for run in self.runs.values()]
+            self.runs.clear()
+            self.writes += len(writes)
+        for start, buffer in writes:
+            self._write(start, buffer)
+
+    def zero(self, offset, length):
+        """Leave a range as zero bytes without writing it: a hole, where the filesystem can punch one"""
+        # a file that was only truncated to size is one big hole already
+        if self.preallocated:
+            punch_hole(self.fd, offset, length)
+        with self.lock:
+            self.zero_bytes += length
+
+    def close(self):
+        if self.fd is not None:
+            self.flush()
+            if self.fsync != "none" and (self.fsync == "file" or self.unsynced):
+                self._sync()
+            os.close(self.fd)
+            self.fd = None
+
+    def _write(self, offset, data):
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.fd, data, offset)
+        else:
+            # no pwrite (Windows): seek + write must not interleave between threads
+            with self.io_lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                os.write(self.fd, data)
+        if isinstance(self.fsync, int):
+            with self.io_lock:
+                self.unsynced += len(data)
+                due = self.unsynced >= self.fsync
+                if due:
+                    self.unsynced = 0
+            if due:
+                self._sync()
+
+    def _sync(self):
+        (os.fdatasync if hasattr(os, "fdatasync") else os.fsync)(self.fd)
+
+
+class ChunkReassembler:
+    """Receive state of one chunk: packet seq lands at start + seq * data_size"""
+
+    def __init__(self, output, start, size, data_size):
+        self.output = output
+        self.start = start
+        self.size = size
+        self.data_size = data_size
+        self.received = BitArray(-(-size // data_size))
+        self.received_bytes = 0
+        self.zero_packets = 0   # packets that came as part of a zero range
+
+    @property
+    def count(self):
+        """Packets in the chunk"""
+        return self.received.size
+
+    def add(self, seq, data):
+        """Store one packet, return False for duplicates and packets outside the chunk"""
+        offset = seq * self.data_size
+        if seq < 0 or seq >= self.count or offset + len(data) > self.size or seq in self.received:
+            return False
+        self.output.write(self.start + offset, data)
+        self.received.add(seq)
+        self.received_bytes += len(data)
+        return True
+
+    def add_zeros(self, first, last):
+        """Mark packets first..last as all zero bytes, return False if none of them was new"""
+        if first < 0 or last >= self.count or first > last:
+            return False
+        tail_new = (self.count - 1) not in self.received and last == self.count - 1
+        added = self.received.add_range(first, last)
+        if not added:
+            return False
+        start = first * self.data_size
+        self.output.zero(self.start + start, min((last + 1) * self.data_size, self.size) - start)
+        self.zero_packets += added
+        # the chunk's last packet may be short
+        self.received_bytes += added * self.data_size - (self.count * self.data_size - self.size if tail_new else 0)
+        return True
+
+    def complete(self):
+        return self.received.full()
+
+    def missing_ranges(self, limit=None):
+        return self.received.missing_ranges(limit)
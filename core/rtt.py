@@ -0,0 +1,71 @@
+"""
+RTT Estimation - Jacobson/Karels smoothed RTT and retransmission timeout
+(RFC 6298) with exponential backoff, one estimator per flow
+"""
+
+import threading
+
+from core.constants import TIMEOUT, MIN_RTO, MAX_RTO
+
+ALPHA = 1 / 8   # gain for the smoothed RTT
+BETA = 1 / 4    # gain for the RTT variance
+K = 4           # variance multiplier in the RTO
+
+
+class RTTEstimator:
+    """Smoothed RTT, RTT variance and the resulting retransmission timeout"""
+
+    def __init__(self, initial_rto=TIMEOUT, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.lock = threading.Lock()
+
+        self.srtt = None
+        self.rttvar = None
+        self.base_rto = initial_rto
+        self.backoff_factor = 1
+        self.samples = 0
+        self.retransmits = 0
+
+    @property
+    def rto(self):
+        """Current timeout, including exponential backoff"""
+        return min(self.max_rto, max(self.min_rto, self.base_rto * self.backoff_factor))
+
+    def sample(self, rtt):
+        """
+        Feed one RTT measurement.
+        Per Karn's algorithm, only pass RTTs of packets sent exactly once.
+        """
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+            self.base_rto = self.srtt + K * self.rttvar
+            self.backoff_factor = 1
+            self.samples += 1
+
+    def backoff(self):
+        """A timeout fired: double the RTO until the next valid sample"""
+        with self.lock:
+            if self.base_rto * self.backoff_factor < self.max_rto:
+                self.backoff_factor *= 2
+            self.retransmits += 1
+
+    def snapshot(self):
+        """Live values for stats, in seconds"""
+        with self.lock:
+            return {
+                "srtt": self.srtt,
+                "rttvar": self.rttvar,
+                "rto": self.rto,
+                "samples": self.samples,
+                "retransmits": self.retransmits,
+            }
+
+    def __str__(self):
+        srtt = f"{self.srtt * 1000:.2f}ms" if self.srtt is not None else "-"
+        return f"srtt {srtt}, rto {self.rto * 1000:.1f}ms, {self.retransmits} retransmits"
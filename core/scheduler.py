@@ -0,0 +1,221 @@
+"""
+Download Scheduler - several files at once within global budgets
+Files wait in one queue, by priority and then in arrival order or shortest
+first. Up to MAX_ACTIVE_DOWNLOADS workers take them off it, each with its own
+connection to the server, so every active file has its own data channels.
+Every received byte goes through one token bucket shared by all workers,
+keeping the client within its bandwidth budget however many files are in flight
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from threading import Thread
+
+from core.constants import MAX_ACTIVE_DOWNLOADS, DOWNLOAD_RATE_LIMIT, DOWNLOAD_ORDER
+
+# "fifo": arrival order, "priority": higher priority first, "shortest": also smaller files first
+ORDERS = ("fifo", "priority", "shortest")
+# Bytes the bucket may hold: how far a burst may run ahead of the budget
+RATE_BURST = 256 * 1024
+
+
+class Bandwidth:
+    """Token bucket shared by every receiving thread, rate in bytes/s (None: no limit)"""
+
+    def __init__(self, rate=None, burst=RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, nbytes):
+        """Block until nbytes fit in the budget"""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            # taken now, paid for by sleeping: threads queue up in the order they came
+            self.tokens -= nbytes
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Download:
+    """One file of the queue, and how far it got. Receivers meter their bytes through it"""
+
+    QUEUED = "queued"
+    ACTIVE = "active"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, name, size, priority, bandwidth):
+        self.name = name
+        self.size = size
+        self.priority = priority
+        self.state = self.QUEUED
+        self.received = 0
+        self.started = None
+        self.finished = None
+        self.unchanged = False  # done by keeping the local copy: the server has the same version
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+
+    def add(self, nbytes):
+        """nbytes came over the network: counted, and held to the bandwidth budget"""
+        with self.lock:
+            self.received += nbytes
+        self.bandwidth.take(nbytes)
+
+    def skip(self, nbytes):
+        """nbytes of zero ranges: counted, but they took no bandwidth"""
+        with self.lock:
+            self.received += nbytes
+
+    @property
+    def progress(self):
+        if self.state == self.DONE:
+            return 100.0
+        if not self.size:
+            return 0.0
+        return min(100.0, self.received / self.size * 100)
+
+    @property
+    def rate(self):
+        """Bytes/s so far"""
+        if self.started is None:
+            return 0.0
+        return self.received / max((self.finished or time.monotonic()) - self.started, 1e-6)
+
+
+class DownloadScheduler:
+    """Downloads submitted files concurrently, within a concurrency and a bandwidth budget"""
+
+    def __init__(self, connect, concurrency=MAX_ACTIVE_DOWNLOADS, rate=DOWNLOAD_RATE_LIMIT, order=DOWNLOAD_ORDER,
+                 on_log=None, on_update=None):
+        """
+        Args:
+            connect: returns a new connection to the server, None if it cannot
+                connect. Connections have download_file(name) -> bool, disconnect()
+                and a meter attribute the scheduler points at the running Download
+            on_update: on_update(download) whenever a download changes state
+        """
+        if order not in ORDERS:
+            raise ValueError(f"unknown download order {order!r}, expected one of {ORDERS}")
+        self.connect = connect
+        self.concurrency = max(1, concurrency)
+        self.order = order
+        self.bandwidth = Bandwidth(rate)
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.on_update = on_update or (lambda download: None)
+        self.queue = []         # heap of (key, Download)
+        self.counter = itertools.count()
+        self.downloads = []     # every submitted Download, in submission order
+        self.workers = []
+        self.active = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        # TCP servers take a client's 1+4 sockets in accept order: connect one worker at a time
+        self.connect_lock = threading.Lock()
+
+    def log(self, message):
+        """Send log message to callback"""
+        self.on_log(message)
+
+    def submit(self, name, size=None, priority=0):
+        """Queue name for download, returns its Download"""
+        download = Download(name, size, priority, self.bandwidth)
+        with self.condition:
+            heapq.heappush(self.queue, (self._key(download), download))
+            self.downloads.append(download)
+            # workers start as there are files for them, and then stay for the next ones
+            if len(self.workers) < min(self.concurrency, self.active + len(self.queue)):
+                worker = Thread(target=self._work, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.condition.notify()
+        self.on_update(download)
+        return download
+
+    def _key(self, download):
+        seq = next(self.counter)
+        if self.order == "fifo":
+            return (seq,)
+        if self.order == "priority":
+            return (-download.priority, seq)
+        size = download.size if download.size is not None else float("inf")
+        return (-download.priority, size, seq)
+
+    def pending(self):
+        """Files queued or downloading"""
+        with self.condition:
+            return len(self.queue) + self.active
+
+    def wait(self, timeout=None):
+        """Block until every submitted file is done or failed, False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.active, timeout)
+
+    def close(self):
+        """No more files: workers download what is queued, then disconnect"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _take(self):
+        with self.condition:
+            while not self.queue:
+                if self.closed:
+                    return None
+                self.condition.wait()
+            _, download = heapq.heappop(self.queue)
+            self.active += 1
+        download.state = Download.ACTIVE
+        download.started = time.monotonic()
+        self.on_update(download)
+        return download
+
+    def _finish(self, download, ok):
+        download.finished = time.monotonic()
+        download.state = Download.DONE if ok else Download.FAILED
+        self.on_update(download)
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def _work(self):
+        """One worker: a connection of its own, one file at a time on it"""
+        connection = None
+        try:
+            while True:
+                download = self._take()
+                if download is None:
+                    return
+                ok = False
+                try:
+                    if connection is None:
+                        with self.connect_lock:
+                            connection = self.connect()
+                    if connection is None:
+                        self.log(f"Cannot download {download.name}: no connection to the server")
+                    else:
+                        connection.meter = download
+                        ok = connection.download_file(download.name)
+                except Exception as e:
+                    self.log(f"Download of {download.name} failed: {e}")
+                    # the connection may be half way through a file: start over on a new one
+                    if connection is not None:
+                        connection.disconnect()
+                        connection = None
+                finally:
+                    if connection is not None:
+                        connection.meter = None
+                    self._finish(download, ok)
+        finally:
+            if connection is not None:
+                connection.disconnect()
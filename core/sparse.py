@@ -0,0 +1,180 @@
+"""
+Sparse Transfer - zero ranges instead of zero bytes
+Senders find a file's holes with SEEK_DATA/SEEK_HOLE and its all-zero blocks
+by comparison, and send both as run-length zero ranges. Receivers do not
+write them: the output file reads back zeros there, and the ranges are
+punched out of it so a mostly empty disk image stays sparse on the client
+"""
+
+import bisect
+import errno
+import os
+import struct
+
+from utils.checksum import calculate_checksum
+
+# TCP records on a data socket: kind, length, then length bytes for DATA
+RECORD = struct.Struct("!BQ")
+DATA = 0
+ZERO = 1
+# Receive buffer per data socket
+RECV_SIZE = 64 * 1024
+
+
+def is_zero(data):
+    """True if data is all zero bytes"""
+    return data == bytes(len(data))
+
+
+def data_ranges(fd, start, end):
+    """(offset, length) of the parts of [start, end) that are not holes"""
+    if not hasattr(os, "SEEK_DATA"):
+        yield start, end - start
+        return
+    offset = start
+    while offset < end:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                # no hole support here: all of it is data
+                yield offset, end - offset
+            # ENXIO: nothing but hole up to the end of the file
+            return
+        if data >= end:
+            return
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), end)
+        yield data, hole - data
+        offset = hole
+
+
+class ZeroMap:
+    """Which pieces of [start, end) of a file are zeros: in a hole, or read and found all-zero"""
+
+    def __init__(self, fd, start, end):
+        self.start = start
+        self.end = end
+        self.data = list(data_ranges(fd, start, end))
+        self.starts = [offset for offset, _ in self.data]
+
+    def in_hole(self, offset, size):
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if i >= 0 and offset < self.starts[i] + self.data[i][1]:
+            return False
+        return i + 1 == len(self.data) or self.starts[i + 1] >= offset + size
+
+    def read(self, reader, offset, size):
+        """size bytes at offset through reader, None if they are all zero"""
+        if self.in_hole(offset, size):
+            return None
+        data = reader.read(offset, size)
+        return None if is_zero(data) else data
+
+    def segments(self, reader):
+        """
+        (offset, length, block) covering [start, end) in order, block is None
+        for a zero range; neighbouring zeros are merged into one range
+        """
+        zero_from = self.start    # start of the zero range being built
+        for offset, length in self.data:
+            end = offset + length
+            while offset < end:
+                size = min(reader.block_size - offset % reader.block_size, end - offset)
+                block = reader.read(offset, size)
+                if len(block) < size:
+                    # file shrank under us: the rest is not zeros, it is gone
+                    raise OSError(f"file shrank below {offset + len(block)} bytes")
+                if not is_zero(block):
+                    if offset > zero_from:
+                        yield zero_from, offset - zero_from, None
+                    yield offset, size, block
+                    zero_from = offset + size
+                offset += size
+        if self.end > zero_from:
+            yield zero_from, self.end - zero_from, None
+
+
+# =========================
+# TCP DATA SOCKETS
+# =========================
+def send_records(sock, zeros, reader):
+    """Send [start, end) of zeros' file as DATA/ZERO records, return the bytes sent as zero ranges"""
+    zero_bytes = 0
+    for offset, length, block in zeros.segments(reader):
+        if block is None:
+            sock.sendall(RECORD.pack(ZERO, length))
+            zero_bytes += length
+        else:
+            # one send per record: a lone header would wait on Nagle
+            sock.sendall(RECORD.pack(DATA, length) + block)
+    return zero_bytes
+
+
+def recv_records(sock, output, start, size, on_progress=None, meter=None):
+    """
+    Receive size bytes worth of records into output at start,
+    on_progress(bytes received so far) as they come. A download scheduler
+    meter is told of data bytes (meter.add) and zero ranges (meter.skip)
+
+    Returns:
+        (bytes received, of which zero ranges)
+    """
+    header = bytearray(RECORD.size)
+    buffer = bytearray(RECV_SIZE)
+    view = memoryview(buffer)
+    received = zero_bytes = 0
+    while received < size:
+        if not _recv_exact(sock, memoryview(header)):
+            break
+        kind, length = RECORD.unpack(header)
+        if length > size - received:
+            raise ValueError(f"record of {length} bytes past the end of the chunk")
+        if kind == ZERO:
+            output.zero(start + received, length)
+            received += length
+            zero_bytes += length
+            if meter:
+                meter.skip(length)
+            if on_progress:
+                on_progress(received)
+        else:
+            while length:
+                n = sock.recv_into(view[:min(RECV_SIZE, length)])
+                if not n:
+                    return received, zero_bytes
+                output.write(start + received, view[:n])
+                received += n
+                length -= n
+                if meter:
+                    meter.add(n)
+                if on_progress:
+                    on_progress(received)
+    return received, zero_bytes
+
+
+def _recv_exact(sock, view):
+    while view:
+        n = sock.recv_into(view)
+        if not n:
+            return False
+        view = view[n:]
+    return True
+
+
+# =========================
+# UDP ZERO PACKETS
+# =========================
+def create_zero_packet(first, last, chunk_id):
+    """Z|first|last|chunk|md5: packets first..last of the chunk are all zero bytes"""
+    header = f"{first}|{last}|{chunk_id}".encode()
+    return b"Z|" + header + b"|" + calculate_checksum(header).encode()
+
+
+def parse_zero_packet(packet):
+    """(first, last) of a zero packet, None if it is damaged"""
+    fields = packet.split(b"|")
+    if len(fields) != 5 or not (fields[1].isdigit() and fields[2].isdigit()):
+        return None
+    if calculate_checksum(b"|".join(fields[1:4])) != fields[4].decode(errors="ignore"):
+        return None
+    return int(fields[1]), int(fields[2])
@@ -0,0 +1,360 @@
+"""
+Swarm Download - one file from several mirror servers at once
+Mirrors are checked for the same size and MD5, then every data socket of
+every mirror pulls disjoint byte ranges from a shared scheduler. Range size
+follows each socket's measured rate, so faster mirrors take more and bigger
+ranges as the transfer goes on, and ranges of a failed mirror go back to the
+others
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from threading import Thread
+
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.hash_cache import HashCache, stat_reply
+from core.reassembly import OutputFile
+from core.constants import TLS_ENABLED, TLS_CA, CONDITIONAL_GET
+
+# Range sizes handed to one data socket
+MIN_RANGE = 256 * 1024
+MAX_RANGE = 16 * 1024 * 1024
+# A range should take a socket about this long at its last measured rate
+RANGE_SECONDS = 0.5
+# Receive buffer per data socket
+RECV_SIZE = 256 * 1024
+# A data socket silent for this long is dropped and its range handed to the others
+STALL_TIMEOUT = 10.0
+
+
+# =========================
+# SERVER SIDE
+# =========================
+class RangeServer:
+    """
+    Serves swarm requests on a TCP server's 1+4 sockets. Requests arrive on
+    the control socket as newline-terminated lines:
+        HASH <file>                           -> "HASH <size> <md5>\\n" on the control socket
+        RANGE <socket> <offset> <length> <file> -> the raw bytes on that data socket
+    and so do conditional GETs from any client:
+        STAT <size> <mtime_ns> <md5> <file>     -> "SAME|DIFF <size> <mtime_ns> <md5>\\n"
+    """
+
+    VERBS = ("HASH ", "RANGE ", "STAT ")
+
+    def __init__(self, folder_path, on_log=None, files=None, cache=None):
+        self.folder_path = folder_path
+        self.on_log = on_log or (lambda msg: print(msg))
+        # ranges are read through the server's open files and block cache
+        self.files = files or OpenFileTable()
+        self.cache = cache or shared_cache()
+        # digests survive restarts in sidecar files
+        self.hashes = HashCache(folder_path)
+
+    def split(self, buffer):
+        """
+        Take the complete swarm requests off the front of buffer
+
+        Returns:
+            (request lines, rest); rest is a partial request, or another command
+        """
+        lines = []
+        while buffer.startswith(self.VERBS) and "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            lines.append(line)
+        return lines, buffer
+
+    def pending(self, buffer):
+        """True if buffer holds the start of a swarm request still being received"""
+        return buffer.startswith(self.VERBS)
+
+    def handle(self, line, client_sockets):
+        verb, _, rest = line.partition(" ")
+        if verb == "HASH":
+            try:
+                size, _, digest = self.hashes.stat(rest)
+            except OSError:
+                client_sockets[4].sendall(f"{rest} does not exist!\n".encode())
+                return
+            client_sockets[4].sendall(f"HASH {size} {digest}\n".encode())
+        elif verb == "STAT":
+            client_sockets[4].sendall(f"{stat_reply(self.hashes, line)}\n".encode())
+        elif verb == "RANGE":
+            try:
+                index, offset, length, filename = rest.split(" ", 3)
+                index, offset, length = int(index), int(offset), int(length)
+                # a data socket, never the control socket; nothing outside the folder
+                if not 0 <= index < 4 or offset < 0 or length < 0:
+                    raise ValueError(line)
+                path = self.hashes.path(filename)
+            except (ValueError, OSError):
+                self.on_log(f"Bad range request: {line}")
+                return
+            # one range in flight per data socket, several data sockets at once
+            Thread(target=self.send_range, args=(client_sockets[index], path, offset, length),
+                   daemon=True).start()
+
+    def send_range(self, sock, path, offset, length):
+        try:
+            handle = self.files.acquire(path)
+        except OSError as e:
+            self.on_log(f"Error sending range {offset}+{length} of {path}: {e}")
+            return
+        try:
+            with ReadAhead(self.cache, handle, offset, length) as reader:
+                for block in reader:
+                    sock.sendall(block)
+        except Exception as e:
+            self.on_log(f"Error sending range {offset}+{length} of {path}: {e}")
+        finally:
+            self.files.release(handle)
+
+
+# =========================
+# CLIENT SIDE
+# =========================
+class RangeScheduler:
+    """Hands out disjoint ranges of one file, sized to the rate of whoever asks"""
+
+    def __init__(self, file_size, workers):
+        self.file_size = file_size
+        self.next_offset = 0
+        self.returned = []     # ranges given back by failed sockets
+        self.in_flight = 0
+        self.workers = workers
+        self.received = 0
+        self.condition = threading.Condition()
+
+    def take(self, rate=None):
+        """
+        Next (offset, length) for a socket receiving at rate bytes/s, None when
+        nothing is left. Waits while other sockets still hold ranges that may come back
+        """
+        with self.condition:
+            while True:
+                if self.returned:
+                    piece = self.returned.pop()
+                    break
+                remaining = self.file_size - self.next_offset
+                if remaining > 0:
+                    length = MIN_RANGE if rate is None else int(rate * RANGE_SECONDS)
+                    # near the end, split what is left so no socket is handed a long tail
+                    length = min(max(MIN_RANGE, min(length, MAX_RANGE, remaining // self.workers)), remaining)
+                    piece = (self.next_offset, length)
+                    self.next_offset += length
+                    break
+                if self.in_flight == 0:
+                    return None
+                self.condition.wait()
+            self.in_flight += 1
+            return piece
+
+    def done(self, length):
+        with self.condition:
+            self.in_flight -= 1
+            self.received += length
+            self.condition.notify_all()
+
+    def give_back(self, offset, length, got):
+        """A socket failed after got bytes: the rest of its range goes to the others"""
+        with self.condition:
+            self.in_flight -= 1
+            self.received += got
+            if length > got:
+                self.returned.append((offset + got, length - got))
+            self.condition.notify_all()
+
+    def leave(self):
+        with self.condition:
+            self.workers = max(1, self.workers - 1)
+
+    def complete(self):
+        with self.condition:
+            return self.received == self.file_size
+
+
+class SwarmClient:
+    """Download each file from every mirror that has the same version of it"""
+
+    def __init__(self, mirrors, download_folder, on_log=None, on_progress=None, tls=TLS_ENABLED, ca=TLS_CA):
+        """
+        Args:
+            mirrors: list of (host, port) of TCP servers sharing the same folder
+        """
+        self.mirrors = mirrors
+        self.download_folder = download_folder
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.on_progress = on_progress or (lambda p: None)
+        self.tls = tls
+        self.ca = ca
+        self.connections = []    # connected TCPClientLogic per mirror
+        self.locks = {}          # connection -> lock of its control socket
+        self.broken = set()      # (connection, data socket) that failed mid-range, never used again
+        self.file_list = []
+        # the mirrors' HASH replies are checked against the local copies' digests
+        self.conditional = CONDITIONAL_GET
+        self.hashes = HashCache(download_folder)
+
+    def log(self, message):
+        """Send log message to callback"""
+        self.on_log(message)
+
+    def connect(self):
+        """Open the 1+4 sockets to every mirror that answers"""
+        from core.tcp_logic import TCPClientLogic
+
+        for host, port in self.mirrors:
+            client = TCPClientLogic(host, port, self.download_folder, on_log=lambda msg: None, transport="tcp",
+                                    tls=self.tls, ca=self.ca)
+            if client.connect():
+                self.connections.append(client)
+                self.locks[client] = threading.Lock()
+                self.file_list = self.file_list or client.file_list
+            else:
+                self.log(f"Mirror {host}:{port} unavailable")
+        self.log(f"Connected to {len(self.connections)} of {len(self.mirrors)} mirrors")
+        return bool(self.connections)
+
+    def disconnect(self):
+        for client in self.connections:
+            client.disconnect()
+        self.connections = []
+        self.broken.clear()
+
+    def verify(self, filename):
+        """
+        Ask every mirror for size and MD5 of filename
+
+        Returns:
+            (mirrors holding the most common version, size, md5), ([], None, None) if none has it
+        """
+        versions = {}
+        for client in self.connections:
+            try:
+                with self.locks[client]:
+                    client.sockets[4].sendall(f"HASH {filename}\n".encode())
+                    reply = self._read_line(client.sockets[4])
+            except OSError as e:
+                self.log(f"Mirror {client.host}:{client.port} failed: {e}")
+                continue
+            if not reply.startswith("HASH "):
+                self.log(f"{client.host}:{client.port}: {reply}")
+                continue
+            _, size, digest = reply.split()
+            versions[client] = (int(size), digest)
+
+        if not versions:
+            return [], None, None
+        (size, digest), _ = Counter(versions.values()).most_common(1)[0]
+        sources = [client for client, version in versions.items() if version == (size, digest)]
+        for client in versions:
+            if client not in sources:
+                self.log(f"Mirror {client.host}:{client.port} has a different {filename}, skipped")
+        return sources, size, digest
+
+    def download_file(self, filename):
+        """Download filename from all agreeing mirrors at once, verify its MD5"""
+        sources, file_size, digest = self.verify(filename)
+        if not sources:
+            self.log(f"No mirror has {filename}")
+            return False
+        if self.conditional and self._unchanged(filename, file_size, digest):
+            self.log(f"{filename} not modified, kept the local copy")
+            return True
+
+        workers = [(client, index) for client in sources for index in range(4) if (client, index) not in self.broken]
+        if not workers:
+            self.log(f"No usable connection to the mirrors of {filename}")
+            return False
+        scheduler = RangeScheduler(file_size, len(workers))
+        received = {client: 0 for client in sources}
+        output_path = os.path.join(self.download_folder, filename)
+        output = OutputFile(output_path, file_size)
+        self.log(f"Downloading {filename} ({file_size} bytes) from {len(sources)} mirrors, {len(workers)} sockets")
+        started = time.perf_counter()
+
+        threads = [Thread(target=self._receive_ranges, args=(client, index, filename, scheduler, output, received),
+                          daemon=True) for client, index in workers]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            output.close()
+
+        elapsed = time.perf_counter() - started
+        for client, count in received.items():
+            self.log(f"  {client.host}:{client.port}: {count} bytes ({count / file_size * 100 if file_size else 0:.0f}%)")
+        if not scheduler.complete():
+            self.log(f"Download of {filename} failed: every mirror dropped out")
+            return False
+        # hashed through the cache: the next run finds this version in its sidecar
+        if self.hashes.stat(filename)[2] != digest:
+            self.log(f"Download of {filename} failed: MD5 mismatch")
+            return False
+        self.log(f"Downloaded {filename} successfully ({file_size / max(elapsed, 1e-9) / 1e6:.1f} MB/s)")
+        return True
+
+    def _unchanged(self, filename, file_size, digest):
+        """True if the local copy is this version, hashing it only if its sidecar does not say"""
+        local = self.hashes.cached(filename)
+        if local is None or local[0] != file_size:
+            return False
+        try:
+            return self.hashes.stat(filename)[2] == digest
+        except OSError:
+            return False
+
+    def _receive_ranges(self, client, index, filename, scheduler, output, received):
+        """One data socket: take a range, request it, write it in place, repeat"""
+        sock = client.sockets[index]
+        sock.settimeout(STALL_TIMEOUT)
+        buffer = bytearray(RECV_SIZE)
+        view = memoryview(buffer)
+        rate = None
+        while True:
+            piece = scheduler.take(rate)
+            if piece is None:
+                return
+            offset, length = piece
+            got = 0
+            try:
+                with self.locks[client]:
+                    client.sockets[4].sendall(f"RANGE {index} {offset} {length} {filename}\n".encode())
+                started = time.perf_counter()
+                while got < length:
+                    n = sock.recv_into(view[:min(RECV_SIZE, length - got)])
+                    if n == 0:
+                        raise ConnectionError("mirror closed the connection")
+                    output.write(offset + got, view[:n])
+                    got += n
+                    self.on_progress((scheduler.received + got) / scheduler.file_size * 100)
+            except (OSError, ConnectionError) as e:
+                self.log(f"Mirror {client.host}:{client.port} socket {index} failed: {e}")
+                # the rest of the range may still arrive: later bytes on this socket would be misplaced
+                self.broken.add((client, index))
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+                scheduler.give_back(offset, length, got)
+                scheduler.leave()
+                with self.locks[client]:
+                    received[client] += got
+                return
+            rate = length / max(time.perf_counter() - started, 1e-6)
+            scheduler.done(length)
+            with self.locks[client]:
+                received[client] += length
+
+    def _read_line(self, sock):
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("mirror closed the connection")
+            data += chunk
+        return data.decode().strip()
@@ -5,14 +5,28 @@ Provides core TCP functionality for GUI or other interfaces
 
 import socket
 import os
+import itertools
 from threading import Thread
 import threading
 
+from core.constants import (LOCAL_TRANSPORT, LOCAL_PASS_FDS, SPARSE_TRANSFER, CONDITIONAL_GET, TLS_ENABLED, TLS_CERT,
+                            TLS_KEY, TLS_CA)
+from core.local_transport import (HAS_UNIX, HAS_FD_PASSING, socket_path, is_local_host, listen,
+                                  send_message, recv_message, copy_fd, recv_file)
+from core.hybrid import HybridSender, HybridReceiver
+from core.hash_cache import HashCache, stat_reply, check_local
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.reassembly import OutputFile
+from core.swarm import RangeServer
+from core.sparse import ZeroMap, send_records, recv_records
+from core.tls import server_context, client_context, server_handshake, connect_all
+
 
 class TCPServerLogic:
     """Pure TCP server logic without CLI dependencies"""
 
-    def __init__(self, host, port, folder_path, on_log=None):
+    def __init__(self, host, port, folder_path, on_log=None, local=LOCAL_TRANSPORT, tls=TLS_ENABLED,
+                 cert=TLS_CERT, key=TLS_KEY):
         self.host = host
         self.port = port
         self.folder_path = folder_path
@@ -20,6 +34,20 @@ class TCPServerLogic:
         self.running = False
         self.server_socket = None
         self.clients = []
+        # same-host clients may skip TCP and use a Unix socket
+        self.local = local and HAS_UNIX
+        self.local_socket = None
+        self.local_path = None
+        # TLS on the 1+4 sockets (the Unix socket stays on this host and is not wrapped)
+        self.tls = tls
+        self.tls_files = (cert, key)
+        self.tls_context = None
+        # every transfer reads through shared descriptors and the process-wide block cache
+        self.transfer_ids = itertools.count(1)
+        self.files = OpenFileTable()
+        self.cache = shared_cache()
+        # swarm clients ask for hashes and byte ranges, any client for STAT (conditional GET)
+        self.ranges = RangeServer(folder_path, on_log=self.on_log, files=self.files, cache=self.cache)
 
     def log(self, message):
         """Send log message to callback"""
@@ -28,18 +56,23 @@ class TCPServerLogic:
     def start(self):
         """Start the server"""
         try:
+            if self.tls:
+                self.tls_context = server_context(*self.tls_files)
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen()
             self.running = True
 
-            self.log(f"Server started on {self.host}:{self.port}")
+            self.log(f"Server started on {self.host}:{self.port}" + (" (TLS)" if self.tls else ""))
 
             # Start accepting clients in background
             accept_thread = Thread(target=self._accept_clients, daemon=True)
             accept_thread.start()
 
+            if self.local:
+                self._start_local()
+
             return True
         except Exception as e:
             self.log(f"Failed to start server: {e}")
@@ -53,8 +86,20 @@ class TCPServerLogic:
                 self.server_socket.close()
             except:
                 pass
+        if self.local_socket:
+            try:
+                self.local_socket.close()
+                os.unlink(self.local_path)
+            except:
+                pass
+            self.local_socket = None
+        self.files.close()
         self.log("Server stopped")
 
+    def get_stats(self):
+        """Open files and block cache hit ratio / bytes served from memory"""
+        return {"files": self.files.stats(), "cache": self.cache.stats()}
+
     def get_file_list(self):
         """Get list of available files"""
         try:
@@ -71,13 +116,16 @@ class TCPServerLogic:
     def _accept_clients(self):
         """Accept incoming client connections"""
         while self.running:
+            client_sockets = []
             try:
                 # Accept 5 connections from one client
-                client_sockets = []
                 for i in range(5):
                     if not self.running:
                         break
                     client_socket, address = self.server_socket.accept()
+                    if self.tls_context is not None:
+                        # here, not in the client's thread: its next sockets wait for this one's ticket
+                        client_socket = server_handshake(self.tls_context, client_socket)
                     client_sockets.append(client_socket)
 
                 if len(client_sockets) == 5:
@@ -91,6 +139,8 @@ class TCPServerLogic:
                     client_thread.start()
 
             except Exception as e:
+                for sock in client_sockets:
+                    sock.close()
                 if self.running:
                     self.log(f"Error accepting client: {e}")
 
@@ -105,17 +155,32 @@ class TCPServerLogic:
 
             # Listen for file requests
             client_sockets[4].settimeout(1.0)
+            buffer = ""
             while self.running:
                 try:
                     msg = client_sockets[4].recv(1024).decode()
                     if not msg:
                         break
 
+                    # Swarm requests are newline-terminated and may arrive back to back
+                    lines, buffer = self.ranges.split(buffer + msg)
+                    for line in lines:
+                        self.ranges.handle(line, client_sockets)
+                    if not buffer or self.ranges.pending(buffer):
+                        continue
+                    msg, buffer = buffer, ""
+
                     self.log(f"Request from {address}: {msg}")
 
                     if msg.startswith("GET "):
                         filename = msg[4:].strip()
                         self._send_file(client_sockets, filename, address)
+                    elif msg.startswith("SPARSE "):
+                        filename = msg[7:].strip()
+                        self._send_file(client_sockets, filename, address, sparse=True)
+                    elif msg.startswith("HYBRID "):
+                        filename = msg[7:].strip()
+                        self._send_file_hybrid(client_sockets, filename, address)
 
                 except socket.timeout:
                     continue
@@ -133,35 +198,39 @@ class TCPServerLogic:
                     pass
             self.log(f"Client {address} disconnected")
 
-    def _send_file(self, client_sockets, filename, address):
-        """Send a file to client"""
+    def _send_file(self, client_sockets, filename, address, sparse=False):
+        """Send a file to client, as DATA/ZERO records if sparse"""
         try:
             file_path = os.path.join(self.folder_path, filename)
             if not os.path.exists(file_path):
                 client_sockets[4].send(f"{filename} does not exist!".encode())
                 return
 
-            file_size = os.path.getsize(file_path)
-            client_sockets[4].send(f"Downloading {filename}!".encode())
+            handle = self.files.acquire(file_path)
+            try:
+                file_size = handle.size
+                client_sockets[4].send(f"Downloading {filename}!".encode())
 
-            # Send file in 4 chunks using first 4 sockets
-            chunk_size = file_size // 4
-            threads = []
+                # Send file in 4 chunks using first 4 sockets
+                chunk_size = file_size // 4
+                threads = []
 
-            for i in range(4):
-                start = i * chunk_size
-                end = start + chunk_size if i < 3 else file_size
+                for i in range(4):
+                    start = i * chunk_size
+                    end = start + chunk_size if i < 3 else file_size
 
-                thread = Thread(
-                    target=self._send_chunk,
-                    args=(client_sockets[i], file_path, start, end, i),
-                    daemon=True
-                )
-                threads.append(thread)
-                thread.start()
+                    thread = Thread(
+                        target=self._send_chunk,
+                        args=(client_sockets[i], handle, start, end, i, sparse),
+                        daemon=True
+                    )
+                    threads.append(thread)
+                    thread.start()
 
-            for thread in threads:
-                thread.join()
+                for thread in threads:
+                    thread.join()
+            finally:
+                self.files.release(handle)
 
             # Send completion message
             client_sockets[4].send(f"{filename} downloaded successfully".encode())
@@ -170,21 +239,131 @@ class TCPServerLogic:
         except Exception as e:
             self.log(f"Error sending file: {e}")
 
-    def _send_chunk(self, sock, file_path, start, end, chunk_id):
+    def _send_chunk(self, sock, handle, start, end, chunk_id, sparse=False):
         """Send a chunk of file"""
         try:
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                data = f.read(end - start)
-                sock.sendall(data)
+            with ReadAhead(self.cache, handle, start, end - start) as reader:
+                if sparse:
+                    zero_bytes = send_records(sock, ZeroMap(handle.fd, start, end), reader)
+                    if zero_bytes:
+                        self.log(f"Chunk {chunk_id}: {zero_bytes} of {end - start} bytes sent as zero ranges")
+                    return
+                for block in reader:
+                    sock.sendall(block)
         except Exception as e:
             self.log(f"Error sending chunk {chunk_id}: {e}")
 
+    def _send_file_hybrid(self, client_sockets, filename, address):
+        """Send a file as UDP data, negotiated and repaired over the control socket"""
+        control = client_sockets[4]
+        if self.tls_context is not None:
+            # the UDP data would bypass TLS: the client has to fetch it over TCP
+            control.send(f"{filename} is not sent over UDP with TLS on, use TCP".encode())
+            return
+        try:
+            handle = self.files.acquire(os.path.join(self.folder_path, filename))
+        except OSError:
+            control.send(f"{filename} does not exist!".encode())
+            return
+
+        sender = HybridSender(control, self.host, on_log=self.on_log)
+        reader = ReadAhead(self.cache, handle, 0, handle.size)
+        try:
+            transfer_id = next(self.transfer_ids)
+            control.send(f"HYBRID {handle.size} {sender.port} {transfer_id}".encode())
+            hello = sender.wait_hello(transfer_id)
+            if hello is None:
+                self.log(f"No UDP hello from {address} for {filename}")
+                return
+            client_address, packet_size = hello
+            stats = sender.send(reader.read,
+                                handle.size, client_address, packet_size)
+
+            control.send(f"{filename} downloaded successfully".encode())
+            self.log(f"Sent {filename} to {address} (hybrid, {stats['packets']} packets, "
+                     f"{stats['resent']} resent, {stats['rate']})")
+        except Exception as e:
+            self.log(f"Error sending file: {e}")
+        finally:
+            sender.close()
+            reader.close()
+            self.files.release(handle)
+
+    # =========================
+    # SAME-HOST CLIENTS (UNIX SOCKET)
+    # =========================
+    def _start_local(self):
+        """Listen on the Unix socket next to the TCP port"""
+        try:
+            self.local_path = socket_path(self.port)
+            self.local_socket = listen(self.local_path)
+        except OSError as e:
+            self.log(f"Local transport unavailable: {e}")
+            self.local_socket = None
+            return
+        self.log(f"Same-host clients: {self.local_path}")
+        Thread(target=self._accept_local, daemon=True).start()
+
+    def _accept_local(self):
+        """Accept same-host clients, one connection each"""
+        while self.running:
+            try:
+                conn, _ = self.local_socket.accept()
+                Thread(target=self._handle_local, args=(conn,), daemon=True).start()
+            except Exception as e:
+                if self.running:
+                    self.log(f"Error accepting local client: {e}")
+
+    def _handle_local(self, conn):
+        """Serve a same-host client: GET streams a file, OPEN passes its descriptor, STAT checks its copy"""
+        try:
+            file_list_str = "List of files:\n" + "\n".join(self.get_file_list())
+            send_message(conn, file_list_str)
+            self.log("Sent file list to local client")
+
+            while self.running:
+                msg, _ = recv_message(conn)
+                if msg is None:
+                    break
+                self.log(f"Request from local client: {msg}")
+                verb, _, filename = msg.partition(" ")
+                if verb in ("GET", "OPEN"):
+                    self._send_file_local(conn, filename.strip(), verb == "OPEN")
+                elif verb == "STAT":
+                    send_message(conn, stat_reply(self.ranges.hashes, msg))
+        except Exception as e:
+            self.log(f"Error with local client: {e}")
+        finally:
+            try:
+                conn.close()
+            except:
+                pass
+            self.log("Local client disconnected")
+
+    def _send_file_local(self, conn, filename, pass_fd):
+        """Send a file over the Unix socket"""
+        file_path = os.path.join(self.folder_path, filename)
+        if not os.path.isfile(file_path):
+            send_message(conn, f"{filename} does not exist!")
+            return
+
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if pass_fd and HAS_FD_PASSING:
+                # the client gets its own reference to the open file and copies it itself
+                send_message(conn, f"FILE {file_size}", [f.fileno()])
+                self.log(f"Passed {filename} descriptor to local client")
+            else:
+                send_message(conn, f"DATA {file_size}")
+                conn.sendfile(f, 0, file_size)
+                self.log(f"Sent {filename} to local client")
+
 
 class TCPClientLogic:
     """Pure TCP client logic without CLI dependencies"""
 
-    def __init__(self, host, port, download_folder, on_log=None, on_progress=None):
+    def __init__(self, host, port, download_folder, on_log=None, on_progress=None, transport="auto",
+                 transfer_mode="tcp", tls=TLS_ENABLED, ca=TLS_CA):
         self.host = host
         self.port = port
         self.download_folder = download_folder
@@ -193,6 +372,23 @@ class TCPClientLogic:
         self.sockets = []
         self.connected = False
         self.file_list = []
+        # "auto": Unix socket if the server is on this host, "unix": always, "tcp": never
+        self.transport = transport
+        self.pass_fds = LOCAL_PASS_FDS
+        self.local_sock = None
+        # "tcp": data on the 4 chunk sockets, "hybrid": data over UDP, control stays on TCP
+        self.transfer_mode = transfer_mode
+        # ask for holes and zero blocks as zero ranges ("SPARSE" instead of "GET")
+        self.sparse = SPARSE_TRANSFER
+        # TLS: one full handshake, the other 4 sockets resume its session
+        self.tls = tls
+        self.tls_ca = ca
+        self.tls_resume = True
+        # download scheduler: meters received bytes and holds them to its bandwidth budget
+        self.meter = None
+        # conditional GET: a local copy the server has the same version of is kept
+        self.conditional = CONDITIONAL_GET
+        self.hashes = HashCache(download_folder)
 
     def log(self, message):
         """Send log message to callback"""
@@ -200,25 +396,31 @@ class TCPClientLogic:
 
     def connect(self):
         """Connect to server and get file list"""
+        if self.transport != "tcp":
+            if self._connect_local():
+                return True
+            if self.transport == "unix":
+                return False
+
         try:
             # Create 5 connections
             self.sockets = []
-            for i in range(5):
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.connect((self.host, self.port))
-                self.sockets.append(sock)
-
-            self.log("Connected to server")
+            if self.tls:
+                self.sockets, resumed = connect_all(client_context(self.tls_ca), self.host, self.port, 5,
+                                                    resume=self.tls_resume)
+                self.log(f"Connected to server ({self.sockets[0].version()}, {resumed} of 4 sessions resumed)")
+                if self.transfer_mode == "hybrid":
+                    self.log("Hybrid data would be plain UDP: downloading over the TLS sockets instead")
+            else:
+                for i in range(5):
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.connect((self.host, self.port))
+                    self.sockets.append(sock)
+                self.log("Connected to server")
 
             # Receive file list
             file_list_data = self.sockets[4].recv(4096).decode()
-            self.file_list = []
-
-            for line in file_list_data.splitlines():
-                if line.startswith("List of files:"):
-                    continue
-                if " - " in line:
-                    self.file_list.append(line)
+            self._parse_file_list(file_list_data)
 
             self.log(f"Received file list: {len(self.file_list)} files")
             self.connected = True
@@ -229,30 +431,111 @@ class TCPClientLogic:
             self.disconnect()
             return False
 
+    def _parse_file_list(self, file_list_data):
+        self.file_list = []
+        for line in file_list_data.splitlines():
+            if line.startswith("List of files:"):
+                continue
+            if " - " in line:
+                self.file_list.append(line)
+
+    def _connect_local(self):
+        """Use the server's Unix socket instead of 5 TCP connections when it is on this host"""
+        if not HAS_UNIX:
+            return False
+        if self.transport == "auto" and not (LOCAL_TRANSPORT and is_local_host(self.host)):
+            return False
+
+        path = socket_path(self.port)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            file_list_data, _ = recv_message(sock)
+            if file_list_data is None:
+                raise ConnectionError("server closed the connection")
+        except OSError as e:
+            sock.close()
+            if self.transport == "unix":
+                self.log(f"Connection failed: {e}")
+            return False
+
+        self.local_sock = sock
+        self._parse_file_list(file_list_data)
+        self.log(f"Connected to server over {path}")
+        self.log(f"Received file list: {len(self.file_list)} files")
+        self.connected = True
+        return True
+
     def disconnect(self):
         """Disconnect from server"""
-        for sock in self.sockets:
+        for sock in self.sockets + [self.local_sock]:
             try:
                 sock.close()
             except:
                 pass
         self.sockets = []
+        self.local_sock = None
         self.connected = False
         self.log("Disconnected")
 
     def download_file(self, filename):
-        """Download a single file"""
+        """Download a single file, unless the local copy is already the server's version"""
         if not self.connected:
             self.log("Not connected to server")
             return False
 
+        remote = None
+        if self.conditional:
+            try:
+                unchanged, remote = check_local(self.hashes, filename, self._stat)
+            except Exception as e:
+                self.log(f"Download failed: {e}")
+                return False
+            if unchanged:
+                self.log(f"{filename} not modified, kept the local copy")
+                if self.meter:
+                    self.meter.unchanged = True
+                return True
+
+        if self.local_sock is not None:
+            ok = self._download_local(filename)
+        elif self.transfer_mode == "hybrid" and not self.tls:
+            ok = self._download_hybrid(filename)
+        else:
+            ok = self._download_tcp(filename)
+        # stamped with the server's mtime and digest: the next check costs no hashing
+        if ok and remote is not None:
+            self.hashes.adopt(filename, remote)
+        return ok
+
+    def _stat(self, request):
+        """One STAT exchange, over the Unix socket or the control socket"""
+        if self.local_sock is not None:
+            send_message(self.local_sock, request)
+            reply, _ = recv_message(self.local_sock)
+            if reply is None:
+                raise ConnectionError("server closed the connection")
+            return reply
+        self.sockets[4].sendall(f"{request}\n".encode())
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = self.sockets[4].recv(1024)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            reply += data
+        return reply.decode().strip()
+
+    def _download_tcp(self, filename):
+        """Download over the 4 data sockets"""
         try:
             # Send request
-            msg = f"GET {filename}"
+            msg = f"{'SPARSE' if self.sparse else 'GET'} {filename}"
             self.sockets[4].send(msg.encode())
 
-            # Get response
+            # Get response; for a small file the completion message may already follow it
             response = self.sockets[4].recv(1024).decode()
+            started = f"Downloading {filename}!"
+            response, completion = (started, response[len(started):]) if response.startswith(started) else (response, "")
             self.log(f"Server: {response}")
 
             if "not exist" in response:
@@ -263,41 +546,135 @@ class TCPClientLogic:
             if not file_size:
                 return False
 
-            # Receive file in chunks
+            # Receive file in chunks, each streamed to its place in the preallocated file
             chunk_size = file_size // 4
-            chunks = [b""] * 4
+            output = OutputFile(os.path.join(self.download_folder, filename), file_size)
             threads = []
+            completed = []
 
-            for i in range(4):
-                expected_size = chunk_size if i < 3 else (file_size - 3 * chunk_size)
-                thread = Thread(
-                    target=self._receive_chunk,
-                    args=(i, expected_size, chunks),
-                    daemon=True
-                )
-                threads.append(thread)
-                thread.start()
-
-            for thread in threads:
-                thread.join()
-
-            # Merge chunks and save
-            file_data = b"".join(chunks)
-            output_path = os.path.join(self.download_folder, filename)
+            def receive(*args):
+                if self._receive_chunk(*args):
+                    completed.append(args[0])
 
-            with open(output_path, 'wb') as f:
-                f.write(file_data)
+            try:
+                for i in range(4):
+                    expected_size = chunk_size if i < 3 else (file_size - 3 * chunk_size)
+                    thread = Thread(
+                        target=receive,
+                        args=(i, i * chunk_size, expected_size, output),
+                        daemon=True
+                    )
+                    threads.append(thread)
+                    thread.start()
+
+                for thread in threads:
+                    thread.join()
+            finally:
+                output.close()
+
+            # Get completion message
+            if not completion:
+                completion = self.sockets[4].recv(1024).decode()
+            self.log(f"Server: {completion}")
+
+            if len(completed) < 4:
+                self.log(f"Download failed: {4 - len(completed)} chunks incomplete")
+                return False
+            self.log(f"Downloaded {filename} successfully")
+            return True
+
+        except Exception as e:
+            self.log(f"Download failed: {e}")
+            return False
+
+    def _download_hybrid(self, filename):
+        """Download with UDP data: the server streams, we report the gaps over the control socket"""
+        try:
+            self.sockets[4].send(f"HYBRID {filename}".encode())
+            response = self.sockets[4].recv(1024).decode()
+            if not response.startswith("HYBRID "):
+                self.log(f"Server: {response}")
+                return False
+
+            _, file_size, udp_port, transfer_id = response.split()
+            file_size = int(file_size)
+            output = OutputFile(os.path.join(self.download_folder, filename), file_size)
+            receiver = HybridReceiver(self.sockets[4], (self.host, int(udp_port)), int(transfer_id),
+                                      on_progress=self._file_progress(file_size))
+            try:
+                chunk = receiver.receive(output, file_size)
+            finally:
+                receiver.close()
+                output.close()
 
             # Get completion message
             completion = self.sockets[4].recv(1024).decode()
             self.log(f"Server: {completion}")
 
+            self.log(f"Downloaded {filename} successfully ({chunk.count} packets over UDP)")
+            return True
+
+        except Exception as e:
+            self.log(f"Download failed: {e}")
+            return False
+
+    def _download_local(self, filename):
+        """Download over the Unix socket: copy from a passed descriptor or read the stream"""
+        fds = []
+        try:
+            verb = "OPEN" if self.pass_fds and HAS_FD_PASSING else "GET"
+            send_message(self.local_sock, f"{verb} {filename}")
+            response, fds = recv_message(self.local_sock)
+            if response is None:
+                raise ConnectionError("server closed the connection")
+            if not response.startswith(("FILE ", "DATA ")):
+                self.log(f"Server: {response}")
+                return False
+            fields = response.split()
+            if len(fields) != 2 or not fields[1].isdigit() or (response.startswith("FILE ") and not fds):
+                raise ValueError(f"bad reply from server: {response!r}")
+
+            # the reply is good: only now is the local copy truncated
+            file_size = int(fields[1])
+            output_path = os.path.join(self.download_folder, filename)
+            fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                if fds:
+                    received = copy_fd(fds[0], fd, file_size, self._file_progress(file_size))
+                else:
+                    received = recv_file(self.local_sock, fd, file_size, self._file_progress(file_size))
+            finally:
+                os.close(fd)
+
+            if received != file_size:
+                self.log(f"Download failed: {received} of {file_size} bytes")
+                return False
             self.log(f"Downloaded {filename} successfully")
             return True
 
         except Exception as e:
             self.log(f"Download failed: {e}")
             return False
+        finally:
+            for passed in fds:
+                os.close(passed)
+
+    def _file_progress(self, file_size):
+        """
+        on_progress for the hybrid and local paths, which report the whole file's
+        percentage. The meter only counts those bytes: UDP data is paced by the
+        server, and a same-host copy takes no network bandwidth
+        """
+        counted = 0
+
+        def report(percent):
+            nonlocal counted
+            self.on_progress(percent)
+            if self.meter:
+                received = int(file_size * percent / 100)
+                self.meter.skip(received - counted)
+                counted = received
+        return report
 
     def _get_file_size(self, filename):
         """Extract file size from file list"""
@@ -307,25 +684,36 @@ class TCPClientLogic:
                 return int(size_str)
         return None
 
-    def _receive_chunk(self, chunk_id, expected_size, chunks):
-        """Receive a chunk of file"""
+    def _receive_chunk(self, chunk_id, start, expected_size, output):
+        """Receive a chunk of file into output at start"""
         try:
+            if self.sparse:
+                received, zero_bytes = recv_records(self.sockets[chunk_id], output, start, expected_size,
+                                                    lambda n: self.on_progress(n / expected_size * 100),
+                                                    self.meter)
+                self.log(f"Chunk {chunk_id} received: {received} bytes ({zero_bytes} as zero ranges)")
+                return received == expected_size
+
             received = 0
-            data = b""
+            buffer = bytearray(64 * 1024)
+            view = memoryview(buffer)
 
             while received < expected_size:
-                chunk = self.sockets[chunk_id].recv(min(8192, expected_size - received))
-                if not chunk:
+                n = self.sockets[chunk_id].recv_into(view[:min(len(buffer), expected_size - received)])
+                if not n:
                     break
-                data += chunk
-                received += len(chunk)
+                output.write(start + received, view[:n])
+                received += n
+                if self.meter:
+                    self.meter.add(n)
 
                 # Report progress
                 progress = (received / expected_size) * 100
                 self.on_progress(progress)
 
-            chunks[chunk_id] = data
             self.log(f"Chunk {chunk_id} received: {received} bytes")
+            return received == expected_size
 
         except Exception as e:
             self.log(f"Error receiving chunk {chunk_id}: {e}")
+            return False
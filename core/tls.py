@@ -0,0 +1,103 @@
+"""
+TLS - encrypted control and data sockets, one full handshake per client
+The client's first socket does the full handshake and waits for the
+server's session ticket, then its other sockets resume that session, so a
+1+4 socket client pays for one certificate exchange instead of five
+"""
+
+import select
+import socket
+import ssl
+import time
+
+from core.constants import TLS_CERT, TLS_KEY, TLS_CA, TLS_HANDSHAKE_TIMEOUT
+
+
+def server_context(cert=TLS_CERT, key=TLS_KEY):
+    """Server side TLS 1.2+ context; session tickets are on, so clients can resume"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def client_context(ca=TLS_CA):
+    """Client side context verifying the server against ca (None: the system CAs)"""
+    context = ssl.create_default_context(cafile=ca)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+
+def server_handshake(context, sock, timeout=TLS_HANDSHAKE_TIMEOUT):
+    """Server side handshake on an accepted socket, returns the TLS socket"""
+    # the session tickets go out right after the handshake: with Nagle, the
+    # first reply behind them would wait for the client's delayed ACK
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(timeout)
+    try:
+        tls_sock = context.wrap_socket(sock, server_side=True)
+    except (OSError, ssl.SSLError):
+        sock.close()
+        raise
+    tls_sock.settimeout(None)
+    return tls_sock
+
+
+def connect(context, host, port, session=None, timeout=TLS_HANDSHAKE_TIMEOUT):
+    """One TLS connection to host:port, resuming session if given"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        tls_sock = context.wrap_socket(sock, server_hostname=host, session=session)
+    except (OSError, ssl.SSLError):
+        sock.close()
+        raise
+    tls_sock.settimeout(None)
+    return tls_sock
+
+
+def connect_all(context, host, port, count, resume=True, timeout=TLS_HANDSHAKE_TIMEOUT):
+    """
+    count TLS connections to host:port, opened one after another: the first
+    does the full handshake, the others resume its session
+
+    Returns:
+        (sockets, how many of the others resumed)
+    """
+    socks = [connect(context, host, port, timeout=timeout)]
+    try:
+        session = wait_session(socks[0], timeout) if resume else None
+        for _ in range(count - 1):
+            socks.append(connect(context, host, port, session, timeout))
+    except (OSError, ssl.SSLError):
+        for sock in socks:
+            sock.close()
+        raise
+    return socks, sum(sock.session_reused for sock in socks[1:])
+
+
+def wait_session(sock, timeout=TLS_HANDSHAKE_TIMEOUT):
+    """
+    A resumable session of sock, None if the server gave none in time.
+    TLS 1.3 tickets come after the handshake: they are read in here, so the
+    server must not send data on sock before the client asks for it
+    """
+    if sock.version() != "TLSv1.3":
+        # TLS 1.2: session id or ticket came with the handshake
+        return sock.session
+    deadline = time.monotonic() + timeout
+    sock.setblocking(False)
+    try:
+        while not sock.session.has_ticket:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            select.select([sock], [], [], remaining)
+            try:
+                if not sock.recv(1):
+                    return None
+            except ssl.SSLWantReadError:
+                # only the ticket records, no data
+                pass
+    finally:
+        sock.setblocking(True)
+    return sock.session
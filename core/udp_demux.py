@@ -0,0 +1,125 @@
+"""
+UDP Demultiplexer - single reader for a shared server socket
+Routes incoming datagrams to per-flow queues so that concurrent senders
+never steal each other's ACKs or control messages
+"""
+
+import socket
+import threading
+from queue import Queue, Empty
+from threading import Thread
+
+from core.constants import PACKET_SIZE, TIMEOUT, UDP_FAST_PATH
+from core.udp_io import BatchIO
+
+
+class UDPDemux:
+    """Owns every recvfrom on a socket and dispatches datagrams by address"""
+
+    def __init__(self, sock, on_unrouted=None, packet_size=PACKET_SIZE, fast_path=UDP_FAST_PATH):
+        self.sock = sock
+        self.io = BatchIO(sock, fast_path)
+        self.on_unrouted = on_unrouted or (lambda data, address: None)
+        self.packet_size = packet_size
+        self.running = False
+        self.lock = threading.Lock()
+        self.flows = {}     # flow key -> Queue of (data, address)
+        self.routes = {}    # client address -> flow key
+        self.thread = None
+
+    def start(self):
+        """Start the receive thread"""
+        self.sock.settimeout(TIMEOUT)
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the receive thread (the socket is left to its owner)"""
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    # =========================
+    # FLOW TABLE
+    # =========================
+    def open_flow(self, key):
+        """Create a queue for a flow, e.g. (transfer_id, chunk_id)"""
+        with self.lock:
+            if key not in self.flows:
+                self.flows[key] = Queue()
+        return key
+
+    def close_flow(self, key):
+        """Drop a flow and every address routed to it"""
+        with self.lock:
+            self.flows.pop(key, None)
+            for address in [a for a, k in self.routes.items() if k == key]:
+                del self.routes[address]
+
+    def has_flow(self, key):
+        with self.lock:
+            return key in self.flows
+
+    def bind(self, address, key):
+        """Route all further datagrams from address to the flow"""
+        with self.lock:
+            if key in self.flows:
+                self.routes[address] = key
+                return True
+            return False
+
+    def deliver(self, key, data, address):
+        """Hand a datagram to a flow (used by on_unrouted handlers)"""
+        with self.lock:
+            flow = self.flows.get(key)
+        if flow is not None:
+            flow.put((data, address))
+            return True
+        return False
+
+    def recv(self, key, timeout=TIMEOUT):
+        """Receive the next datagram of a flow, raising socket.timeout like recvfrom"""
+        with self.lock:
+            flow = self.flows.get(key)
+        if flow is None:
+            raise socket.timeout("flow closed")
+        try:
+            return flow.get(timeout=timeout)
+        except Empty:
+            raise socket.timeout("timed out")
+
+    def sendto(self, data, address):
+        return self.sock.sendto(data, address)
+
+    def send_batch(self, packets, address):
+        self.io.send_batch(packets, address)
+
+    # =========================
+    # RECEIVE LOOP
+    # =========================
+    def _run(self):
+        while self.running:
+            try:
+                datagrams, address = self.io.recv_batch(self.packet_size)
+            except socket.timeout:
+                continue
+            except ConnectionResetError:
+                continue
+            except OSError:
+                # socket closed by owner
+                break
+
+            for data in datagrams:
+                # looked up per datagram: an unrouted JOIN may bind the rest of a GRO train
+                with self.lock:
+                    key = self.routes.get(address)
+                    flow = self.flows.get(key) if key is not None else None
+
+                if flow is not None:
+                    flow.put((data, address))
+                    continue
+                try:
+                    self.on_unrouted(data, address)
+                except Exception as e:
+                    print(f"Error dispatching datagram from {address}: {e}")
@@ -0,0 +1,81 @@
+"""
+UDP Batched I/O - Linux GSO/GRO fast path
+Sends runs of equal-sized datagrams with a single sendmsg (UDP_SEGMENT) and
+receives kernel-coalesced datagrams (UDP_GRO), falling back to per-packet
+sendto/recvfrom wherever the platform or kernel does not support it
+"""
+
+import socket
+import struct
+import sys
+
+from core.protocol import segment_runs, split_segments
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+
+# Kernel limits for one GSO super-datagram
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+GRO_BUFFER_SIZE = 65535
+
+
+class BatchIO:
+    """Batched datagram I/O on one UDP socket"""
+
+    def __init__(self, sock, fast_path=True):
+        self.sock = sock
+        linux = sys.platform.startswith("linux") and hasattr(sock, "sendmsg")
+        self.gso = fast_path and linux
+        self.gro = False
+
+        if fast_path and linux:
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+                self.gro = True
+            except OSError:
+                pass
+
+    def send_batch(self, packets, address):
+        """Send datagrams in order, as few syscalls as the kernel allows"""
+        if not self.gso:
+            for packet in packets:
+                self.sock.sendto(packet, address)
+            return
+
+        for segment_size, run in segment_runs(packets, GSO_MAX_SEGMENTS, GSO_MAX_BYTES):
+            if len(run) == 1:
+                self.sock.sendto(run[0], address)
+                continue
+            try:
+                self.sock.sendmsg(
+                    [b"".join(run)],
+                    [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", segment_size))],
+                    0, address
+                )
+            except OSError:
+                # no GSO on this kernel/device: per-packet from now on
+                self.gso = False
+                for packet in run:
+                    self.sock.sendto(packet, address)
+
+    def recv_batch(self, bufsize):
+        """
+        Receive one datagram, or one GRO train of datagrams from one sender.
+
+        Returns:
+            ([data, ...], address)
+        """
+        if not self.gro:
+            data, address = self.sock.recvfrom(bufsize)
+            return [data], address
+
+        data, ancdata, _, address = self.sock.recvmsg(
+            max(bufsize, GRO_BUFFER_SIZE), socket.CMSG_SPACE(4)
+        )
+        for level, kind, value in ancdata:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment_size = struct.unpack("=i", value[:4])[0]
+                return split_segments(data, segment_size), address
+        return [data], address
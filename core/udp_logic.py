@@ -5,9 +5,24 @@ Provides core UDP functionality for GUI or other interfaces
 
 import socket
 import os
+import time
 import hashlib
 from threading import Thread
 import threading
+from collections import deque
+
+from core.udp_demux import UDPDemux
+from core.mtu import choose_packet_size, path_mtu, probe_reply, IP_UDP_HEADERS, MIN_PACKET_SIZE
+from core.rtt import RTTEstimator
+from core.worker_pool import KeyedWorkerPool
+from core.udp_io import BatchIO
+from core.protocol import encode_ranges, decode_ranges, PACKET_OVERHEAD
+from core.reassembly import OutputFile, ChunkReassembler
+from core.pacing import Pacer
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.sparse import ZeroMap, create_zero_packet, parse_zero_packet
+from core.hash_cache import HashCache, stat_reply, stat_datagram, check_local
+from core.constants import UDP_WORKERS, UDP_TRANSFER_WORKERS, UDP_PACING, BLAST_BATCH, NAK_INTERVAL, SPARSE_TRANSFER, CONDITIONAL_GET
 
 
 class UDPServerLogic:
@@ -20,28 +35,62 @@ class UDPServerLogic:
         self.on_log = on_log or (lambda msg: print(msg))
         self.running = False
         self.server_socket = None
+        self.demux = None
+        self.pool = None        # control messages
+        self.transfers = None   # chunk sends, which run for the whole transfer
         self.PACKET_SIZE = 8192
         self.DATA_SIZE = self.PACKET_SIZE - 100
         self.TIMEOUT = 0.1
         self.MAX_TRIES = 100
+        self.rtt = {}  # client host -> RTTEstimator, shared by its chunk flows
+        self.rtt_lock = threading.Lock()
+        self.pacing = UDP_PACING
+        self.files = OpenFileTable()   # shared, reference-counted descriptors
+        self.cache = shared_cache()    # process-wide block cache, BLOCK_CACHE_SIZE budget
+        self.blast = {"packets": 0, "resent": 0}  # NAK mode totals
+        self.hashes = HashCache(folder_path)  # file digests for STAT, kept in sidecar files
 
     def log(self, message):
         """Send log message to callback"""
         self.on_log(message)
 
+    def get_stats(self):
+        """Live RTT/RTO per client host, NAK mode totals, file/block cache, worker pool load, threads and CPU time"""
+        with self.rtt_lock:
+            rtt = {address: rtt.snapshot() for address, rtt in self.rtt.items()}
+            blast = dict(self.blast)
+        return {
+            "rtt": rtt,
+            "blast": blast,
+            "files": self.files.stats(),
+            "cache": self.cache.stats(),
+            "pool": self.pool.stats() if self.pool else None,
+            "transfers": self.transfers.stats() if self.transfers else None,
+            "threads": threading.active_count(),
+            "cpu_seconds": time.process_time(),
+        }
+
     def start(self):
         """Start the UDP server"""
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.settimeout(self.TIMEOUT)
             self.running = True
 
             self.log(f"UDP Server started on {self.host}:{self.port}")
 
-            # Start handling clients
-            handle_thread = Thread(target=self._handle_clients, daemon=True)
-            handle_thread.start()
+            # Requests run on fixed pools, in order per client socket
+            self.pool = KeyedWorkerPool(UDP_WORKERS,
+                                        on_error=lambda key, e: self.log(f"Error processing message: {e}"))
+            self.pool.start()
+            self.transfers = KeyedWorkerPool(UDP_TRANSFER_WORKERS,
+                                             on_error=lambda key, e: self.log(f"Error processing message: {e}"))
+            self.transfers.start()
+
+            # One reader thread routes ACKs to their flows, new requests to _handle_clients
+            self.demux = UDPDemux(self.server_socket, on_unrouted=self._handle_clients,
+                                  packet_size=self.PACKET_SIZE)
+            self.demux.start()
 
             return True
         except Exception as e:
@@ -51,6 +100,13 @@ class UDPServerLogic:
     def stop(self):
         """Stop the server"""
         self.running = False
+        if self.demux:
+            self.demux.stop()
+        if self.pool:
+            self.pool.stop()
+        if self.transfers:
+            self.transfers.stop()
+        self.files.close()
         if self.server_socket:
             try:
                 self.server_socket.close()
@@ -71,25 +127,19 @@ class UDPServerLogic:
             self.log(f"Error getting file list: {e}")
             return []
 
-    def _handle_clients(self):
-        """Handle incoming UDP requests"""
-        while self.running:
-            try:
-                data, client_address = self.server_socket.recvfrom(self.PACKET_SIZE)
-
-                # Handle message in separate thread
-                thread = Thread(
-                    target=self._process_message,
-                    args=(data, client_address),
-                    daemon=True
-                )
-                thread.start()
-
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    self.log(f"Error receiving data: {e}")
+    def _handle_clients(self, data, client_address):
+        """Handle a datagram that does not belong to any active flow"""
+        if not self.running:
+            return
+        # Path MTU probes are echoed at once, they must not queue behind anything
+        reply = probe_reply(data)
+        if reply is not None:
+            self.server_socket.sendto(reply, client_address)
+            return
+        # Queue on a worker pool, keyed by client socket so its requests stay ordered.
+        # Chunk requests hold their worker for the whole send: they get a pool of their own
+        pool = self.transfers if b"|" in data and not data.startswith((b"NAK|", b"DONE|")) else self.pool
+        pool.submit(client_address, self._process_message, data, client_address)
 
     def _process_message(self, data, client_address):
         """Process a message from client"""
@@ -103,18 +153,53 @@ class UDPServerLogic:
                 file_list_str = "List of files:\n" + "\n".join(file_list)
                 self._send_message(file_list_str, client_address)
 
+            # Conditional GET - does the client have this version already?
+            elif message.startswith("STAT ") and "|" not in message:
+                self._send_message(stat_reply(self.hashes, message), client_address)
+
             # File request
             elif "|" in message:
                 parts = message.split("|")
+                if parts[0] in ("NAK", "DONE"):
+                    # Late report for a NAK mode flow that has already ended
+                    return
                 if len(parts) >= 3:
                     filename = parts[0]
                     chunk_id = int(parts[1])
-                    self.log(f"File request from {client_address}: {filename} chunk {chunk_id}")
-                    self._send_file_chunk(filename, chunk_id, client_address)
+                    if parts[2] == "BLAST":
+                        # NAK mode: packet offsets follow the client's size, so it is not capped
+                        packet_size = self._blast_packet_size(parts)
+                    else:
+                        packet_size = self._negotiate_packet_size(parts, client_address)
+                    self.log(f"File request from {client_address}: {filename} chunk {chunk_id}"
+                             f" ({packet_size}B packets, {parts[2]})")
+                    if parts[2] == "BLAST":
+                        # 5th field SPARSE: the client takes zero packets for runs of zeros
+                        sparse = len(parts) >= 5 and parts[4] == "SPARSE"
+                        self._blast_file_chunk(filename, chunk_id, client_address, packet_size, sparse)
+                    else:
+                        self._send_file_chunk(filename, chunk_id, client_address, packet_size)
 
         except Exception as e:
             self.log(f"Error processing message: {e}")
 
+    def _negotiate_packet_size(self, parts, client_address):
+        """Client's proposed packet size (4th request field), capped by our path MTU"""
+        packet_size = self.PACKET_SIZE
+        if len(parts) >= 4 and parts[3].isdigit():
+            packet_size = min(packet_size, int(parts[3]))
+        mtu = path_mtu(client_address)
+        if mtu:
+            packet_size = min(packet_size, mtu - IP_UDP_HEADERS)
+        return max(packet_size, MIN_PACKET_SIZE)
+
+    def _blast_packet_size(self, parts):
+        """Client's packet size for a BLAST request, within our limits"""
+        packet_size = self.PACKET_SIZE
+        if len(parts) >= 4 and parts[3].isdigit():
+            packet_size = min(packet_size, int(parts[3]))
+        return max(packet_size, MIN_PACKET_SIZE)
+
     def _send_message(self, message, client_address):
         """Send a message to client"""
         try:
@@ -122,57 +207,191 @@ class UDPServerLogic:
         except Exception as e:
             self.log(f"Error sending message: {e}")
 
-    def _send_file_chunk(self, filename, chunk_id, client_address):
+    def _send_file_chunk(self, filename, chunk_id, client_address, packet_size):
         """Send a file chunk to client"""
+        data_size = packet_size - (self.PACKET_SIZE - self.DATA_SIZE)
+        handle = None
+        reader = None
         try:
-            file_path = os.path.join(self.folder_path, filename)
-            if not os.path.exists(file_path):
+            # Shared descriptor; reads go through the block cache
+            try:
+                handle = self.files.acquire(os.path.join(self.folder_path, filename))
+            except OSError:
                 self.log(f"File not found: {filename}")
                 return
 
-            file_size = os.path.getsize(file_path)
+            file_size = handle.size
             chunk_size = file_size // 4
 
             start = chunk_id * chunk_size
             end = start + chunk_size if chunk_id < 3 else file_size
+            reader = ReadAhead(self.cache, handle, start, end - start)
+
+            # ACKs from this client socket are routed to our own queue
+            flow = self.demux.open_flow((client_address, chunk_id))
+            self.demux.bind(client_address, flow)
+            with self.rtt_lock:
+                rtt = self.rtt.setdefault(client_address[0], RTTEstimator(initial_rto=self.TIMEOUT))
+
+            sequence = 0
+
+            while start < end:
+                data = reader.read(start, min(data_size, end - start))
+                if not data:
+                    break
+
+                # Package with checksum
+                packet = self._create_packet(data, sequence, chunk_id)
+
+                # Send with retry logic, timeout adapts to the measured RTT
+                tries = 0
+                sends = 0
+                while tries < self.MAX_TRIES and self.running:
+                    self.server_socket.sendto(packet, client_address)
+                    sent_at = time.perf_counter()
+                    sends += 1
+
+                    # Wait for ACK
+                    try:
+                        ack_data, _ = self.demux.recv(flow, rtt.rto)
+                        ack = ack_data.decode(errors="ignore")
+
+                        if ack.isdigit() and int(ack) == sequence:
+                            # Karn: only packets sent once give an RTT sample
+                            if sends == 1:
+                                rtt.sample(time.perf_counter() - sent_at)
+                            break
+                    except socket.timeout:
+                        rtt.backoff()
+                        tries += 1
 
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                sequence = 0
-
-                while start < end:
-                    data = f.read(min(self.DATA_SIZE, end - start))
-                    if not data:
-                        break
+                start += len(data)
+                sequence += 1
 
-                    # Package with checksum
-                    packet = self._create_packet(data, sequence, chunk_id)
+            self.log(f"Sent chunk {chunk_id} of {filename} to {client_address} ({rtt})")
 
-                    # Send with retry logic
-                    tries = 0
-                    while tries < self.MAX_TRIES and self.running:
-                        self.server_socket.sendto(packet, client_address)
+        except Exception as e:
+            self.log(f"Error sending chunk: {e}")
+        finally:
+            self.demux.close_flow((client_address, chunk_id))
+            if reader is not None:
+                reader.close()
+            if handle is not None:
+                self.files.release(handle)
+
+    def _blast_file_chunk(self, filename, chunk_id, client_address, packet_size, sparse=False):
+        """Send a file chunk in NAK mode: stream it paced, then resend what the client reports missing"""
+        data_size = packet_size - (self.PACKET_SIZE - self.DATA_SIZE)
+        handle = None
+        reader = None
+        try:
+            # Shared descriptor; reads go through the block cache
+            try:
+                handle = self.files.acquire(os.path.join(self.folder_path, filename))
+            except OSError:
+                self.log(f"File not found: {filename}")
+                return
 
-                        # Wait for ACK
-                        try:
-                            self.server_socket.settimeout(self.TIMEOUT)
-                            ack_data, _ = self.server_socket.recvfrom(1024)
-                            ack = int(ack_data.decode())
+            file_size = handle.size
+            chunk_size = file_size // 4
 
-                            if ack == sequence:
+            start = chunk_id * chunk_size
+            end = start + chunk_size if chunk_id < 3 else file_size
+            reader = ReadAhead(self.cache, handle, start, end - start)
+            count = -(-(end - start) // data_size)
+            zeros = ZeroMap(handle.fd, start, end) if sparse else None
+            zero_packets = 0
+
+            # NAK/DONE reports from this client socket are routed to our own queue
+            flow = self.demux.open_flow((client_address, chunk_id))
+            self.demux.bind(client_address, flow)
+
+            pending = deque(range(count))  # sequence numbers still to (re)send
+            queued = set(pending)
+            resent = 0
+            delivered = 0                       # packets the client reported as received
+            report_at = time.perf_counter()
+            pacer = Pacer() if self.pacing else Pacer(rate=None)
+            batch_size = pacer.batch_size(packet_size, BLAST_BATCH)
+            last_report = time.monotonic()
+
+            while self.running:
+                batch = []
+                while pending and len(batch) < batch_size:
+                    sequence = pending.popleft()
+                    queued.discard(sequence)
+                    offset = start + sequence * data_size
+                    if zeros is None:
+                        data = reader.read(offset, min(data_size, end - offset))
+                    else:
+                        data = zeros.read(reader, offset, min(data_size, end - offset))
+                    if data is None:
+                        # one zero packet for this and the pending packets right after it that are zeros too
+                        last = sequence
+                        while pending and pending[0] == last + 1:
+                            offset = start + pending[0] * data_size
+                            if zeros.read(reader, offset, min(data_size, end - offset)) is not None:
                                 break
-                        except socket.timeout:
-                            tries += 1
-                        except:
-                            break
-
-                    start += len(data)
-                    sequence += 1
+                            last = pending.popleft()
+                            queued.discard(last)
+                        zero_packets += last - sequence + 1
+                        batch.append(create_zero_packet(sequence, last, chunk_id))
+                        continue
+                    batch.append(self._create_packet(data, sequence, chunk_id))
+
+                if batch:
+                    # Paced so the stream does not overrun switch and client buffers
+                    pacer.wait(sum(len(p) for p in batch))
+                    self.demux.send_batch(batch, client_address)
+
+                # Reports: polled while streaming, waited for once everything is out
+                try:
+                    report, _ = self.demux.recv(flow, 0 if pending else NAK_INTERVAL)
+                except socket.timeout:
+                    if not pending and time.monotonic() - last_report > self.MAX_TRIES * NAK_INTERVAL:
+                        self.log(f"No report from {client_address} for chunk {chunk_id}, giving up")
+                        return
+                    continue
 
-            self.log(f"Sent chunk {chunk_id} of {filename} to {client_address}")
+                last_report = time.monotonic()
+                fields = report.decode(errors="ignore").split("|")
+                if fields[0] == "DONE":
+                    self.server_socket.sendto(f"FIN|{chunk_id}".encode(), client_address)
+                    break
+                if fields[0] == "NAK" and len(fields) >= 3:
+                    missing = decode_ranges(fields[2], count)
+                    if len(fields) == 4 and fields[3].isdigit():
+                        # Received count gives a delivery rate sample for the pacer
+                        now = time.perf_counter()
+                        pacer.on_delivery((int(fields[3]) - delivered) * packet_size, now - report_at)
+                        delivered, report_at = int(fields[3]), now
+                elif len(fields) >= 3 and fields[2] == "BLAST":
+                    # Repeated request: nothing has reached the client yet
+                    missing = range(count)
+                else:
+                    continue
+                lost = 0
+                for sequence in missing:
+                    if sequence not in queued:
+                        pending.append(sequence)
+                        queued.add(sequence)
+                        lost += 1
+                resent += lost
+
+            self.log(f"Sent chunk {chunk_id} of {filename} to {client_address} "
+                     f"(NAK mode, {count} packets, {resent} resent, {zero_packets} as zeros, {pacer})")
+            with self.rtt_lock:
+                self.blast["packets"] += count
+                self.blast["resent"] += resent
 
         except Exception as e:
             self.log(f"Error sending chunk: {e}")
+        finally:
+            self.demux.close_flow((client_address, chunk_id))
+            if reader is not None:
+                reader.close()
+            if handle is not None:
+                self.files.release(handle)
 
     def _create_packet(self, data, sequence, chunk_id):
         """Create a packet with checksum"""
@@ -189,7 +408,7 @@ class UDPServerLogic:
 class UDPClientLogic:
     """Pure UDP client logic without CLI dependencies"""
 
-    def __init__(self, host, port, download_folder, on_log=None, on_progress=None):
+    def __init__(self, host, port, download_folder, on_log=None, on_progress=None, transfer_mode="ack"):
         self.host = host
         self.port = port
         self.download_folder = download_folder
@@ -197,9 +416,18 @@ class UDPClientLogic:
         self.on_progress = on_progress or (lambda p: None)
         self.server_address = (host, port)
         self.PACKET_SIZE = 8192
+        self.packet_size = self.PACKET_SIZE  # negotiated in connect()
         self.TIMEOUT = 0.2
         self.MAX_TRIES = 100
+        self.RCVBUF = 4 * 1024 * 1024  # NAK mode socket buffer, absorbs the stream's bursts
+        self.transfer_mode = transfer_mode  # "ack" (stop-and-wait) or "nak" (blast + NAK ranges)
+        self.sparse = SPARSE_TRANSFER       # NAK mode: runs of zeros come as one zero packet
         self.file_list = []
+        # download scheduler: meters received bytes and holds them to its bandwidth budget
+        self.meter = None
+        # conditional GET: a local copy the server has the same version of is kept
+        self.conditional = CONDITIONAL_GET
+        self.hashes = HashCache(download_folder)
 
     def log(self, message):
         """Send log message to callback"""
@@ -211,6 +439,10 @@ class UDPClientLogic:
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             sock.settimeout(2.0)
 
+            # Largest packet that crosses the path unfragmented
+            self.packet_size, method = choose_packet_size(sock, self.server_address, self.PACKET_SIZE)
+            self.log(f"Packet size: {self.packet_size} bytes ({method})")
+
             # Send PING
             sock.sendto("23120088".encode(), self.server_address)
             self.log("Sent PING to server")
@@ -234,8 +466,11 @@ class UDPClientLogic:
             self.log(f"Connection failed: {e}")
             return False
 
+    def disconnect(self):
+        """Nothing stays open between downloads: every chunk has its own socket"""
+
     def download_file(self, filename):
-        """Download a file from server"""
+        """Download a file from server, unless the local copy is already the server's version"""
         try:
             # Get file size
             file_size = self._get_file_size(filename)
@@ -243,31 +478,51 @@ class UDPClientLogic:
                 self.log(f"File size not found: {filename}")
                 return False
 
+            remote = None
+            if self.conditional:
+                unchanged, remote = check_local(self.hashes, filename,
+                                                lambda request: stat_datagram(self.server_address, request))
+                if unchanged:
+                    self.log(f"{filename} not modified, kept the local copy")
+                    if self.meter:
+                        self.meter.unchanged = True
+                    return True
+
             self.log(f"Downloading {filename} ({file_size} bytes)")
 
-            # Download 4 chunks in parallel
-            chunks = [b""] * 4
+            # Download 4 chunks in parallel, each writing straight into the output file
+            output = OutputFile(os.path.join(self.download_folder, filename), file_size)
             threads = []
 
-            for chunk_id in range(4):
-                thread = Thread(
-                    target=self._download_chunk,
-                    args=(filename, chunk_id, file_size, chunks),
-                    daemon=True
-                )
-                threads.append(thread)
-                thread.start()
-
-            for thread in threads:
-                thread.join()
+            download_chunk = self._blast_chunk if self.transfer_mode == "nak" else self._download_chunk
+            completed = []
 
-            # Merge and save
-            file_data = b"".join(chunks)
-            output_path = os.path.join(self.download_folder, filename)
-
-            with open(output_path, 'wb') as f:
-                f.write(file_data)
+            def receive(chunk_id):
+                if download_chunk(filename, chunk_id, file_size, output):
+                    completed.append(chunk_id)
 
+            try:
+                for chunk_id in range(4):
+                    thread = Thread(
+                        target=receive,
+                        args=(chunk_id,),
+                        daemon=True
+                    )
+                    threads.append(thread)
+                    thread.start()
+
+                for thread in threads:
+                    thread.join()
+            finally:
+                output.close()
+
+            if len(completed) < 4:
+                failed = sorted(set(range(4)) - set(completed))
+                self.log(f"Download failed: chunks {failed} incomplete")
+                return False
+            # stamped with the server's version: the next check costs no hashing
+            if remote is not None:
+                self.hashes.adopt(filename, remote)
             self.log(f"Downloaded {filename} successfully")
             return True
 
@@ -283,14 +538,14 @@ class UDPClientLogic:
                 return int(size_str)
         return None
 
-    def _download_chunk(self, filename, chunk_id, file_size, chunks):
+    def _download_chunk(self, filename, chunk_id, file_size, output):
         """Download a single chunk"""
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             sock.settimeout(self.TIMEOUT)
 
             # Send request for this chunk
-            request = f"{filename}|{chunk_id}|REQUEST"
+            request = f"{filename}|{chunk_id}|REQUEST|{self.packet_size}"
             sock.sendto(request.encode(), self.server_address)
 
             # Calculate chunk size
@@ -299,47 +554,152 @@ class UDPClientLogic:
             end = start + chunk_size if chunk_id < 3 else file_size
             expected_size = end - start
 
-            # Receive packets
-            received_bytes = 0
-            chunk_data = b""
-            ack = 0
+            # The server may cap our packet size, so packet 0 tells the data size per packet
+            chunk = ChunkReassembler(output, start, 0, 1) if expected_size == 0 else None
+            last_ack = -1
 
-            while received_bytes < expected_size:
+            while chunk is None or not chunk.complete():
                 try:
                     packet, _ = sock.recvfrom(self.PACKET_SIZE)
 
                     if packet.count(b"|") >= 3:
-                        parts = packet.split(b"|", maxsplit=3)
-                        seq_str = parts[0].decode()
-                        checksum = parts[1].decode()
-                        data = parts[3]
+                        seq_str, checksum, _, data = packet.split(b"|", maxsplit=3)
 
                         # Verify checksum
-                        if self._verify_checksum(data, checksum):
-                            if int(seq_str) == ack:
-                                chunk_data += data
-                                received_bytes += len(data)
-
-                                # Send ACK
-                                sock.sendto(str(ack).encode(), self.server_address)
-                                ack += 1
-
-                                # Update progress
-                                progress = (received_bytes / expected_size) * 100
-                                self.on_progress(progress)
-                            else:
-                                # Send previous ACK
-                                sock.sendto(str(ack - 1).encode(), self.server_address)
-                        else:
-                            # Bad checksum, request resend
-                            sock.sendto(str(ack - 1).encode(), self.server_address)
+                        if seq_str.isdigit() and self._verify_checksum(data, checksum.decode(errors="ignore")):
+                            seq = int(seq_str)
+                            if chunk is None and seq == 0:
+                                chunk = ChunkReassembler(output, start, expected_size, len(data))
+                            if chunk is not None:
+                                if chunk.add(seq, data):
+                                    if self.meter:
+                                        self.meter.add(len(data))
+                                    # Update progress
+                                    progress = (chunk.received_bytes / expected_size) * 100
+                                    self.on_progress(progress)
+
+                                # Send ACK, duplicates too (our ACK may have been lost)
+                                sock.sendto(seq_str, self.server_address)
+                                last_ack = seq
+                                continue
+
+                    # Bad packet, repeat the last ACK so the server resends at once
+                    sock.sendto(str(last_ack).encode(), self.server_address)
 
                 except socket.timeout:
                     continue
 
-            chunks[chunk_id] = chunk_data
             sock.close()
-            self.log(f"Chunk {chunk_id} received: {received_bytes} bytes")
+            self.log(f"Chunk {chunk_id} received: {chunk.received_bytes} bytes")
+            return True
+
+        except Exception as e:
+            self.log(f"Error downloading chunk {chunk_id}: {e}")
+
+    def _blast_chunk(self, filename, chunk_id, file_size, output):
+        """Download a single chunk in NAK mode: the server streams, we report the gaps"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF)
+            sock.settimeout(NAK_INTERVAL)
+            io = BatchIO(sock)
+
+            # Calculate chunk size
+            chunk_size = file_size // 4
+            start = chunk_id * chunk_size
+            end = start + chunk_size if chunk_id < 3 else file_size
+            expected_size = end - start
+
+            # Packets land at their offset in the file, the bit array is the receive bitmap
+            chunk = ChunkReassembler(output, start, expected_size, self.packet_size - PACKET_OVERHEAD)
+            highest = -1
+
+            request = f"{filename}|{chunk_id}|BLAST|{self.packet_size}"
+            request = (request + "|SPARSE" if self.sparse else request).encode()
+            sock.sendto(request, self.server_address)
+            last_packet = last_report = time.monotonic()
+
+            while not chunk.complete():
+                try:
+                    datagrams, _ = io.recv_batch(self.PACKET_SIZE)
+                except socket.timeout:
+                    datagrams = []
+                now = time.monotonic()
+
+                for packet in datagrams:
+                    if packet.startswith(b"Z|"):
+                        # a run of packets that are all zero bytes
+                        run = parse_zero_packet(packet)
+                        zero_from = chunk.received_bytes
+                        if run is None or not chunk.add_zeros(*run):
+                            continue
+                        if self.meter:
+                            self.meter.skip(chunk.received_bytes - zero_from)
+                        highest = max(highest, run[1])
+                        last_packet = now
+                        self.on_progress((chunk.received_bytes / expected_size) * 100)
+                        continue
+                    if packet.count(b"|") < 3:
+                        continue
+                    seq_str, checksum, _, data = packet.split(b"|", maxsplit=3)
+                    if not seq_str.isdigit():
+                        continue
+                    if not self._verify_checksum(data, checksum.decode(errors="ignore")):
+                        continue
+                    if not chunk.add(int(seq_str), data):
+                        continue
+                    if self.meter:
+                        self.meter.add(len(data))
+                    highest = max(highest, int(seq_str))
+                    last_packet = now
+
+                    # Update progress
+                    progress = (chunk.received_bytes / expected_size) * 100
+                    self.on_progress(progress)
+
+                if chunk.complete():
+                    break
+                if now - last_packet > self.MAX_TRIES * NAK_INTERVAL:
+                    raise TimeoutError("server stopped sending")
+
+                if highest < 0:
+                    # Nothing yet, the request may have been lost
+                    if now - last_report >= self.TIMEOUT:
+                        sock.sendto(request, self.server_address)
+                        last_report = now
+                elif now - last_report >= NAK_INTERVAL:
+                    # While packets keep coming only the gaps behind the newest one are losses;
+                    # the received count lets the server pace to our delivery rate
+                    limit = highest + 1 if now - last_packet < NAK_INTERVAL else chunk.count
+                    ranges = chunk.missing_ranges(limit)
+                    header = f"NAK|{chunk_id}|"
+                    # zero runs took no bandwidth: they stay out of the delivery rate
+                    trailer = f"|{chunk.received.count - chunk.zero_packets}"
+                    nak = header + encode_ranges(ranges, self.packet_size - len(header) - len(trailer)) + trailer
+                    sock.sendto(nak.encode(), self.server_address)
+                    last_report = now
+
+            # Complete: stop the server, packets still in flight are ignored
+            done = f"DONE|{chunk_id}".encode()
+            fin = f"FIN|{chunk_id}".encode()
+            tries = 0
+            resend_at = 0
+            while tries < 3:
+                if time.monotonic() >= resend_at:
+                    sock.sendto(done, self.server_address)
+                    tries += 1
+                    resend_at = time.monotonic() + self.TIMEOUT
+                try:
+                    reply, _ = sock.recvfrom(self.PACKET_SIZE)
+                except socket.timeout:
+                    continue
+                if reply == fin:
+                    break
+
+            sock.close()
+            self.log(f"Chunk {chunk_id} received: {chunk.received_bytes} bytes (NAK mode"
+                     + (f", {chunk.zero_packets} packets as zeros)" if chunk.zero_packets else ")"))
+            return True
 
         except Exception as e:
             self.log(f"Error downloading chunk {chunk_id}: {e}")
@@ -0,0 +1,363 @@
+"""
+UDP Multicast Logic - push one file to many receivers at once
+The file is streamed once to a multicast group; every receiver repairs its own
+losses by unicast NAK to the sender, which merges the NAKs of a round and
+multicasts each missing packet only once
+"""
+
+import os
+import random
+import socket
+import struct
+import time
+
+from core.udp_io import BatchIO
+from core.udp_async import create_packet
+from core.protocol import encode_ranges, decode_ranges, PACKET_OVERHEAD
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.reassembly import OutputFile, ChunkReassembler
+from core.pacing import Pacer
+from core.constants import PACKET_SIZE, UDP_PACING, BLAST_BATCH, NAK_INTERVAL, MAX_TRIES
+from utils.checksum import calculate_checksum
+
+# Quiet NAK rounds after which the sender assumes everyone is done
+LINGER_ROUNDS = 40
+# Packets a receiver keeps before the announcement: sessions, and packets per session
+EARLY_SESSIONS = 4
+EARLY_PACKETS = 4096
+
+
+def multicast_interface(host):
+    """Local interface address to send/join on (loopback when host is 127.x)"""
+    return socket.inet_aton(host or "0.0.0.0")
+
+
+class MulticastSender:
+    """Server side: stream a file to a group, serve merged NAK repairs"""
+
+    def __init__(self, host, group, port, folder_path, on_log=None, packet_size=1400, ttl=1,
+                 files=None, cache=None):
+        self.host = host
+        self.group = group
+        self.port = port
+        self.folder_path = folder_path
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.packet_size = min(packet_size, PACKET_SIZE)
+        self.data_size = self.packet_size - PACKET_OVERHEAD
+        self.ttl = ttl
+        self.pacing = UDP_PACING
+        # the file is read through shared descriptors and the block cache
+        self.files = files or OpenFileTable()
+        self.cache = cache or shared_cache()
+        self.running = False
+        self.sock = None
+        self.io = None
+        self.stats = {}
+
+    def log(self, message):
+        """Send log message to callback"""
+        self.on_log(message)
+
+    def open(self):
+        """Create the socket that multicasts data and receives unicast NAKs"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, multicast_interface(self.host))
+        self.sock.bind((self.host, 0))
+        self.io = BatchIO(self.sock)
+        self.running = True
+
+    def close(self):
+        self.running = False
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+
+    def push(self, filename, receivers=0):
+        """
+        Send filename to the group
+
+        Args:
+            receivers: stop as soon as this many receivers reported DONE
+                       (0: stop after LINGER_ROUNDS rounds without a NAK)
+
+        Returns:
+            stats dict: packets, repaired, rounds, naks, done
+        """
+        file_path = os.path.join(self.folder_path, filename)
+        try:
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(file_path)
+            handle = self.files.acquire(file_path)
+        except OSError:
+            self.log(f"File not found: {filename}")
+            return None
+        try:
+            return self._push(handle, filename, receivers)
+        finally:
+            self.files.release(handle)
+
+    def _push(self, handle, filename, receivers):
+        if self.sock is None:
+            self.open()
+
+        file_size = handle.size
+        count = -(-file_size // self.data_size)
+        session = random.getrandbits(31)
+        announce = f"ANNOUNCE|{session}|{filename}|{file_size}|{self.data_size}".encode()
+        stats = {"packets": count, "repaired": 0, "rounds": 0, "naks": 0, "done": 0}
+        done = set()
+        pacer = Pacer() if self.pacing else Pacer(rate=None)
+
+        self.log(f"Multicasting {filename} ({file_size} bytes, {count} packets) "
+                 f"to {self.group}:{self.port}, session {session}")
+
+        # repairs go back into the file: the reader serves any offset, through the cache
+        with ReadAhead(self.cache, handle, 0, file_size) as reader:
+            for _ in range(3):
+                self.sock.sendto(announce, (self.group, self.port))
+            self._stream(reader, range(count), session, file_size, pacer)
+            sent = count
+
+            quiet = 0
+            while self.running and quiet < LINGER_ROUNDS:
+                if receivers and len(done) >= receivers:
+                    break
+
+                # One round: merge every NAK that arrives within NAK_INTERVAL
+                repair = set()
+                naks = 0
+                deadline = time.monotonic() + NAK_INTERVAL
+                while time.monotonic() < deadline:
+                    self.sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                    try:
+                        # receivers fill NAKs up to PACKET_SIZE, whatever our data packet size
+                        report, address = self.sock.recvfrom(PACKET_SIZE)
+                    except socket.timeout:
+                        break
+                    fields = report.decode(errors="ignore").split("|")
+                    if len(fields) < 2 or fields[1] != str(session):
+                        continue
+                    if fields[0] == "DONE":
+                        done.add(address)
+                        self.sock.sendto(f"FIN|{session}".encode(), address)
+                    elif fields[0] == "NAK":
+                        naks += 1
+                        if len(fields) == 3:
+                            repair.update(decode_ranges(fields[2], count))
+
+                if not naks:
+                    quiet += 1
+                    continue
+                quiet = 0
+                stats["rounds"] += 1
+                stats["naks"] += naks
+                stats["repaired"] += len(repair)
+                # Merged loss of the round steers the pacing rate
+                pacer.on_loss(sent, len(repair))
+                sent = len(repair)
+
+                # Late joiners need the metadata, then each missing packet goes out once
+                self.sock.sendto(announce, (self.group, self.port))
+                self._stream(reader, sorted(repair), session, file_size, pacer)
+
+        stats["done"] = len(done)
+        self.stats = stats
+        self.log(f"Multicast of {filename} finished: {stats['done']} receivers done, "
+                 f"{stats['repaired']} packets repaired in {stats['rounds']} rounds "
+                 f"({stats['naks']} NAKs merged, {pacer})")
+        return stats
+
+    def _stream(self, reader, sequences, session, file_size, pacer):
+        """Multicast the given packets through the pacer"""
+        batch_size = pacer.batch_size(self.packet_size, BLAST_BATCH)
+        batch = []
+        for sequence in sequences:
+            offset = sequence * self.data_size
+            data = reader.read(offset, min(self.data_size, file_size - offset))
+            batch.append(create_packet(data, sequence, session))
+            if len(batch) == batch_size:
+                pacer.wait(sum(len(p) for p in batch))
+                self.io.send_batch(batch, (self.group, self.port))
+                batch = []
+
+        if batch:
+            pacer.wait(sum(len(p) for p in batch))
+            self.io.send_batch(batch, (self.group, self.port))
+
+
+class MulticastReceiver:
+    """Client side: join the group, save pushed files, NAK the gaps by unicast"""
+
+    def __init__(self, group, port, download_folder, interface="0.0.0.0",
+                 on_log=None, on_progress=None):
+        self.group = group
+        self.port = port
+        self.download_folder = download_folder
+        self.interface = interface
+        self.on_log = on_log or (lambda msg: print(msg))
+        self.on_progress = on_progress or (lambda p: None)
+        self.sock = None
+        self.report_sock = None
+        self.io = None
+
+    def log(self, message):
+        """Send log message to callback"""
+        self.on_log(message)
+
+    def open(self):
+        """Bind the group port and join the group, plus a unicast socket for NAK/DONE"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(("", self.port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), multicast_interface(self.interface))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.io = BatchIO(self.sock)
+
+        # Own port, so receivers sharing a host (and the group port) stay distinct to the sender
+        self.report_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.report_sock.settimeout(0.2)
+
+    def close(self):
+        for sock in (self.sock, self.report_sock):
+            if sock:
+                try:
+                    sock.close()
+                except:
+                    pass
+
+    def receive(self, timeout=None):
+        """
+        Wait for the next pushed file and save it to the download folder
+
+        Returns:
+            Saved file name, or None if nothing arrived within timeout
+        """
+        if self.sock is None:
+            self.open()
+        self.sock.settimeout(NAK_INTERVAL)
+
+        sender = None
+        session = None
+        filename = None
+        output = None
+        chunk = None         # the whole file as one chunk, written in place
+        early = {}           # packets that arrived before the announcement
+        highest = -1
+        started = last_packet = last_report = time.monotonic()
+
+        try:
+            while True:
+                try:
+                    datagrams, address = self.io.recv_batch(PACKET_SIZE)
+                except socket.timeout:
+                    datagrams, address = [], None
+                now = time.monotonic()
+
+                for packet in datagrams:
+                    if packet.startswith(b"ANNOUNCE|"):
+                        fields = packet.decode(errors="ignore").split("|")
+                        if len(fields) != 5 or (session is not None and fields[1] != session):
+                            continue
+                        if chunk is None:
+                            announced = self._parse_announce(fields)
+                            if announced is None:
+                                self.log(f"Ignored bad announcement from {address}: {fields[2:]}")
+                                continue
+                            sender, session = address, fields[1]
+                            filename, file_size, data_size = announced
+                            output = OutputFile(os.path.join(self.download_folder, filename), file_size)
+                            chunk = ChunkReassembler(output, 0, file_size, data_size)
+                            self.log(f"Receiving {filename} ({file_size} bytes) from {sender}")
+                            for seq, data in early.pop(session, {}).items():
+                                highest = self._store(chunk, seq, data, highest)
+                        continue
+
+                    if packet.count(b"|") < 3:
+                        continue
+                    seq_str, checksum, sid, data = packet.split(b"|", maxsplit=3)
+                    sid = sid.decode(errors="ignore")
+                    if not seq_str.isdigit() or calculate_checksum(data) != checksum.decode(errors="ignore"):
+                        continue
+                    if session is None:
+                        # Data before the announcement: keep some of it and remember who sends it
+                        sender = address
+                        if sid in early or len(early) < EARLY_SESSIONS:
+                            packets = early.setdefault(sid, {})
+                            if len(packets) < EARLY_PACKETS:
+                                packets[int(seq_str)] = data
+                        last_packet = now
+                        continue
+                    if sid != session:
+                        continue
+                    highest = self._store(chunk, int(seq_str), data, highest)
+                    last_packet = now
+
+                if chunk is not None and chunk.complete():
+                    break
+                if timeout is not None and sender is None and now - started > timeout:
+                    return None
+                if sender is not None and now - last_packet > MAX_TRIES * NAK_INTERVAL:
+                    self.log("Sender went silent, giving up")
+                    return None
+
+                # Report gaps every NAK_INTERVAL, jittered so receivers do not NAK in lockstep
+                if sender is not None and now - last_report >= NAK_INTERVAL * random.uniform(1.0, 1.5):
+                    if chunk is None:
+                        # Missed the announcement: an empty NAK makes the sender repeat it
+                        sid = next(iter(early), "")
+                        self.report_sock.sendto(f"NAK|{sid}".encode(), sender)
+                    else:
+                        # While packets keep coming only the gaps behind the newest one are losses
+                        limit = highest + 1 if now - last_packet < NAK_INTERVAL else chunk.count
+                        ranges = chunk.missing_ranges(limit)
+                        if ranges:
+                            header = f"NAK|{session}|"
+                            nak = header + encode_ranges(ranges, PACKET_SIZE - len(header))
+                            self.report_sock.sendto(nak.encode(), sender)
+                    last_report = now
+        finally:
+            if output is not None:
+                output.close()
+
+        self._finish(session, sender)
+        self.log(f"Received {filename} by multicast")
+        return filename
+
+    def _parse_announce(self, fields):
+        """(filename, file_size, data_size) of ANNOUNCE fields, None if they cannot be saved safely"""
+        # anyone on the group can announce: the name must stay inside the download folder
+        filename = os.path.basename(fields[2])
+        if not filename or filename in (".", "..") or filename != fields[2]:
+            return None
+        try:
+            file_size, data_size = int(fields[3]), int(fields[4])
+        except ValueError:
+            return None
+        if file_size < 0 or data_size <= 0:
+            return None
+        return filename, file_size, data_size
+
+    def _store(self, chunk, seq, data, highest):
+        """Place one packet, return the highest sequence number seen"""
+        if not chunk.add(seq, data):
+            return highest
+        self.on_progress(chunk.received.count / chunk.count * 100)
+        return max(highest, seq)
+
+    def _finish(self, session, sender):
+        """Tell the sender we are done and wait for its FIN"""
+        done = f"DONE|{session}".encode()
+        fin = f"FIN|{session}".encode()
+        for _ in range(3):
+            self.report_sock.sendto(done, sender)
+            try:
+                while self.report_sock.recv(PACKET_SIZE) != fin:
+                    pass
+                return
+            except socket.timeout:
+                continue
@@ -0,0 +1,79 @@
+"""
+Keyed Worker Pool - fixed number of threads with per-key ordering
+Tasks submitted under the same key (e.g. one client session) run one at a
+time in submission order; tasks of different keys run in parallel
+"""
+
+import threading
+from collections import deque
+from queue import Queue
+from threading import Thread
+
+
+class KeyedWorkerPool:
+    """Bounded thread pool that never runs two tasks of one key at once"""
+
+    def __init__(self, num_workers, on_error=None):
+        self.num_workers = num_workers
+        self.on_error = on_error or (lambda key, e: print(f"Error in task for {key}: {e}"))
+        self.lock = threading.Lock()
+        self.ready = Queue()    # keys that have work and no running task
+        self.pending = {}       # key -> deque of (fn, args), head is running or next
+        self.busy = 0
+        self.completed = 0
+        self.workers = []
+
+    def start(self):
+        for _ in range(self.num_workers):
+            worker = Thread(target=self._run, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        for _ in self.workers:
+            self.ready.put(None)
+        self.workers = []
+
+    def submit(self, key, fn, *args):
+        """Queue fn(*args) behind every earlier task of the same key"""
+        with self.lock:
+            tasks = self.pending.get(key)
+            if tasks is not None:
+                tasks.append((fn, args))
+                return
+            self.pending[key] = deque([(fn, args)])
+        self.ready.put(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.num_workers,
+                "busy": self.busy,
+                "queued": sum(len(tasks) for tasks in self.pending.values()) - self.busy,
+                "completed": self.completed,
+            }
+
+    def _run(self):
+        while True:
+            key = self.ready.get()
+            if key is None:
+                return
+
+            with self.lock:
+                fn, args = self.pending[key][0]
+                self.busy += 1
+
+            try:
+                fn(*args)
+            except Exception as e:
+                self.on_error(key, e)
+
+            with self.lock:
+                self.busy -= 1
+                self.completed += 1
+                tasks = self.pending[key]
+                tasks.popleft()
+                if not tasks:
+                    del self.pending[key]
+            if tasks:
+                self.ready.put(key)
@@ -17,19 +17,29 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 # Import logic modules (separated from CLI)
 from core.tcp_logic import TCPClientLogic
 from core.udp_logic import UDPClientLogic
+from core.udp_async import AsyncUDPClientLogic
+from core.scheduler import DownloadScheduler, Download, ORDERS
+from core.constants import MAX_ACTIVE_DOWNLOADS, DOWNLOAD_RATE_LIMIT, DOWNLOAD_ORDER
+
+# How often the download rows are refreshed while files are downloading (ms)
+REFRESH_INTERVAL = 250
 
 
 class FileTransferClientGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("File Transfer Client")
-        self.root.geometry("800x600")
+        self.root.geometry("800x760")
 
         self.connected = False
         self.client = None
         self.download_folder = str(Path.home() / "Downloads")
         self.file_list = []
         self.selected_files = []
+        self.scheduler = None
+        self.scheduler_key = None
+        self.rows = {}  # Download -> row id in the downloads table
+        self.refreshing = False
 
         self.create_widgets()
 
@@ -45,6 +55,10 @@ class FileTransferClientGUI:
         protocol_frame.grid(row=0, column=1, sticky="w", padx=5, pady=5)
         ttk.Radiobutton(protocol_frame, text="TCP", variable=self.protocol_var, value="TCP").pack(side="left", padx=5)
         ttk.Radiobutton(protocol_frame, text="UDP", variable=self.protocol_var, value="UDP").pack(side="left", padx=5)
+        self.async_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(protocol_frame, text="asyncio engine (UDP)", variable=self.async_var).pack(side="left", padx=5)
+        self.hybrid_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(protocol_frame, text="UDP data (TCP)", variable=self.hybrid_var).pack(side="left", padx=5)
 
         # Host
         ttk.Label(conn_frame, text="Server Host:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
@@ -86,11 +100,41 @@ class FileTransferClientGUI:
         self.file_listbox.pack(side="left", fill="both", expand=True)
         scrollbar.config(command=self.file_listbox.yview)
 
-        # Download button
+        # Scheduler settings and download button
+        options_frame = ttk.Frame(file_frame)
+        options_frame.pack(fill="x", pady=5)
+        ttk.Label(options_frame, text="Parallel:").pack(side="left", padx=(0, 2))
+        self.parallel_var = tk.IntVar(value=MAX_ACTIVE_DOWNLOADS)
+        ttk.Spinbox(options_frame, from_=1, to=16, width=4, textvariable=self.parallel_var).pack(side="left", padx=5)
+        ttk.Label(options_frame, text="Rate limit (MB/s, 0 = none):").pack(side="left", padx=(5, 2))
+        self.rate_var = tk.DoubleVar(value=DOWNLOAD_RATE_LIMIT / 1e6 if DOWNLOAD_RATE_LIMIT else 0)
+        ttk.Entry(options_frame, width=6, textvariable=self.rate_var).pack(side="left", padx=5)
+        ttk.Label(options_frame, text="Order:").pack(side="left", padx=(5, 2))
+        self.order_var = tk.StringVar(value=DOWNLOAD_ORDER)
+        ttk.Combobox(options_frame, values=ORDERS, width=9, state="readonly",
+                     textvariable=self.order_var).pack(side="left", padx=5)
+        ttk.Label(options_frame, text="Priority:").pack(side="left", padx=(5, 2))
+        self.priority_var = tk.IntVar(value=0)
+        ttk.Spinbox(options_frame, from_=-9, to=9, width=4, textvariable=self.priority_var).pack(side="left", padx=5)
+
         self.download_btn = ttk.Button(file_frame, text="Download Selected Files",
                                        command=self.download_selected, state="disabled")
         self.download_btn.pack(pady=5)
 
+        # Downloads Frame: one row per file, queued, downloading or finished
+        downloads_frame = ttk.LabelFrame(self.root, text="Downloads", padding=10)
+        downloads_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        columns = ("size", "priority", "status", "progress", "rate")
+        self.downloads_tree = ttk.Treeview(downloads_frame, columns=columns, height=6)
+        self.downloads_tree.heading("#0", text="File")
+        self.downloads_tree.column("#0", width=250)
+        for column, title, width in zip(columns, ("Size", "Priority", "Status", "Progress", "Rate"),
+                                        (100, 60, 80, 80, 100)):
+            self.downloads_tree.heading(column, text=title)
+            self.downloads_tree.column(column, width=width, anchor="e")
+        self.downloads_tree.pack(fill="both", expand=True)
+
         # Status Frame
         status_frame = ttk.LabelFrame(self.root, text="Status", padding=10)
         status_frame.pack(fill="both", padx=10, pady=5)
@@ -198,10 +242,13 @@ class FileTransferClientGUI:
             self.root.after(0, lambda: self.log_status(f"Error: {e}"))
             raise Exception(f"TCP connection failed: {e}")
 
+    def _udp_client_class(self):
+        return AsyncUDPClientLogic if self.async_var.get() else UDPClientLogic
+
     def _connect_udp(self, host, port):
         try:
             # Use UDP logic layer
-            client = UDPClientLogic(
+            client = self._udp_client_class()(
                 host, port, self.download_folder,
                 on_log=lambda msg: self.root.after(0, lambda: self.log_status(msg))
             )
@@ -243,66 +290,98 @@ class FileTransferClientGUI:
             messagebox.showwarning("Warning", "Please select files to download")
             return
 
-        selected_files = [self.file_list[i][0] for i in selection]
+        try:
+            parallel = int(self.parallel_var.get())
+            rate = float(self.rate_var.get())
+            priority = int(self.priority_var.get())
+        except (ValueError, tk.TclError):
+            messagebox.showerror("Error", "Parallel, rate limit and priority must be numbers")
+            return
+
+        scheduler = self._get_scheduler(parallel, rate * 1e6 if rate > 0 else None, self.order_var.get())
+        self.log_status(f"Queued {len(selection)} file(s), {parallel} at a time")
+        for i in selection:
+            name, size = self.file_list[i]
+            size = int(size.rstrip("B")) if size.rstrip("B").isdigit() else None
+            scheduler.submit(name, size, priority)
+        self._refresh_downloads()
 
+    def _get_scheduler(self, parallel, rate, order):
+        """The download scheduler for the current settings; settings changed while busy apply once it is idle"""
         protocol = self.protocol_var.get()
         host = self.host_entry.get().strip()
         port = int(self.port_entry.get().strip())
+        hybrid = self.hybrid_var.get()
+        client_class = self._udp_client_class()
+        key = (protocol, host, port, self.download_folder, hybrid, client_class, parallel, rate, order)
+
+        if self.scheduler is not None and key != self.scheduler_key:
+            if self.scheduler.pending():
+                self.log_status("New settings apply once the current downloads are done")
+                return self.scheduler
+            self.scheduler.close()
+            self.scheduler = None
+
+        if self.scheduler is None:
+            on_log = lambda msg: self.root.after(0, lambda: self.log_status(msg))
+
+            def connect():
+                # every worker has its own connection, so its own data channels
+                if protocol == "TCP":
+                    client = TCPClientLogic(host, port, self.download_folder, on_log=on_log,
+                                            transfer_mode="hybrid" if hybrid else "tcp")
+                else:
+                    client = client_class(host, port, self.download_folder, on_log=on_log)
+                return client if client.connect() else None
+
+            self.scheduler = DownloadScheduler(connect, parallel, rate, order, on_log=on_log,
+                                               on_update=self._on_download_update)
+            self.scheduler_key = key
+        return self.scheduler
+
+    def _on_download_update(self, download):
+        """Scheduler thread: a download changed state, shown from the Tk thread"""
+        state = download.state
+        self.root.after(0, lambda: self._download_changed(download, state))
+
+    def _download_changed(self, download, state):
+        self._update_row(download)
+        if state == Download.DONE and download.unchanged:
+            self.log_status(f"{download.name} not modified, kept the local copy")
+        elif state == Download.DONE:
+            self.log_status(f"Downloaded {download.name}")
+        elif state == Download.FAILED:
+            self.log_status(f"Failed to download {download.name}")
+
+    def _update_row(self, download):
+        state = "not modified" if download.unchanged else download.state
+        values = (f"{download.size} B" if download.size is not None else "?", download.priority, state,
+                  f"{download.progress:.1f}%", f"{download.rate / 1e6:.1f} MB/s" if download.started else "")
+        row = self.rows.get(download)
+        if row is None:
+            self.rows[download] = self.downloads_tree.insert("", tk.END, text=download.name, values=values)
+        else:
+            self.downloads_tree.item(row, values=values)
+
+    def _refresh_downloads(self):
+        """Progress and rate of the active rows, every REFRESH_INTERVAL while anything is downloading"""
+        if self.refreshing:
+            return
+        self.refreshing = True
+
+        def refresh():
+            for download in self.scheduler.downloads:
+                if download.state == Download.ACTIVE:
+                    self._update_row(download)
+            if self.scheduler.pending():
+                self.root.after(REFRESH_INTERVAL, refresh)
+                return
+            self.refreshing = False
+            done = sum(d.state == Download.DONE for d in self.scheduler.downloads)
+            failed = sum(d.state == Download.FAILED for d in self.scheduler.downloads)
+            self.log_status(f"All downloads finished: {done} done, {failed} failed")
 
-        self.log_status(f"Starting download of {len(selected_files)} file(s)...")
-        self.download_btn.config(state="disabled")
-
-        # Download in separate thread
-        thread = threading.Thread(target=self._download_thread,
-                                 args=(protocol, host, port, selected_files))
-        thread.daemon = True
-        thread.start()
-
-    def _download_thread(self, protocol, host, port, files):
-        try:
-            if protocol == "TCP":
-                self._download_tcp(host, port, files)
-            else:
-                self._download_udp(host, port, files)
-
-            self.root.after(0, lambda: self.log_status(f"Download completed successfully!"))
-            self.root.after(0, lambda: messagebox.showinfo("Success",
-                f"Downloaded {len(files)} file(s) to {self.download_folder}"))
-        except Exception as e:
-            self.root.after(0, lambda: self.log_status(f"Download error: {e}"))
-            self.root.after(0, lambda: messagebox.showerror("Download Error", str(e)))
-        finally:
-            self.root.after(0, lambda: self.download_btn.config(state="normal"))
-
-    def _download_tcp(self, host, port, files):
-        # Use TCP logic layer
-        client = TCPClientLogic(
-            host, port, self.download_folder,
-            on_log=lambda msg: self.root.after(0, lambda: self.log_status(msg))
-        )
-
-        success = client.connect()
-        if not success:
-            raise Exception("Failed to connect for download")
-
-        for filename in files:
-            client.download_file(filename)
-
-        client.disconnect()
-
-    def _download_udp(self, host, port, files):
-        # Use UDP logic layer
-        client = UDPClientLogic(
-            host, port, self.download_folder,
-            on_log=lambda msg: self.root.after(0, lambda: self.log_status(msg))
-        )
-
-        success = client.connect()
-        if not success:
-            raise Exception("Failed to connect for download")
-
-        for filename in files:
-            client.download_file(filename)
+        self.root.after(REFRESH_INTERVAL, refresh)
 
 
 def main():
@@ -16,6 +16,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 # Import logic modules (separated from CLI)
 from core.tcp_logic import TCPServerLogic
 from core.udp_logic import UDPServerLogic
+from core.udp_async import AsyncUDPServerLogic
 
 
 class FileTransferServerGUI:
@@ -44,6 +45,9 @@ class FileTransferServerGUI:
                        value="TCP", command=self.update_default_port).pack(side="left", padx=5)
         ttk.Radiobutton(protocol_frame, text="UDP", variable=self.protocol_var,
                        value="UDP", command=self.update_default_port).pack(side="left", padx=5)
+        self.async_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(protocol_frame, text="asyncio engine (UDP)",
+                        variable=self.async_var).pack(side="left", padx=5)
 
         # Host
         ttk.Label(settings_frame, text="Host:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
@@ -180,7 +184,7 @@ class FileTransferServerGUI:
                 for widget in child.winfo_children():
                     if isinstance(widget, ttk.Frame):
                         for rb in widget.winfo_children():
-                            if isinstance(rb, ttk.Radiobutton):
+                            if isinstance(rb, (ttk.Radiobutton, ttk.Checkbutton)):
                                 rb.config(state="disabled")
 
         self.stop_btn.config(state="normal")
@@ -204,7 +208,8 @@ class FileTransferServerGUI:
                     raise Exception("Failed to start TCP server")
             else:
                 # Use UDP logic layer
-                self.server = UDPServerLogic(host, port, folder, on_log=self.log_status)
+                server_class = AsyncUDPServerLogic if self.async_var.get() else UDPServerLogic
+                self.server = server_class(host, port, folder, on_log=self.log_status)
                 success = self.server.start()
                 if not success:
                     raise Exception("Failed to start UDP server")
@@ -244,7 +249,7 @@ class FileTransferServerGUI:
                 for widget in child.winfo_children():
                     if isinstance(widget, ttk.Frame):
                         for rb in widget.winfo_children():
-                            if isinstance(rb, ttk.Radiobutton):
+                            if isinstance(rb, (ttk.Radiobutton, ttk.Checkbutton)):
                                 rb.config(state="normal")
 
 
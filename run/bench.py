@@ -0,0 +1,1011 @@
+#!/usr/bin/env python3
+"""
+Benchmark Runner Script
+Usage: python run/bench.py [benchmark] [options]
+"""
+
+import sys
+import os
+import time
+import socket
+import tempfile
+import argparse
+import threading
+import re
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def make_files(folder, count, size, prefix="bench"):
+    """Create `count` random files of `size` bytes, return their names"""
+    names = []
+    for i in range(count):
+        name = f"{prefix}_{i}.bin"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(os.urandom(size))
+        names.append(name)
+    return names
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def print_table(header, rows):
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    line = "  ".join(f"{{:>{w}}}" for w in widths)
+    print(line.format(*header))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print(line.format(*row))
+
+
+# =========================
+# UDP: AGGREGATE THROUGHPUT VS CLIENTS
+# =========================
+def bench_udp_clients(args):
+    from server.udp import FileServer
+    from client.udp import FileClient
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        names = make_files(srv_dir, args.max_clients, args.size)
+        input_path = os.path.join(tmp, "input.txt")
+        open(input_path, "w").close()
+
+        port = free_port()
+        server = FileServer("127.0.0.1", port, srv_dir)
+        threading.Thread(target=server.start_server, daemon=True).start()
+
+        rows = []
+        for n in range(1, args.max_clients + 1):
+            durations = [None] * n
+
+            def run_client(i):
+                out_dir = os.path.join(tmp, f"dl_{n}_{i}")
+                os.makedirs(out_dir)
+                client = FileClient("127.0.0.1", port, out_dir, input_path, show_progress=False)
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.settimeout(client.TIMEOUT)
+                    client.connect(sock)
+                    t0 = time.perf_counter()
+                    client.download(sock, names[i])
+                    durations[i] = time.perf_counter() - t0
+                    client.send_message(sock, "EXIT")
+
+            t0 = time.perf_counter()
+            threads = [threading.Thread(target=run_client, args=(i,), daemon=True) for i in range(n)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+
+            per_client = [args.size / d / 1e6 for d in durations]
+            rows.append((n, f"{n * args.size / elapsed / 1e6:.2f}",
+                         f"{min(per_client):.2f}", f"{max(per_client):.2f}",
+                         f"{min(per_client) / max(per_client):.2f}"))
+
+        server.running = False
+        server.demux.stop()
+        server.server_socket.close()
+
+    print(f"\nUDP server, {args.size} bytes per client, distinct files\n")
+    print_table(("clients", "aggregate MB/s", "min MB/s", "max MB/s", "fairness"), rows)
+
+
+# =========================
+# UDP: BATCHED I/O (GSO/GRO) VS PER-PACKET
+# =========================
+def bench_udp_io(args):
+    from core.udp_io import BatchIO
+
+    def run(fast_path):
+        recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        recv_sock.bind(("127.0.0.1", 0))
+        recv_sock.settimeout(0.5)
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver, sender = BatchIO(recv_sock, fast_path), BatchIO(send_sock, fast_path)
+        address = recv_sock.getsockname()
+
+        packets = [os.urandom(args.packet_size) for _ in range(args.batch)]
+        received = [0]
+
+        def drain():
+            while True:
+                try:
+                    datagrams, _ = receiver.recv_batch(args.packet_size)
+                except socket.timeout:
+                    return
+                received[0] += len(datagrams)
+
+        reader = threading.Thread(target=drain, daemon=True)
+        reader.start()
+        t0 = time.perf_counter()
+        for _ in range(args.count // args.batch):
+            sender.send_batch(packets, address)
+        send_time = time.perf_counter() - t0
+        reader.join()
+        recv_sock.close()
+        send_sock.close()
+
+        sent = args.count // args.batch * args.batch
+        return (("GSO/GRO" if sender.gso else "per-packet"), f"{sent / send_time:,.0f}",
+                f"{received[0] / send_time:,.0f}", f"{100 * (1 - received[0] / sent):.1f}")
+
+    rows = [run(False), run(True)]
+    print(f"\nLoopback, {args.count} packets of {args.packet_size} bytes, batches of {args.batch}\n")
+    print_table(("mode", "sent pkt/s", "received pkt/s", "loss %"), rows)
+
+
+# =========================
+# UDP: SERVER CPU AND THREADS UNDER SUSTAINED LOAD
+# =========================
+SERVER_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+from core.udp_logic import UDPServerLogic
+server = UDPServerLogic("127.0.0.1", {port}, {folder!r}, on_log=lambda msg: None)
+server.start()
+print("ready", flush=True)
+while True:
+    time.sleep(1)
+"""
+
+
+def read_proc(pid):
+    """(cpu seconds, thread count) of a process from /proc, Linux only"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu, int(fields[17])
+
+
+def bench_udp_server_load(args):
+    import subprocess
+    from core.udp_logic import UDPClientLogic
+
+    if not os.path.exists("/proc/self/stat"):
+        print("udp-server-load needs /proc (Linux)")
+        return
+
+    root = str(Path(__file__).parent.parent)
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        names = make_files(srv_dir, args.clients, args.size)
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-c", SERVER_SCRIPT.format(root=root, port=port, folder=srv_dir)],
+            stdout=subprocess.PIPE, text=True
+        )
+        server.stdout.readline()
+
+        peak_threads = [0]
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                peak_threads[0] = max(peak_threads[0], read_proc(server.pid)[1])
+                time.sleep(0.01)
+
+        def run_client(i):
+            out_dir = os.path.join(tmp, f"dl_{i}")
+            os.makedirs(out_dir)
+            client = UDPClientLogic("127.0.0.1", port, out_dir, on_log=lambda msg: None)
+            client.connect()
+            for _ in range(args.rounds):
+                client.download_file(names[i])
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        cpu0, _ = read_proc(server.pid)
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=run_client, args=(i,), daemon=True) for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        cpu1, _ = read_proc(server.pid)
+        done.set()
+        server.kill()
+        server.wait()
+
+    total = args.clients * args.rounds * args.size
+    print(f"\nUDP logic server, {args.clients} clients x {args.rounds} rounds x {args.size} bytes\n")
+    print_table(("MB/s", "server CPU s", "CPU ms per MB", "peak threads"),
+                [(f"{total / elapsed / 1e6:.2f}", f"{cpu1 - cpu0:.2f}",
+                  f"{(cpu1 - cpu0) * 1000 / (total / 1e6):.1f}", peak_threads[0])])
+
+
+# =========================
+# UDP: ACK (STOP-AND-WAIT) VS NAK (BLAST) TRANSFER MODE
+# =========================
+def bench_udp_modes(args):
+    import random
+    from core.udp_logic import UDPServerLogic, UDPClientLogic
+
+    # Client throws away a share of data packets, as if they were lost on the wire
+    verify = UDPClientLogic._verify_checksum
+    UDPClientLogic._verify_checksum = lambda self, data, checksum: (
+        random.random() >= args.loss and verify(self, data, checksum))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+
+        port = free_port()
+        server = UDPServerLogic("127.0.0.1", port, srv_dir, on_log=lambda msg: None)
+        server.start()
+
+        for mode in ("ack", "nak"):
+            out_dir = os.path.join(tmp, mode)
+            os.makedirs(out_dir)
+            client = UDPClientLogic("127.0.0.1", port, out_dir, on_log=lambda msg: None, transfer_mode=mode)
+            client.connect()
+            t0 = time.perf_counter()
+            client.download_file(name)
+            elapsed = time.perf_counter() - t0
+            with open(os.path.join(srv_dir, name), "rb") as a, open(os.path.join(out_dir, name), "rb") as b:
+                intact = a.read() == b.read()
+            rows.append((mode, f"{elapsed:.2f}", f"{args.size / elapsed / 1e6:.2f}", "yes" if intact else "NO"))
+
+        server.stop()
+    UDPClientLogic._verify_checksum = verify
+
+    print(f"\nUDP logic server, {args.size} bytes, {args.loss * 100:.0f}% injected loss\n")
+    print_table(("mode", "seconds", "MB/s", "intact"), rows)
+
+
+# =========================
+# UDP: MULTICAST PUSH TO N RECEIVERS (LOOPBACK)
+# =========================
+def bench_udp_multicast(args):
+    import random
+    from core.udp_multicast import MulticastSender, MulticastReceiver
+
+    # Receivers throw away a share of packets, each its own independent losses
+    store = MulticastReceiver._store
+    MulticastReceiver._store = lambda self, chunk, seq, data, highest: (
+        highest if random.random() < args.loss else store(self, chunk, seq, data, highest))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+        port = free_port()
+
+        receivers, results = [], [None] * args.receivers
+        for i in range(args.receivers):
+            out_dir = os.path.join(tmp, f"rx_{i}")
+            os.makedirs(out_dir)
+            receiver = MulticastReceiver(args.group, port, out_dir, interface="127.0.0.1", on_log=lambda msg: None)
+            receiver.open()
+            receivers.append(receiver)
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, receivers[i].receive(timeout=10)),
+                                    daemon=True) for i in range(args.receivers)]
+        for t in threads:
+            t.start()
+
+        sender = MulticastSender("127.0.0.1", args.group, port, srv_dir, on_log=lambda msg: None)
+        t0 = time.perf_counter()
+        stats = sender.push(name, receivers=args.receivers)
+        elapsed = time.perf_counter() - t0
+        for t in threads:
+            t.join()
+        sender.close()
+        for receiver in receivers:
+            receiver.close()
+    MulticastReceiver._store = store
+
+    sent = stats["packets"] + stats["repaired"]
+    print(f"\nLoopback multicast, {args.size} bytes to {args.receivers} receivers, "
+          f"{args.loss * 100:.0f}% loss per receiver\n")
+    print_table(("seconds", "receivers done", "packets sent", "vs unicast", "repair rounds", "NAKs merged"),
+                [(f"{elapsed:.2f}", f"{results.count(name)}/{args.receivers}", sent,
+                  f"{sent / (stats['packets'] * args.receivers):.2f}x", stats["rounds"], stats["naks"])])
+
+
+# =========================
+# UDP: NAK MODE WITH AND WITHOUT PACKET PACING
+# =========================
+def bench_udp_pacing(args):
+    from core.udp_logic import UDPServerLogic, UDPClientLogic
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+
+        for pacing in (False, True):
+            port = free_port()
+            server = UDPServerLogic("127.0.0.1", port, srv_dir, on_log=lambda msg: None)
+            server.pacing = pacing
+            server.start()
+
+            out_dir = os.path.join(tmp, f"paced_{pacing}")
+            os.makedirs(out_dir)
+            client = UDPClientLogic("127.0.0.1", port, out_dir, on_log=lambda msg: None, transfer_mode="nak")
+            if args.rcvbuf:
+                client.RCVBUF = args.rcvbuf
+            client.connect()
+            t0 = time.perf_counter()
+            for _ in range(args.rounds):
+                client.download_file(name)
+            elapsed = time.perf_counter() - t0
+            blast = server.get_stats()["blast"]
+            server.stop()
+
+            rows.append(("paced" if pacing else "unpaced", f"{elapsed:.2f}",
+                         f"{args.rounds * args.size / elapsed / 1e6:.2f}",
+                         blast["packets"] + blast["resent"],
+                         f"{100 * blast['resent'] / max(blast['packets'], 1):.2f}"))
+
+    print(f"\nNAK mode, {args.rounds} x {args.size} bytes over loopback, "
+          f"client receive buffer {args.rcvbuf or 'default'}\n")
+    print_table(("sender", "seconds", "MB/s", "packets sent", "resent %"), rows)
+
+
+# =========================
+# TCP: LOOPBACK VS SAME-HOST UNIX SOCKET
+# =========================
+def bench_tcp_local(args):
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+    from core.local_transport import HAS_UNIX, HAS_FD_PASSING
+
+    if not HAS_UNIX:
+        print("Unix domain sockets are not available on this platform")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+
+        port = free_port()
+        server = TCPServerLogic("127.0.0.1", port, srv_dir, on_log=lambda msg: None)
+        server.start()
+
+        transports = [("loopback TCP (1+4 sockets)", "tcp", False),
+                      ("unix socket, sendfile", "unix", False)]
+        if HAS_FD_PASSING:
+            transports.append(("unix socket, SCM_RIGHTS copy", "unix", True))
+
+        rows = []
+        for label, transport, pass_fds in transports:
+            out_dir = os.path.join(tmp, f"{transport}_{pass_fds}")
+            os.makedirs(out_dir)
+            client = TCPClientLogic("127.0.0.1", port, out_dir, on_log=lambda msg: None, transport=transport)
+            client.pass_fds = pass_fds
+            t0 = time.perf_counter()
+            client.connect()
+            connected = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for _ in range(args.rounds):
+                ok = client.download_file(name)
+            elapsed = time.perf_counter() - t0
+            client.disconnect()
+            rows.append((label, f"{connected * 1000:.2f}", f"{elapsed:.3f}",
+                         f"{args.rounds * args.size / elapsed / 1e6:.1f}", "yes" if ok else "no"))
+
+        server.stop()
+
+    print(f"\nTCPClientLogic, {args.rounds} x {args.size} bytes on one host\n")
+    print_table(("transport", "connect ms", "seconds", "MB/s", "ok"), rows)
+
+
+# =========================
+# TCP: SHARED BLOCK CACHE
+# =========================
+def bench_tcp_cache(args):
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+    from core.file_cache import BlockCache
+    from core.constants import BLOCK_CACHE_SIZE
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+
+        for label, budget in (("off (budget 0)", 0), (f"{BLOCK_CACHE_SIZE // (1024 * 1024)}MB", BLOCK_CACHE_SIZE)):
+            port = free_port()
+            server = TCPServerLogic("127.0.0.1", port, srv_dir, on_log=lambda msg: None, local=False)
+            server.cache = server.ranges.cache = BlockCache(budget=budget)
+            server.start()
+
+            ok = []
+
+            def run_client(i):
+                out_dir = os.path.join(tmp, f"{budget}_{i}")
+                os.makedirs(out_dir)
+                client = TCPClientLogic("127.0.0.1", port, out_dir, on_log=lambda msg: None, transport="tcp")
+                if client.connect():
+                    ok.append(client.download_file(name))
+                    client.disconnect()
+
+            t0 = time.perf_counter()
+            threads = [threading.Thread(target=run_client, args=(i,)) for i in range(args.clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            server.stop()
+
+            stats = server.cache.stats()
+            served = stats["hit_bytes"] + stats["disk_bytes"]
+            rows.append((label, f"{elapsed:.2f}", f"{stats['hit_ratio'] * 100:.1f}", f"{stats['joined']}",
+                         f"{stats['disk_bytes'] / 1e6:.1f}", f"{served / 1e6:.1f}", f"{sum(ok)}/{args.clients}"))
+
+    print(f"\n{args.clients} concurrent TCP clients downloading the same {args.size} byte file\n")
+    print_table(("cache", "seconds", "hit %", "joined", "disk MB", "served MB", "ok"), rows)
+
+
+# =========================
+# SERVER: READ-AHEAD
+# =========================
+def bench_readahead(args):
+    from core.file_cache import BlockCache, OpenFileTable, ReadAhead
+
+    if not hasattr(os, "posix_fadvise"):
+        print("posix_fadvise is not available: cannot evict the file from the page cache")
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        name = make_files(tmp, 1, args.size)[0]
+        files = OpenFileTable()
+        handle = files.acquire(os.path.join(tmp, name))
+
+        for mode in ("kernel", "hint", "thread"):
+            elapsed = []
+            for _ in range(args.rounds):
+                # cold start: the file leaves the page cache, the block cache is empty
+                os.posix_fadvise(handle.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                listener = socket.create_server(("127.0.0.1", 0))
+                receiver = socket.create_connection(listener.getsockname())
+                sender, _ = listener.accept()
+
+                def drain():
+                    while receiver.recv(1024 * 1024):
+                        pass
+
+                thread = threading.Thread(target=drain)
+                thread.start()
+                t0 = time.perf_counter()
+                with ReadAhead(BlockCache(budget=0), handle, 0, handle.size, mode=mode) as reader:
+                    for block in reader:
+                        sender.sendall(block)
+                sender.close()
+                thread.join()
+                elapsed.append(time.perf_counter() - t0)
+                receiver.close()
+                listener.close()
+            best = min(elapsed)
+            rows.append((mode, f"{best:.3f}", f"{args.size / best / 1e6:.1f}"))
+
+        files.release(handle)
+        files.close()
+
+    print(f"\nCold {args.size} byte file sent over loopback TCP, best of {args.rounds}\n")
+    print_table(("READAHEAD_MODE", "seconds", "MB/s"), rows)
+
+
+# =========================
+# CLIENT: OUTPUT FILE WRITES
+# =========================
+def bench_client_write(args):
+    from core.reassembly import OutputFile
+    from core.constants import WRITE_BUFFER
+
+    data = os.urandom(args.size)
+    quarter = args.size // 4
+    settings = [("per write", 0, "none"), ("coalesced", WRITE_BUFFER, "none"),
+                ("coalesced", WRITE_BUFFER, 64 * 1024 * 1024), ("coalesced", WRITE_BUFFER, "file")]
+    rows = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, "out.bin")
+        for label, buffer_size, fsync in settings:
+            t0 = time.perf_counter()
+            output = OutputFile(path, args.size, fsync=fsync, buffer_size=buffer_size)
+
+            def receive(i):
+                # one chunk receiver: its quarter in packet-sized writes
+                start, end = i * quarter, args.size if i == 3 else (i + 1) * quarter
+                view = memoryview(data)
+                for offset in range(start, end, args.write):
+                    output.write(offset, view[offset:min(end, offset + args.write)])
+
+            threads = [threading.Thread(target=receive, args=(i,)) for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            output.close()
+            elapsed = time.perf_counter() - t0
+            fsync_label = f"{fsync // (1024 * 1024)}MB" if isinstance(fsync, int) else fsync
+            rows.append((label, fsync_label, "yes" if output.preallocated else "no", output.writes,
+                         f"{elapsed:.3f}", f"{args.size / elapsed / 1e6:.1f}"))
+            os.remove(path)
+
+    print(f"\n4 chunk receivers writing {args.size} bytes in {args.write} byte pieces to {args.dir or 'the temp dir'}\n")
+    print_table(("writes", "fsync", "preallocated", "write calls", "seconds", "MB/s"), rows)
+
+
+# =========================
+# SPARSE FILES: ZERO RANGES
+# =========================
+def make_sparse_file(path, size, data_share, zero_share):
+    """A disk-image-like file: data_share random, zero_share written zeros, the rest holes"""
+    extent = 1024 * 1024
+    with open(path, "wb") as f:
+        f.truncate(size)
+        for offset in range(0, size, extent):
+            slot = (offset // extent) % 10 / 10
+            if slot < data_share:
+                f.seek(offset)
+                f.write(os.urandom(min(extent, size - offset)))
+            elif slot < data_share + zero_share:
+                f.seek(offset)
+                f.write(bytes(min(extent, size - offset)))
+
+
+def bench_sparse(args):
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+    from core.udp_logic import UDPServerLogic, UDPClientLogic
+    from core.protocol import PACKET_OVERHEAD
+
+    rows = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = "image.bin"
+        make_sparse_file(os.path.join(srv_dir, name), args.size, args.data, args.zeros)
+
+        tcp_port, udp_port = free_port(), free_port()
+        tcp_server = TCPServerLogic("127.0.0.1", tcp_port, srv_dir, on_log=lambda msg: None, local=False)
+        udp_server = UDPServerLogic("127.0.0.1", udp_port, srv_dir, on_log=lambda msg: None)
+        tcp_server.start()
+        udp_server.start()
+
+        for label, protocol, sparse in (("TCP GET", "tcp", False), ("TCP SPARSE", "tcp", True),
+                                        ("UDP NAK", "udp", False), ("UDP NAK, zero packets", "udp", True)):
+            out_dir = os.path.join(tmp, f"{protocol}_{sparse}")
+            os.makedirs(out_dir)
+            logs = []
+            if protocol == "tcp":
+                client = TCPClientLogic("127.0.0.1", tcp_port, out_dir, on_log=logs.append, transport="tcp")
+            else:
+                client = UDPClientLogic("127.0.0.1", udp_port, out_dir, on_log=logs.append, transfer_mode="nak")
+            client.sparse = sparse
+            client.connect()
+            t0 = time.perf_counter()
+            ok = client.download_file(name)
+            elapsed = time.perf_counter() - t0
+            if protocol == "tcp":
+                client.disconnect()
+
+            # bytes that went as zero ranges, from the client's chunk logs
+            if protocol == "tcp":
+                elided = sum(int(n) for n in re.findall(r"\((\d+) as zero ranges\)", "\n".join(logs)))
+            else:
+                packets = sum(int(n) for n in re.findall(r"(\d+) packets as zeros", "\n".join(logs)))
+                elided = min(args.size, packets * (client.packet_size - PACKET_OVERHEAD))
+            disk = os.stat(os.path.join(out_dir, name)).st_blocks * 512
+            rows.append((label, f"{elapsed:.3f}", f"{args.size / elapsed / 1e6:.1f}",
+                         f"{(args.size - elided) / 1e6:.1f}", f"{disk / 1e6:.1f}", "yes" if ok else "no"))
+
+        tcp_server.stop()
+        udp_server.stop()
+
+    print(f"\n{args.size} byte file: {args.data * 100:.0f}% data, {args.zeros * 100:.0f}% written zeros, rest holes\n")
+    print_table(("transfer", "seconds", "MB/s", "data MB sent", "client disk MB", "ok"), rows)
+
+
+# =========================
+# TCP: TLS HANDSHAKES AND THROUGHPUT
+# =========================
+def make_certificate(folder):
+    """Self-signed certificate for 127.0.0.1 made with the openssl CLI, (cert, key) or None"""
+    import subprocess
+
+    cert, key = os.path.join(folder, "server.crt"), os.path.join(folder, "server.key")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+                        "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cert, key
+
+
+def bench_tls(args):
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_certificate(tmp)
+        if files is None:
+            print("openssl is needed to make the test certificate")
+            return
+        cert, key = files
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        name = make_files(srv_dir, 1, args.size)[0]
+
+        servers = {}
+        for tls in (False, True):
+            port = free_port()
+            servers[tls] = TCPServerLogic("127.0.0.1", port, srv_dir, on_log=lambda msg: None, local=False,
+                                          tls=tls, cert=cert, key=key)
+            servers[tls].start()
+
+        rows = []
+        for label, tls, resume in (("plain TCP", False, False), ("TLS, 5 full handshakes", True, False),
+                                   ("TLS, 1 full + 4 resumed", True, True)):
+            out_dir = os.path.join(tmp, f"{tls}_{resume}")
+            os.makedirs(out_dir)
+            logs = []
+            connect_times = []
+            for _ in range(args.connects):
+                client = TCPClientLogic("127.0.0.1", servers[tls].port, out_dir, on_log=logs.append,
+                                        transport="tcp", tls=tls, ca=cert)
+                client.tls_resume = resume
+                t0 = time.perf_counter()
+                client.connect()
+                connect_times.append(time.perf_counter() - t0)
+                client.disconnect()
+            resumed = sum(int(n) for n in re.findall(r"(\d+) of 4 sessions resumed", "\n".join(logs)))
+            full = args.connects * 5 - resumed if tls else 0
+
+            client = TCPClientLogic("127.0.0.1", servers[tls].port, out_dir, on_log=lambda msg: None,
+                                    transport="tcp", tls=tls, ca=cert)
+            client.tls_resume = resume
+            client.sparse = False
+            client.connect()
+            t0 = time.perf_counter()
+            ok = client.download_file(name)
+            elapsed = time.perf_counter() - t0
+            client.disconnect()
+
+            connect_times.sort()
+            rows.append((label, f"{connect_times[len(connect_times) // 2] * 1000:.2f}",
+                         f"{full / args.connects:.1f}", f"{args.size / elapsed / 1e6:.1f}", "yes" if ok else "no"))
+
+        for server in servers.values():
+            server.stop()
+
+    print(f"\nTCPClientLogic over loopback: median of {args.connects} connects (1+4 sockets and file list), "
+          f"then one {args.size} byte download\n")
+    print_table(("sockets", "connect ms", "full handshakes", "MB/s", "ok"), rows)
+
+
+# =========================
+# CLIENT: DOWNLOAD SCHEDULER
+# =========================
+def bench_downloads(args):
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+    from core.scheduler import DownloadScheduler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        # one large file queued ahead of small ones: what a FIFO queue handles worst
+        sizes = {}
+        for i, size in enumerate([args.size] + [args.size // 16] * (args.files - 1)):
+            name = make_files(srv_dir, 1, size, prefix=f"file{i}")[0]
+            sizes[name] = size
+        total = sum(sizes.values())
+
+        server = TCPServerLogic("127.0.0.1", free_port(), srv_dir, on_log=lambda msg: None, local=False)
+        server.start()
+
+        rows = []
+        rate = args.rate * 1e6 if args.rate else None
+        for parallel, order, limit in ((1, "fifo", None), (1, "shortest", None), (args.parallel, "fifo", None),
+                                       (args.parallel, "shortest", None), (args.parallel, "fifo", rate)):
+            out_dir = os.path.join(tmp, f"{parallel}_{order}_{limit}")
+            os.makedirs(out_dir)
+
+            def connect():
+                client = TCPClientLogic("127.0.0.1", server.port, out_dir, on_log=lambda msg: None, transport="tcp")
+                return client if client.connect() else None
+
+            scheduler = DownloadScheduler(connect, parallel, limit, order, on_log=lambda msg: None)
+            t0 = time.monotonic()
+            downloads = [scheduler.submit(name, size) for name, size in sizes.items()]
+            scheduler.wait()
+            elapsed = time.monotonic() - t0
+            scheduler.close()
+
+            mean_done = sum(d.finished - t0 for d in downloads) / len(downloads)
+            ok = all(d.state == d.DONE for d in downloads)
+            rows.append((parallel, order, f"{limit / 1e6:.0f}" if limit else "-", f"{elapsed:.2f}",
+                         f"{mean_done:.2f}", f"{total / elapsed / 1e6:.1f}", "yes" if ok else "no"))
+
+        server.stop()
+
+    print(f"\nTCPClientLogic over loopback: {args.files} files ({args.size} bytes first, then "
+          f"{args.size // 16} bytes each), one connection per parallel download\n")
+    print_table(("parallel", "order", "limit MB/s", "total s", "mean done s", "MB/s", "ok"), rows)
+
+
+# =========================
+# UDP: PREFORK WORKERS (SO_REUSEPORT)
+# =========================
+def prefork_client(port, out_dir, input_path, name, rounds):
+    """One client process: download name rounds times, quietly"""
+    import io
+    import contextlib
+    from client.udp import FileClient
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = FileClient("127.0.0.1", port, out_dir, input_path, show_progress=False)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(client.TIMEOUT)
+            client.connect(sock)
+            for _ in range(rounds):
+                client.download(sock, name)
+            client.send_message(sock, "EXIT")
+
+
+def bench_udp_prefork(args):
+    import subprocess
+    import multiprocessing
+
+    root = str(Path(__file__).parent.parent)
+    env = dict(os.environ, PYTHONPATH=root)
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        os.makedirs(srv_dir)
+        names = make_files(srv_dir, args.clients, args.size)
+        input_path = os.path.join(tmp, "input.txt")
+        open(input_path, "w").close()
+
+        rows = []
+        for workers in sorted({1, args.workers}):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(root, "run", "udp.py"), "server", "--port", str(port),
+                 "--folder", srv_dir, "--workers", str(workers)],
+                stdout=subprocess.DEVNULL, env=env
+            )
+            time.sleep(1.0)
+
+            clients = []
+            for i in range(args.clients):
+                out_dir = os.path.join(tmp, f"dl_{workers}_{i}")
+                os.makedirs(out_dir)
+                clients.append(multiprocessing.Process(
+                    target=prefork_client, args=(port, out_dir, input_path, names[i], args.rounds)))
+            t0 = time.perf_counter()
+            for c in clients:
+                c.start()
+            for c in clients:
+                c.join()
+            elapsed = time.perf_counter() - t0
+            server.terminate()
+            server.wait()
+
+            total = args.clients * args.rounds * args.size
+            rows.append((workers, f"{elapsed:.2f}", f"{total / elapsed / 1e6:.2f}"))
+
+    print(f"\nUDP server, {args.clients} client processes x {args.rounds} rounds x {args.size} bytes, "
+          f"{os.cpu_count()} CPUs\n")
+    print_table(("workers", "seconds", "aggregate MB/s"), rows)
+
+
+# =========================
+# CLIENT: CONDITIONAL GET
+# =========================
+def bench_conditional(args):
+    import shutil
+    from core.tcp_logic import TCPServerLogic, TCPClientLogic
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srv_dir = os.path.join(tmp, "srv")
+        out_dir = os.path.join(tmp, "out")
+        copy_dir = os.path.join(tmp, "copy")
+        os.makedirs(srv_dir)
+        os.makedirs(out_dir)
+        names = make_files(srv_dir, args.files, args.size)
+
+        rows = []
+        server = None
+        for label, folder, conditional, restart in (("first download", out_dir, True, False),
+                                                    ("again, conditional GET", out_dir, True, False),
+                                                    ("again, server restarted", out_dir, True, True),
+                                                    ("copies not stamped yet", copy_dir, True, False),
+                                                    ("again, conditional GET off", out_dir, False, False)):
+            if server is None or restart:
+                # a new server knows the digests from its sidecar files only
+                if server is not None:
+                    server.stop()
+                server = TCPServerLogic("127.0.0.1", free_port(), srv_dir, on_log=lambda msg: None, local=False)
+                server.start()
+            if folder == copy_dir:
+                # same content, but new mtimes and no sidecars: the client hashes each copy once
+                shutil.copytree(out_dir, copy_dir, ignore=shutil.ignore_patterns(".*"), copy_function=shutil.copyfile)
+            logs = []
+            client = TCPClientLogic("127.0.0.1", server.port, folder, on_log=logs.append, transport="tcp")
+            client.conditional = conditional
+            client.connect()
+            t0 = time.perf_counter()
+            ok = all(client.download_file(name) for name in names)
+            elapsed = time.perf_counter() - t0
+            client.disconnect()
+            kept = sum("not modified" in line for line in logs)
+            rows.append((label, f"{elapsed * 1000:.1f}", kept, "yes" if ok else "no"))
+        server.stop()
+
+    print(f"\nTCPClientLogic over loopback: {args.files} files of {args.size} bytes, downloaded into the same "
+          f"folder again\n")
+    print_table(("run", "total ms", "kept", "ok"), rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='File Transfer - Benchmarks',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  python run/bench.py udp-clients
+  python run/bench.py udp-clients --max-clients 8 --size 4000000
+  python run/bench.py udp-io --packet-size 1400
+  python run/bench.py udp-server-load --clients 8
+  python run/bench.py udp-modes --loss 0.02
+  python run/bench.py udp-multicast --receivers 8 --loss 0.01
+  python run/bench.py udp-pacing --size 64000000
+  python run/bench.py tcp-local --size 64000000
+  python run/bench.py udp-prefork --workers 4 --clients 8
+        ''')
+
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = sub.add_parser('udp-clients', help='UDP server load test: aggregate throughput as clients are added')
+    p.add_argument('--max-clients', type=int, default=4,
+                   help='Largest number of concurrent clients (default: 4)')
+    p.add_argument('--size', type=int, default=2 * 1024 * 1024,
+                   help='File size per client in bytes (default: 2MB)')
+    p.set_defaults(func=bench_udp_clients)
+
+    p = sub.add_parser('udp-io', help='Loopback packets/sec with and without the GSO/GRO fast path')
+    p.add_argument('--count', type=int, default=200000,
+                   help='Number of packets to send (default: 200000)')
+    p.add_argument('--packet-size', type=int, default=1400,
+                   help='Datagram payload size in bytes (default: 1400)')
+    p.add_argument('--batch', type=int, default=32,
+                   help='Packets handed to one send_batch call (default: 32)')
+    p.set_defaults(func=bench_udp_io)
+
+    p = sub.add_parser('udp-server-load', help='UDP logic server CPU time and thread count under sustained transfers')
+    p.add_argument('--clients', type=int, default=8,
+                   help='Concurrent clients (default: 8)')
+    p.add_argument('--rounds', type=int, default=3,
+                   help='Downloads per client (default: 3)')
+    p.add_argument('--size', type=int, default=2 * 1024 * 1024,
+                   help='File size in bytes (default: 2MB)')
+    p.set_defaults(func=bench_udp_server_load)
+
+    p = sub.add_parser('udp-modes', help='ACK (stop-and-wait) vs NAK (blast) transfer mode')
+    p.add_argument('--size', type=int, default=16 * 1024 * 1024,
+                   help='File size in bytes (default: 16MB)')
+    p.add_argument('--loss', type=float, default=0.0,
+                   help='Share of server packets dropped on purpose, e.g. 0.02 (default: 0)')
+    p.set_defaults(func=bench_udp_modes)
+
+    p = sub.add_parser('udp-multicast', help='Multicast push to N loopback receivers with NAK repair')
+    p.add_argument('--receivers', type=int, default=4,
+                   help='Receivers joined to the group (default: 4)')
+    p.add_argument('--size', type=int, default=8 * 1024 * 1024,
+                   help='File size in bytes (default: 8MB)')
+    p.add_argument('--loss', type=float, default=0.01,
+                   help='Share of packets each receiver drops on purpose (default: 0.01)')
+    p.add_argument('--group', type=str, default='239.255.0.99',
+                   help='Multicast group (default: 239.255.0.99)')
+    p.set_defaults(func=bench_udp_multicast)
+
+    p = sub.add_parser('udp-pacing', help='NAK mode loss and throughput with and without packet pacing')
+    p.add_argument('--size', type=int, default=32 * 1024 * 1024,
+                   help='File size in bytes (default: 32MB)')
+    p.add_argument('--rounds', type=int, default=3,
+                   help='Downloads per sender (default: 3)')
+    p.add_argument('--rcvbuf', type=int, default=256 * 1024,
+                   help='Client socket receive buffer in bytes, small values model a shallow '
+                        'switch/receiver buffer; 0 keeps the client default (default: 256KB)')
+    p.set_defaults(func=bench_udp_pacing)
+
+    p = sub.add_parser('tcp-local', help='Loopback TCP vs the same-host Unix socket transport')
+    p.add_argument('--size', type=int, default=16 * 1024 * 1024,
+                   help='File size in bytes (default: 16MB)')
+    p.add_argument('--rounds', type=int, default=3,
+                   help='Downloads per transport (default: 3)')
+    p.set_defaults(func=bench_tcp_local)
+
+    p = sub.add_parser('tcp-cache', help='Disk reads of N concurrent TCP clients with and without the block cache')
+    p.add_argument('--clients', type=int, default=8,
+                   help='Concurrent clients downloading the same file (default: 8)')
+    p.add_argument('--size', type=int, default=16 * 1024 * 1024,
+                   help='File size in bytes (default: 16MB)')
+    p.set_defaults(func=bench_tcp_cache)
+
+    p = sub.add_parser('readahead', help='Sender throughput from a cold file per read-ahead mode')
+    p.add_argument('--size', type=int, default=64 * 1024 * 1024,
+                   help='File size in bytes (default: 64MB)')
+    p.add_argument('--rounds', type=int, default=3,
+                   help='Runs per setting, best is shown (default: 3)')
+    p.set_defaults(func=bench_readahead)
+
+    p = sub.add_parser('client-write', help='Output file write throughput: per-write vs coalesced, fsync policies')
+    p.add_argument('--size', type=int, default=128 * 1024 * 1024,
+                   help='File size in bytes (default: 128MB)')
+    p.add_argument('--write', type=int, default=8192,
+                   help='Bytes per write, like one packet or recv (default: 8192)')
+    p.add_argument('--dir', type=str, default=None,
+                   help='Directory on the disk to test (default: system temp dir)')
+    p.set_defaults(func=bench_client_write)
+
+    p = sub.add_parser('sparse', help='Sparse file over TCP and UDP NAK mode with and without zero ranges')
+    p.add_argument('--size', type=int, default=256 * 1024 * 1024,
+                   help='File size in bytes (default: 256MB)')
+    p.add_argument('--data', type=float, default=0.1,
+                   help='Share of the file that is random data (default: 0.1)')
+    p.add_argument('--zeros', type=float, default=0.1,
+                   help='Share of the file that is written (allocated) zeros (default: 0.1)')
+    p.add_argument('--dir', type=str, default=None,
+                   help='Directory on the disk to test (default: system temp dir)')
+    p.set_defaults(func=bench_sparse)
+
+    p = sub.add_parser('tls', help='TCP connect latency and throughput: plain, TLS, TLS with session resumption')
+    p.add_argument('--connects', type=int, default=50,
+                   help='Connects per setting (default: 50)')
+    p.add_argument('--size', type=int, default=128 * 1024 * 1024,
+                   help='File size in bytes (default: 128MB)')
+    p.set_defaults(func=bench_tls)
+
+    p = sub.add_parser('downloads', help='Client download scheduler: parallel downloads, queue order, rate limit')
+    p.add_argument('--files', type=int, default=12,
+                   help='Files to download (default: 12)')
+    p.add_argument('--size', type=int, default=256 * 1024 * 1024,
+                   help='Size of the first, large file in bytes; the others are 1/16 of it (default: 256MB)')
+    p.add_argument('--parallel', type=int, default=3,
+                   help='Parallel downloads to compare against one at a time (default: 3)')
+    p.add_argument('--rate', type=float, default=100,
+                   help='Rate limit of the last run in MB/s (default: 100)')
+    p.set_defaults(func=bench_downloads)
+
+    p = sub.add_parser('udp-prefork', help='UDP server throughput with 1 vs N SO_REUSEPORT worker processes')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                   help='Worker processes to compare against a single process (default: CPU count)')
+    p.add_argument('--clients', type=int, default=8,
+                   help='Concurrent client processes (default: 8)')
+    p.add_argument('--rounds', type=int, default=2,
+                   help='Downloads per client (default: 2)')
+    p.add_argument('--size', type=int, default=4 * 1024 * 1024,
+                   help='File size in bytes (default: 4MB)')
+    p.set_defaults(func=bench_udp_prefork)
+
+    p = sub.add_parser('conditional', help='Downloading a folder again with and without conditional GET')
+    p.add_argument('--files', type=int, default=20,
+                   help='Files to download (default: 20)')
+    p.add_argument('--size', type=int, default=16 * 1024 * 1024,
+                   help='File size in bytes (default: 16MB)')
+    p.set_defaults(func=bench_conditional)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,58 @@ Usage: python run_tcp.py [server|client] [options]
 
 import sys
 import os
+import time
 import argparse
 
+def run_tcp_worker(worker_id, stats_queue, host, port, folder_path, workers, tls, cert, key):
+    from server.tcp import Server
+    from core.constants import STATS_INTERVAL
+
+    try:
+        server = Server(host, port, folder_path, use_signals=False, workers=workers, tls=tls, cert=cert, key=key)
+        while True:
+            time.sleep(STATS_INTERVAL)
+            stats_queue.put((worker_id, server.get_stats()))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_prefork_server(host, port, folder_path, workers, tls, cert, key):
+    from core.prefork import Supervisor
+
+    print(f"Prefork: {workers} workers sharing port {port} (SO_REUSEPORT)")
+    Supervisor(run_tcp_worker, workers, args=(host, port, folder_path, workers, tls, cert, key)).run()
+    print("\n\033[1;32;40m[NOTIFICATION] Exited the Server!\n\033[0m")
+
+
+def run_swarm_client(mirrors, folder_path, file_input, tls, ca):
+    from core.swarm import SwarmClient
+    from core.input_watch import InputWatcher
+
+    client = SwarmClient(mirrors, folder_path, tls=tls, ca=ca)
+    if not client.connect():
+        return
+    print("List of files:\n" + "\n".join(client.file_list) + "\n")
+
+    try:
+        with InputWatcher(file_input) as watcher:
+            for file in watcher.follow():
+                client.download_file(file)
+    except KeyboardInterrupt:
+        print("\n\033[1;32;40m[NOTIFICATION] Disconnected!\n\033[0m")
+    client.disconnect()
+
+
+def parse_mirror(value):
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {value}")
+    return host, int(port)
+
+
 def main():
+    from core.constants import TLS_ENABLED, TLS_CERT, TLS_KEY, TLS_CA, MAX_ACTIVE_DOWNLOADS, DOWNLOAD_RATE_LIMIT
+
     parser = argparse.ArgumentParser(
         description='TCP File Transfer - Server/Client Runner',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -16,8 +65,13 @@ def main():
 Examples:
   python run_tcp.py server
   python run_tcp.py server --host 0.0.0.0 --port 5000
+  python run_tcp.py server --workers 4
   python run_tcp.py client --host 192.168.1.100
   python run_tcp.py client --port 5001 --folder ./downloads
+  python run_tcp.py client --mirror 10.0.0.1:5000 --mirror 10.0.0.2:5000
+  python run_tcp.py server --tls --cert certs/server.crt --key certs/server.key
+  python run_tcp.py client --tls --ca certs/server.crt
+  python run_tcp.py client --parallel 4 --rate 20
         ''')
 
     parser.add_argument('mode', choices=['server', 'client'],
@@ -30,6 +84,26 @@ Examples:
                         help='Folder path (server: resource folder, client: download folder)')
     parser.add_argument('--input', type=str, default=None,
                         help='Input file path (client only)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Server worker processes sharing the port with SO_REUSEPORT; each client IP '
+                             'is kept on one worker (server only, default: 1)')
+    parser.add_argument('--mirror', type=parse_mirror, action='append', default=None, metavar='HOST:PORT',
+                        help='Download every file from several mirror servers at once; repeat for each '
+                             'mirror (client only, replaces --host/--port)')
+    parser.add_argument('--tls', action='store_true', default=TLS_ENABLED,
+                        help='TLS on all 5 sockets; the data sockets resume the first socket\'s session')
+    parser.add_argument('--cert', type=str, default=TLS_CERT,
+                        help=f'Server certificate (server only, default: {TLS_CERT})')
+    parser.add_argument('--key', type=str, default=TLS_KEY,
+                        help=f'Server private key (server only, default: {TLS_KEY})')
+    parser.add_argument('--ca', type=str, default=TLS_CA,
+                        help='CA file to verify the server with, e.g. a self-signed server\'s certificate '
+                             '(client only, default: system CAs)')
+    parser.add_argument('--parallel', type=int, default=MAX_ACTIVE_DOWNLOADS,
+                        help=f'Files downloading at once, each on its own 1+4 sockets (client only, '
+                             f'default: {MAX_ACTIVE_DOWNLOADS})')
+    parser.add_argument('--rate', type=float, default=None, metavar='MB/S',
+                        help='Total download rate budget of all files in MB/s (client only, default: no limit)')
 
     args = parser.parse_args()
 
@@ -50,9 +124,14 @@ Examples:
             print(f"  Host: {HOST}")
             print(f"  Port: {PORT}")
             print(f"  Resource Folder: {folder_path}")
+            print(f"  Workers: {args.workers}")
+            print(f"  TLS: {'on' if args.tls else 'off'}")
             print()
 
-            Server(HOST, PORT, folder_path)
+            if args.workers > 1:
+                run_prefork_server(HOST, PORT, folder_path, args.workers, args.tls, args.cert, args.key)
+                return
+            Server(HOST, PORT, folder_path, tls=args.tls, cert=args.cert, key=args.key)
         except KeyboardInterrupt:
             print("\n\033[1;32;40m[NOTIFICATION] Server stopped by user.\033[0m")
         except Exception as e:
@@ -73,12 +152,21 @@ Examples:
             input_path = args.input if args.input else input("Enter input file path: ")
 
             print(f"Client Configuration:")
-            print(f"  Server: {HOST}:{PORT}")
+            if args.mirror:
+                print(f"  Mirrors: {', '.join(f'{h}:{p}' for h, p in args.mirror)}")
+            else:
+                print(f"  Server: {HOST}:{PORT}")
             print(f"  Download Folder: {folder_path}")
             print(f"  Input File: {input_path}")
+            print(f"  TLS: {'on' if args.tls else 'off'}")
+            print(f"  Parallel Downloads: {args.parallel}")
             print()
 
-            Client(HOST, PORT, folder_path, input_path)
+            if args.mirror:
+                run_swarm_client(args.mirror, folder_path, input_path, args.tls, args.ca)
+                return
+            rate = args.rate * 1e6 if args.rate else DOWNLOAD_RATE_LIMIT
+            Client(HOST, PORT, folder_path, input_path, tls=args.tls, ca=args.ca, concurrency=args.parallel, rate=rate)
         except KeyboardInterrupt:
             print("\n\033[1;32;40m[NOTIFICATION] Client stopped by user.\033[0m")
         except Exception as e:
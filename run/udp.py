@@ -6,9 +6,92 @@ Usage: python run_udp.py [server|client] [options]
 
 import sys
 import os
+import time
 import argparse
 
+def run_udp_worker(worker_id, stats_queue, host, port, dir_path):
+    from server.udp import FileServer
+    from core.constants import STATS_INTERVAL
+    from threading import Thread
+
+    try:
+        server = FileServer(host, port, dir_path, reuse_port=True)
+        Thread(target=server.start_server, daemon=True).start()
+        while True:
+            time.sleep(STATS_INTERVAL)
+            stats_queue.put((worker_id, server.get_summary()))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_prefork_server(host, port, dir_path, workers):
+    from core.prefork import Supervisor
+
+    print(f"Prefork: {workers} workers sharing port {port} (SO_REUSEPORT)")
+    Supervisor(run_udp_worker, workers, args=(host, port, dir_path)).run()
+    print("\n\033[1;32;40m[NOTIFICATION] Exited the server!\n\033[0m")
+
+
+def run_async_server(host, port, dir_path):
+    from core.udp_async import AsyncUDPServerLogic
+
+    server = AsyncUDPServerLogic(host, port, dir_path)
+    if not server.start():
+        return
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        print("\n\033[1;32;40m[NOTIFICATION] Exited the server!\n\033[0m")
+
+
+def run_async_client(host, port, output_path, file_input):
+    from core.udp_async import AsyncUDPClientLogic
+    from core.input_watch import InputWatcher
+
+    client = AsyncUDPClientLogic(host, port, output_path)
+    if not client.connect():
+        return
+    print("List of files:\n" + "\n".join(client.file_list) + "\n")
+
+    try:
+        with InputWatcher(file_input) as watcher:
+            for file in watcher.follow():
+                client.download_file(file)
+    except KeyboardInterrupt:
+        print("\n\033[1;32;40m[NOTIFICATION] Disconnected!\n\033[0m")
+
+
+def run_multicast_server(host, group, port, dir_path, file_names, receivers):
+    from core.udp_multicast import MulticastSender
+
+    sender = MulticastSender(host, group, port, dir_path)
+    try:
+        for name in file_names:
+            sender.push(name, receivers)
+    except KeyboardInterrupt:
+        pass
+    sender.close()
+    print("\n\033[1;32;40m[NOTIFICATION] Exited the server!\n\033[0m")
+
+
+def run_multicast_client(host, group, port, output_path):
+    from core.udp_multicast import MulticastReceiver
+
+    receiver = MulticastReceiver(group, port, output_path, interface=host)
+    print(f"Joined {group}:{port}, waiting for files...")
+    try:
+        while True:
+            receiver.receive()
+    except KeyboardInterrupt:
+        receiver.close()
+        print("\n\033[1;32;40m[NOTIFICATION] Disconnected!\n\033[0m")
+
+
 def main():
+    from core.constants import MAX_ACTIVE_DOWNLOADS, DOWNLOAD_RATE_LIMIT
+
     parser = argparse.ArgumentParser(
         description='UDP File Transfer - Server/Client Runner',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -18,6 +101,12 @@ Examples:
   python run_udp.py server --host 0.0.0.0 --port 6000
   python run_udp.py client --host 192.168.1.100
   python run_udp.py client --port 6001 --folder ./downloads
+  python run_udp.py server --engine asyncio
+  python run_udp.py server --workers 4
+  python run_udp.py client --engine asyncio
+  python run_udp.py client --parallel 4 --rate 20
+  python run_udp.py server --multicast 239.255.0.1 --push big.iso --receivers 12
+  python run_udp.py client --multicast 239.255.0.1 --folder ./downloads
         ''')
 
     parser.add_argument('mode', choices=['server', 'client'],
@@ -30,6 +119,26 @@ Examples:
                         help='Folder path (server: resource folder, client: download folder)')
     parser.add_argument('--input', type=str, default=None,
                         help='Input file path (client only)')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                        help='threads: blocking sockets + threads, asyncio: event loop engine '
+                             '(GUI wire protocol, pair asyncio with asyncio or the GUI) (default: threads)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Server worker processes sharing the port with SO_REUSEPORT (threads engine, '
+                             'server only, default: 1)')
+    parser.add_argument('--multicast', type=str, default=None, metavar='GROUP',
+                        help='Multicast mode: push files to / receive files from this group on --port; '
+                             '--host is the local interface (127.0.0.1 for loopback)')
+    parser.add_argument('--push', type=str, nargs='+', default=[],
+                        help='Files to multicast (server, multicast mode)')
+    parser.add_argument('--receivers', type=int, default=0,
+                        help='Finish a push once this many receivers are done; 0 waits until NAKs stop '
+                             '(server, multicast mode)')
+    parser.add_argument('--parallel', type=int, default=MAX_ACTIVE_DOWNLOADS,
+                        help=f'Files downloading at once, each on its own sockets (threads engine, client only, '
+                             f'default: {MAX_ACTIVE_DOWNLOADS})')
+    parser.add_argument('--rate', type=float, default=None, metavar='MB/S',
+                        help='Total download rate budget of all files in MB/s (threads engine, client only, '
+                             'default: no limit)')
 
     args = parser.parse_args()
 
@@ -50,10 +159,23 @@ Examples:
             print(f"  Host: {HOST}")
             print(f"  Port: {PORT}")
             print(f"  Resource Folder: {dir_path}")
+            print(f"  Engine: {args.engine}")
+            print(f"  Workers: {args.workers}")
             print()
 
+            if args.multicast:
+                run_multicast_server(HOST, args.multicast, PORT, dir_path, args.push, args.receivers)
+                return
+            if args.engine == "asyncio":
+                run_async_server(HOST, PORT, dir_path)
+                return
+            if args.workers > 1:
+                run_prefork_server(HOST, PORT, dir_path, args.workers)
+                return
+
             server = FileServer(HOST, PORT, dir_path)
             server.start_server()
+            server.demux.stop()
             server.server_socket.close()
             print("\n\033[1;32;40m[NOTIFICATION] Exited the server!\n\033[0m")
         except KeyboardInterrupt:
@@ -73,15 +195,25 @@ Examples:
             HOST = args.host
             PORT = args.port
             output_path = args.folder if args.folder else input("Enter folder path to save files: ")
+            if args.multicast:
+                run_multicast_client(HOST, args.multicast, PORT, output_path)
+                return
             file_input = args.input if args.input else input("Enter input file path: ")
 
             print(f"Client Configuration:")
             print(f"  Server: {HOST}:{PORT}")
             print(f"  Download Folder: {output_path}")
             print(f"  Input File: {file_input}")
+            print(f"  Engine: {args.engine}")
+            print(f"  Parallel Downloads: {args.parallel}")
             print()
 
-            client = FileClient(HOST, PORT, output_path, file_input)
+            if args.engine == "asyncio":
+                run_async_client(HOST, PORT, output_path, file_input)
+                return
+
+            rate = args.rate * 1e6 if args.rate else DOWNLOAD_RATE_LIMIT
+            client = FileClient(HOST, PORT, output_path, file_input, concurrency=args.parallel, rate=rate)
             client.start_client()
             client.stop()
             sys.exit(0)
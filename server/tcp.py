@@ -1,4 +1,5 @@
 import socket
+import ssl
 from threading import Thread
 import threading
 import signal
@@ -6,11 +7,26 @@ import sys
 import time
 import os
 
+from core.prefork import share_port, steer_by_source
+from core.swarm import RangeServer
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.sparse import ZeroMap, send_records
+from core.tls import server_context, server_handshake
+from core.constants import TLS_ENABLED, TLS_CERT, TLS_KEY
+
 class Server:
-    def __init__(self, HOST, PORT, folder_path, use_signals=True):
+    def __init__(self, HOST, PORT, folder_path, use_signals=True, workers=1, tls=TLS_ENABLED,
+                 cert=TLS_CERT, key=TLS_KEY):
+        # TLS on all 5 sockets; a client's data sockets resume its first socket's session
+        self.tls_context = server_context(cert, key) if tls else None
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if workers > 1:
+            share_port(self.socket)
         self.socket.bind((HOST, PORT))
         self.socket.listen()
+        if workers > 1:
+            # prefork worker: all 5 connections of a client IP must reach the same worker
+            steer_by_source(self.socket, workers)
 
         print(f"\n\033[1;32;40mServer started on ({HOST}, {PORT})\nWaiting for Clients...\033[0m")
         self.folder_path = folder_path
@@ -22,6 +38,14 @@ class Server:
 
         self.file_exist = [f for f in os.listdir(self.folder_path) if os.path.isfile(os.path.join(self.folder_path, f))]
 
+        self.lock = threading.Lock()
+        self.stats = {"clients": 0, "files": 0, "bytes": 0, "zero_bytes": 0}
+        # chunks are read through shared descriptors and the process-wide block cache
+        self.files = OpenFileTable()
+        self.cache = shared_cache()
+        # swarm clients ask for hashes and byte ranges, any client for STAT (conditional GET)
+        self.ranges = RangeServer(self.folder_path, files=self.files, cache=self.cache)
+
         self.use_signals = use_signals
         if use_signals:
             signal.signal(signal.SIGINT, self.stop_server)
@@ -46,19 +70,33 @@ class Server:
         try:
             while self.running:
                 client = []
-                for i in range(4):
-                    client_socket, address = self.socket.accept()
-                    client.append(client_socket)
+                try:
+                    for i in range(4):
+                        client_socket, address = self.socket.accept()
+                        client.append(self.handshake(client_socket))
 
-                client_socket, address = self.socket.accept()
-                client.append(client_socket)
+                    client_socket, address = self.socket.accept()
+                    client.append(self.handshake(client_socket))
+                except (OSError, ssl.SSLError) as e:
+                    if not self.running:
+                        break
+                    print(f"Error accepting client: {e}")
+                    for client_socket in client:
+                        client_socket.close()
+                    continue
 
                 address = f"({address[0]}, {address[1]})"
+                self.count("clients")
                 client_thread = Thread(target = self.handle_client, args = (client, address, ), daemon = True)
                 client_thread.start()
         except KeyboardInterrupt:
             self.stop_server()
 
+    def handshake(self, client_socket):
+        if self.tls_context is None:
+            return client_socket
+        return server_handshake(self.tls_context, client_socket)
+
     def handle_client(self, client, address):
         try:
             print(f"\n\033[1;32;40m[NOTIFICATION] Connected to Client {str(address)}\n\033[0m")
@@ -91,22 +129,33 @@ class Server:
         try:
             # Set timeout to avoid blocking forever
             client[4].settimeout(1.0)
+            buffer = ""
             while self.running:
                 try:
                     client_msg = client[4].recv(1024).decode()
                     if not client_msg:
                         break
+
+                    # Swarm requests are newline-terminated and may arrive back to back
+                    lines, buffer = self.ranges.split(buffer + client_msg)
+                    for line in lines:
+                        self.ranges.handle(line, client)
+                    if not buffer or self.ranges.pending(buffer):
+                        continue
+                    client_msg, buffer = buffer, ""
                     print(f"\033[1;31;40m[FROM] {address}: {client_msg}\033[0m")
 
                     command, filename = client_msg.split(" ", 1)
-                    if command == "GET":
+                    # SPARSE: same as GET, data sockets carry DATA/ZERO records
+                    if command in ("GET", "SPARSE"):
                         if self.check_exist_file(filename) == False:
                             msg = f"{filename} does not exist!"
                             self.send_msg(client, msg, address)
                         else:
                             msg = f"Downloading {filename}!"
                             self.send_msg(client, msg, address)
-                            FileTransfer(self, filename, client, address, self.folder_path, self.running).send_file()
+                            FileTransfer(self, filename, client, address, self.folder_path, self.running,
+                                         sparse=command == "SPARSE").send_file()
                 except socket.timeout:
                     continue
                 except Exception as e:
@@ -121,6 +170,20 @@ class Server:
         except Exception as e:
             print(f"Error in rcv_msg: {e}")
 
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def get_stats(self):
+        # flat counters, summed over workers by the prefork supervisor
+        cache = self.cache.stats()
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update({"open_files": self.files.stats()["open"],
+                      "cache_hits": cache["hits"], "cache_misses": cache["misses"],
+                      "cache_hit_bytes": cache["hit_bytes"], "cache_disk_bytes": cache["disk_bytes"]})
+        return stats
+
     def send_msg(self, client, msg, address):
         print(f"[TO] {str(address)}: {msg}")
         client[4].send(msg.encode())
@@ -140,17 +203,19 @@ class Server:
         os._exit(0)
 
 class FileTransfer():
-    def __init__(self, Server, filename, client, address, folder_path, run):
+    def __init__(self, Server, filename, client, address, folder_path, run, sparse=False):
         self.socket = Server.socket
         self.client_socket = client
         self.address = address
         self.filename = filename
-        self.file_path = f"{folder_path}\\{filename}"
-        self.file_size = os.path.getsize(self.file_path)
+        self.file_path = os.path.join(folder_path, filename)
+        self.handle = Server.files.acquire(self.file_path)
+        self.file_size = self.handle.size
         self.num_chunk = 4
         self.chunks = []
         self.running = run
         self.server_instance = Server
+        self.sparse = sparse
 
         for chunk_id in range(self.num_chunk):
             chunk_start = chunk_id * (self.file_size // self.num_chunk)
@@ -172,6 +237,8 @@ class FileTransfer():
 
             for thread in threads:
                 thread.join()
+            self.server_instance.count("files")
+            self.server_instance.count("bytes", self.file_size)
 
             msg = f"{self.filename} downloaded successfully"
             print(f"[TO] {self.address}: {msg}")
@@ -185,14 +252,20 @@ class FileTransfer():
             self.stop_client()
         except Exception as e:
             print(f"Error in send_file: {e}")
+        finally:
+            self.server_instance.files.release(self.handle)
 
     def send_chunk(self, chunk_id):
         start, end, size = self.chunks[chunk_id]
         try:
-            with open(self.file_path, "rb") as f:
-                f.seek(start)
-                data = f.read(size)
-                self.client_socket[chunk_id].sendall(data)
+            with ReadAhead(self.server_instance.cache, self.handle, start, size) as reader:
+                if self.sparse:
+                    zeros = ZeroMap(self.handle.fd, start, end)
+                    zero_bytes = send_records(self.client_socket[chunk_id], zeros, reader)
+                    self.server_instance.count("zero_bytes", zero_bytes)
+                    return
+                for block in reader:
+                    self.client_socket[chunk_id].sendall(block)
         except KeyboardInterrupt:
             self.stop_server()
             self.stop_client()
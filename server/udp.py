@@ -1,45 +1,107 @@
 import socket
 import threading
+import itertools
+import time
 import hashlib
 import os
 
-# PACKET_SIZE = 1500
+from core.udp_demux import UDPDemux
+from core.constants import SESSION_TIMEOUT, FETCH_WINDOW
+from core.mtu import path_mtu, probe_reply, IP_UDP_HEADERS, MIN_PACKET_SIZE
+from core.protocol import split_message, CONTINUE, PACKET_OVERHEAD
+from core.rtt import RTTEstimator
+from core.file_cache import OpenFileTable, ReadAhead, shared_cache
+from core.hash_cache import HashCache, stat_reply
+from core.prefork import share_port
+
+# Largest packet size a session may negotiate, the path MTU usually wins
 PACKET_SIZE = 1024 * 8
-DATA_SIZE = PACKET_SIZE - 100
+
+PING_MSG = "23120088"
 
 class FileServer:
-    def __init__(self, host, port, dir_path=None):
+    def __init__(self, host, port, dir_path=None, reuse_port=False):
         self.host = host
         self.port = port
         if dir_path is None:
             dir_path = input("Enter resource folder path: ")
-        self.file_path = dir_path + '\\'
+        self.dir_path = dir_path
         self.chunk_num = 4
         self.TIMEOUT = 0.1
         self.lock = threading.Lock()
         self.MAX_TRIES = 100
-        self.client = []
+        self.running = False
+        self.sessions = {}  # client address -> per-client transfer state
+        self.flow_rtt = {}  # (transfer_id, chunk_id) -> RTTEstimator of active chunk flows
+        self.fetches = {}   # (client host, nonce) -> [transfer_id, chunks in progress, chunks finished, all sent] of FETCH transfers
         self.file_list = [
             f"{f} - {(os.path.getsize(os.path.join(dir_path, f)))}B"
             for f in os.listdir(dir_path)
             if os.path.isfile(os.path.join(dir_path, f))
         ]
         self.file_exist = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
-        self.dic_ack = {}
+        self.transfer_ids = itertools.count(1)
+        self.files = OpenFileTable()  # shared, reference-counted descriptors
+        self.cache = shared_cache()   # process-wide block cache, BLOCK_CACHE_SIZE budget
+        self.hashes = HashCache(dir_path)  # file digests for STAT, kept in sidecar files
         # initialize server socket
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if reuse_port:
+                # prefork worker: the kernel hashes each client socket to one worker
+                share_port(self.server_socket)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.settimeout(self.TIMEOUT)
         except Exception as e:
             print(f"Error: {e}")
+        # a single thread reads the socket and routes datagrams to flows
+        self.demux = UDPDemux(self.server_socket, on_unrouted=self.route_datagram, packet_size=PACKET_SIZE)
+
+    def route_datagram(self, data, address):
+        # "FETCH <nonce> <chunk_id> <packet_size> <file>" starts a chunk in a single round trip
+        if data.startswith(b"FETCH "):
+            self.open_fetch(data, address)
+            return
+        # "JOIN <transfer_id> <chunk_id>" binds a client chunk socket to its flow
+        if data.startswith(b"JOIN "):
+            try:
+                _, transfer_id, chunk_id = data.decode().split()
+                flow = (int(transfer_id), int(chunk_id))
+            except ValueError:
+                return
+            if self.demux.bind(address, flow):
+                self.demux.deliver(flow, data, address)
+            return
+        # path MTU probes are echoed so the client can size its packets
+        reply = probe_reply(data)
+        if reply is not None:
+            self.server_socket.sendto(reply, address)
+            return
+        # a PING from an unknown address starts a new session
+        if data.split(b" ")[0] == PING_MSG.encode():
+            self.open_session(address, data)
+        else:
+            self.server_socket.sendto("NOK".encode(), address)
+
+    def negotiate_packet_size(self, client_address, ping):
+        # "23120088 <size>": the client's proposal, capped by our own path MTU
+        parts = ping.split(b" ")
+        proposed = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else PACKET_SIZE
+        return self.cap_packet_size(client_address, proposed)
+
+    def cap_packet_size(self, client_address, proposed):
+        packet_size = min(proposed, PACKET_SIZE)
+        mtu = path_mtu(client_address)
+        if mtu:
+            packet_size = min(packet_size, mtu - IP_UDP_HEADERS)
+        return max(packet_size, MIN_PACKET_SIZE)
 
     def check_exist_file(self, file_name):
         return (file_name in self.file_exist)
 
-    def send_file_list(self, client_address):
+    def send_file_list(self, client_address, session):
         file_list_str = "List of files:\n" + "\n".join(self.file_list)
-        self.send_message(file_list_str, client_address)
+        self.send_message(file_list_str, client_address, session)
 
     def calculate_checksum(self, data):
         return hashlib.md5(data).hexdigest()
@@ -53,207 +115,375 @@ class FileServer:
         packet = b"|".join([seq_s, checksum, chunk_id, data])
         return packet
 
-    def send_chunk(self, file_name, file_size, chunk_id):
-        # receive PING_MSG
-        client_address = self.recv_ping_message()
-        if client_address is None:
-            # print(f"\n\033[1;32;40m[NOTIFICATION] Server has received PING_MSG from client with address: {str(client_address)}\n\033[0m")
-            return
-        # send bytes
-        sequence_number = 0
+    def wait_join(self, flow):
+        # wait for the client chunk socket announcing itself for this flow
+        cnt = 1
+        while True:
+            try:
+                message, client_address = self.demux.recv(flow, self.TIMEOUT)
+                if message.startswith(b"JOIN "):
+                    self.server_socket.sendto("OK".encode(), client_address)
+                    return client_address
+            except socket.timeout:
+                cnt = cnt + 1
+                if cnt >= self.MAX_TRIES:
+                    return None
+            except ConnectionResetError:
+                continue
+
+    def send_chunk(self, handle, file_size, chunk_id, transfer_id, session):
+        flow = (transfer_id, chunk_id)
+        data_size = session["packet_size"] - PACKET_OVERHEAD
+        # same path as the control channel: start from its RTO
+        rtt = RTTEstimator(initial_rto=session["rtt"].rto)
+        with self.lock:
+            self.flow_rtt[flow] = rtt
         try:
-            # read chunk file
-            start = chunk_id * (file_size // int(self.chunk_num)) # Bắt đầu chunk
-            end = start + (file_size // int(self.chunk_num))      # Kết thúc chunk
-            if chunk_id == self.chunk_num - 1:   # Chunk cuối có thể chứa phần dư
-                end = file_size
-
-            with open(file_name, "rb") as f:
-                f.seek(start)
-                while start < end:
-                    data = f.read(min(DATA_SIZE, end - start))
-
-                    if not data:
-                        break
-                    cnt = 1
-                    while True:
-                        # packaging
-                        packet = self.packaging(data, sequence_number, str(chunk_id))
-                        if packet == None or client_address == None:
-                            return
-                        try:
-                            # send packet
-                            self.server_socket.sendto(packet, client_address)
-                            # wait for ack
-                            ack, address = self.server_socket.recvfrom(PACKET_SIZE)
-                            ack = ack.decode()
-                            if ack.isdigit():
-                                ack = int(ack)
-                                # receive suitable ack
-                                if address == client_address:
-                                    if ack == sequence_number:
-                                        sequence_number += 1
-                                        break
-                                    else:
-                                        continue
-                                # not receive suitable ack store into dict_ack
-                                self.dic_ack[address] = ack
-
-                                if client_address in self.dic_ack:
-                                    ack = self.dic_ack.pop(client_address)
-                                    if ack == sequence_number:
-                                        sequence_number += 1
-                                        break
-                        except socket.timeout:
-                            cnt = cnt + 1
-                            if cnt >= self.MAX_TRIES:
-                                break
-                            # continue
-                        except ConnectionResetError:
-                            return
-                        except KeyboardInterrupt:
-                            return
-                    start += len(data)
+            client_address = self.wait_join(flow)
+            if client_address is None:
+                return
+            start, end = self.chunk_bounds(file_size, chunk_id)
+            self.stream_chunk(flow, client_address, handle, chunk_id, start, end, data_size, rtt)
         except KeyboardInterrupt:
             return
+        finally:
+            self.demux.close_flow(flow)
+            with self.lock:
+                self.flow_rtt.pop(flow, None)
+            # later transfers of the session start from what this flow learned
+            if rtt.samples:
+                session["rtt"] = rtt
+
+    def chunk_bounds(self, file_size, chunk_id):
+        start = chunk_id * (file_size // int(self.chunk_num)) # Bắt đầu chunk
+        end = start + (file_size // int(self.chunk_num))      # Kết thúc chunk
+        if chunk_id == self.chunk_num - 1:   # Chunk cuối có thể chứa phần dư
+            end = file_size
+        return start, end
+
+    def stream_chunk(self, flow, client_address, handle, chunk_id, start, end, data_size, rtt,
+                     request=b"JOIN", reply=b"OK", window=0):
+        # stop-and-wait over [start, end); with a window, reply and the first
+        # window packets go out together before any ACK is awaited
+        with ReadAhead(self.cache, handle, start, end - start) as reader:
+            count = -(-(end - start) // data_size)
+
+            def make_packet(sequence):
+                offset = start + sequence * data_size
+                data = reader.read(offset, min(data_size, end - offset))
+                return self.packaging(data, sequence, str(chunk_id))
+
+            in_flight = {sequence: make_packet(sequence) for sequence in range(min(window, count))}
+            acked = set()   # ACKs of window packets that came in ahead of their turn
+            sent_at = time.perf_counter()
+            if window:
+                self.demux.send_batch([reply] + list(in_flight.values()), client_address)
+
+            for sequence in range(count):
+                packet = in_flight.pop(sequence, None)
+                resend = packet is None
+                sends = 0 if resend else 1
+                if resend:
+                    packet = make_packet(sequence)
+                cnt = 1
+                while sequence not in acked:
+                    try:
+                        if resend:
+                            self.server_socket.sendto(packet, client_address)
+                            sent_at = time.perf_counter()
+                            sends += 1
+                        # wait for ack, only this flow's datagrams reach us
+                        ack, address = self.demux.recv(flow, rtt.rto)
+                    except socket.timeout:
+                        rtt.backoff()
+                        cnt = cnt + 1
+                        if cnt >= self.MAX_TRIES:
+                            return False
+                        resend = True
+                        continue
+                    except ConnectionResetError:
+                        return False
+                    resend = True
+                    if ack.isdigit():
+                        ack = int(ack)
+                        if ack == sequence and sends == 1:
+                            # Karn: only packets sent once give an RTT sample
+                            rtt.sample(time.perf_counter() - sent_at)
+                        acked.add(ack)
+                        # an older ACK is the client's "resend", a newer one acks the window
+                        resend = ack < sequence
+                    elif ack.startswith(request):
+                        # our reply was lost, the client is still asking
+                        self.server_socket.sendto(reply, address)
+                acked.discard(sequence)
+            return True
 
     def start_server(self):
-        # receive PING_MSG from client
+        # every client that PINGs gets its own session, served concurrently
         print(f"\n\033[1;32;40mServer started on {self.server_socket.getsockname()} \nWaiting for PING_MSG\033[0m")
+        self.running = True
+        self.demux.start()
         try:
-            client_address = self.recv_ping_message()
-            if client_address is not None:
-                print(f"\n\033[1;32;40m[NOTIFICATION] Received PING_MSG from Client {str(client_address)}\n\033[0m")
+            while self.running:
+                time.sleep(1.0)
         except KeyboardInterrupt:
+            print("\nShutting down server...")
+        self.running = False
+
+    def open_session(self, client_address, ping):
+        # session table entry: control flow + thread running the GET loop
+        packet_size = self.negotiate_packet_size(client_address, ping)
+        with self.lock:
+            if client_address in self.sessions:
+                return
+            flow = self.demux.open_flow(("session", client_address))
+            self.demux.bind(client_address, flow)
+            session = {"flow": flow, "packet_size": packet_size, "rtt": RTTEstimator(),
+                       "transfer_id": None, "file_name": None}
+            self.sessions[client_address] = session
+        print(f"\n\033[1;32;40m[NOTIFICATION] Received PING_MSG from Client {str(client_address)}\n\033[0m")
+        print(f"[SESSION] {client_address}: packet size {packet_size} bytes")
+        self.server_socket.sendto(f"OK {packet_size}".encode(), client_address)
+        threading.Thread(target=self.serve_client, args=(client_address, session), daemon=True).start()
+
+    def open_fetch(self, data, client_address):
+        # the chunk socket gets its own flow at once, so FETCH retransmissions
+        # and ACKs reach the thread serving it
+        try:
+            _, nonce, chunk_id, proposed, file_name = data.decode().split(" ", 4)
+            chunk_id, proposed = int(chunk_id), int(proposed)
+        except ValueError:
+            return
+        flow = self.demux.open_flow(("fetch", client_address))
+        self.demux.bind(client_address, flow)
+        threading.Thread(target=self.send_fetch,
+                         args=(client_address, flow, nonce, chunk_id, proposed, file_name),
+                         daemon=True).start()
+
+    def send_fetch(self, client_address, flow, nonce, chunk_id, proposed, file_name):
+        # reply "META <file_size> <transfer_id> <packet_size>" + first window, then stop-and-wait
+        if not self.check_exist_file(file_name) or not 0 <= chunk_id < self.chunk_num:
+            self.server_socket.sendto("NOT".encode(), client_address)
+            self.demux.close_flow(flow)
             return
+        try:
+            handle = self.files.acquire(os.path.join(self.dir_path, file_name))
+        except OSError:
+            self.server_socket.sendto("NOT".encode(), client_address)
+            self.demux.close_flow(flow)
+            return
+
+        # the client's chunk sockets share a nonce, and so one transfer id
+        key = (client_address[0], nonce)
+        with self.lock:
+            transfer = self.fetches.get(key)
+            if transfer is None:
+                transfer = self.fetches[key] = [next(self.transfer_ids), 0, set(), True]
+            transfer[1] += 1
+            transfer_id = transfer[0]
+            # same host as a control channel: start from its RTO
+            rtos = [s["rtt"].rto for a, s in self.sessions.items() if a[0] == client_address[0]]
+            rtt = RTTEstimator(initial_rto=rtos[0]) if rtos else RTTEstimator()
+            self.flow_rtt[(transfer_id, chunk_id)] = rtt
+
+        packet_size = self.cap_packet_size(client_address, proposed)
+        meta = f"META {handle.size} {transfer_id} {packet_size}".encode()
+        start, end = self.chunk_bounds(handle.size, chunk_id)
+        if chunk_id == 0:
+            print(f"[TO] {client_address[0]}: Downloading {file_name}! (transfer {transfer_id})")
+        done = False
+        try:
+            done = self.stream_chunk(flow, client_address, handle, chunk_id, start, end,
+                                     packet_size - PACKET_OVERHEAD, rtt,
+                                     request=b"FETCH ", reply=meta, window=FETCH_WINDOW)
+        finally:
+            self.demux.close_flow(flow)
+            self.files.release(handle)
+            with self.lock:
+                self.flow_rtt.pop((transfer_id, chunk_id), None)
+                transfer[1] -= 1
+                transfer[2].add(chunk_id)
+                transfer[3] = transfer[3] and done
+                # a chunk can finish before the client's FETCH for another has arrived:
+                # the transfer ends with the last of all its chunks, not when none is running
+                last = transfer[1] == 0 and len(transfer[2]) == self.chunk_num
+                if last:
+                    self.fetches.pop(key, None)
+        if last and transfer[3]:
+            print(f"[TO] {client_address[0]}: {file_name} downloaded successfully ({rtt})")
 
-        if client_address is not None:
+    def close_session(self, client_address):
+        with self.lock:
+            session = self.sessions.pop(client_address, None)
+        if session is not None:
+            self.demux.close_flow(session["flow"])
+
+    def serve_client(self, client_address, session):
+        flow = session["flow"]
+        try:
             # send file_list
-            self.send_file_list(client_address)
+            self.send_file_list(client_address, session)
             print(f"[TO] {client_address}: File list has been sent to Client!\n")
             # receive file need to be downloaded
-            while True:
-                try:
-                    client_msg, address = self.recv_message()
-                    if client_msg is None:
-                        continue
-                    # receive msg
-                    if "GET" in client_msg:
-                        file_name = client_msg[4:]
-                    # client disconnect
-                    if client_msg == "EXIT":
-                        print(f"\n\033[1;32;40m[NOTIFICATION] Client {str(address)} disconnected.\n\033[0m")
-                        break
-                    # print msg
-                    print("\033[1;31;40m" + "[FROM] " + str(address) + ": " + client_msg + "\033[0m")
-
-                    if self.check_exist_file(file_name):
-                        filename = file_name
-                        file_name = self.file_path + file_name
-                        file_size = os.path.getsize(file_name)
-                        # send files_size to client
-                        self.send_message(str(file_size), client_address)
-                        # send start downloading
-                        msg = f"Server: Downloading {filename}!"
-                        self.send_message(msg, client_address)
-                        # send file
-                        print(f"[TO] {client_address}: Downloading {filename}!")
-                        try:
-                            threads = []
-                            for chunk_id in range(self.chunk_num):
-                                thread = threading.Thread(
-                                    target=self.send_chunk, args=(file_name, file_size, chunk_id)
-                                )
-                                if thread is not None:
-                                    threads.append(thread)
-                                    thread.start()
-
-                            for thread in threads:
-                                if thread is not None:
-                                    thread.join()
-
-                            # successfully send file
-                            msg = f"Server: {filename} downloaded successfully"
-                            self.send_message(msg, client_address)
-                            # print
-                            message = f"[TO] {client_address}: {filename} downloaded successfully"
-                            print(message)
-                            # received cofirm from client
-                            client_msg = self.recv_message()[0]
-                            print("\033[1;31;40m" + "[FROM] " + str(address) + ": " + client_msg + "\033[0m")
-                        except KeyboardInterrupt:
-                            return
-                    else:
-                        msg = f"{file_name} does not exist!"
-                        print(f"[TO] {str(address)}: {msg}")
-                        message = "NOT"
-                        self.send_message(message, client_address)
-                except KeyboardInterrupt:
-                    return
-                except ConnectionResetError:
+            while self.running:
+                client_msg, address = self.recv_message(flow, SESSION_TIMEOUT)
+                if client_msg is None:
+                    print(f"\n\033[1;32;40m[NOTIFICATION] Client {str(client_address)} timed out.\n\033[0m")
+                    break
+                # client disconnect
+                if client_msg == "EXIT":
+                    print(f"\n\033[1;32;40m[NOTIFICATION] Client {str(address)} disconnected.\n\033[0m")
+                    break
+                # print msg
+                print("\033[1;31;40m" + "[FROM] " + str(address) + ": " + client_msg + "\033[0m")
+                # conditional GET: does the client have this version already?
+                if client_msg.startswith("STAT "):
+                    self.send_message(stat_reply(self.hashes, client_msg), client_address, session)
                     continue
-        else:
-            print("Client address is none\n")
-
-    def recv_ping_message(self):
-        while True:
-            try:
-                message, client_address = self.server_socket.recvfrom(PACKET_SIZE)
-                if client_address in self.client:
+                # receive msg
+                if not client_msg.startswith("GET "):
                     continue
-                self.client.append(client_address)
-                message = message.decode()
-                if message == "23120088":
-                    response = "OK"
-                    self.server_socket.sendto(response.encode(), client_address)
-                    return client_address
+                file_name = client_msg[4:]
+
+                if self.check_exist_file(file_name):
+                    self.send_file(client_address, session, file_name)
                 else:
-                    response = "NOK"
-                    self.server_socket.sendto(response.encode(), client_address)
-            except socket.timeout:
-                continue
-            except ConnectionResetError:
-                continue
-            except KeyboardInterrupt:
-                return None
-    def recv_message(self):
-        while True:
+                    msg = f"{file_name} does not exist!"
+                    print(f"[TO] {str(address)}: {msg}")
+                    message = "NOT"
+                    self.send_message(message, client_address, session)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.close_session(client_address)
+
+    def send_file(self, client_address, session, filename):
+        flow = session["flow"]
+        # one shared descriptor per transfer, its chunk threads read through the block cache
+        handle = self.files.acquire(os.path.join(self.dir_path, filename))
+        file_size = handle.size
+        # open one flow per chunk before the client can JOIN it
+        transfer_id = next(self.transfer_ids)
+        session["transfer_id"] = transfer_id
+        session["file_name"] = filename
+        for chunk_id in range(self.chunk_num):
+            self.demux.open_flow((transfer_id, chunk_id))
+        # send files_size and transfer id to client
+        self.send_message(f"{file_size} {transfer_id}", client_address, session)
+        # send start downloading
+        msg = f"Server: Downloading {filename}!"
+        self.send_message(msg, client_address, session)
+        # send file
+        print(f"[TO] {client_address}: Downloading {filename}!")
+        threads = []
+        for chunk_id in range(self.chunk_num):
+            thread = threading.Thread(
+                target=self.send_chunk,
+                args=(handle, file_size, chunk_id, transfer_id, session),
+                daemon=True
+            )
+            threads.append(thread)
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+        self.files.release(handle)
+
+        # successfully send file
+        msg = f"Server: {filename} downloaded successfully"
+        self.send_message(msg, client_address, session)
+        # print
+        message = f"[TO] {client_address}: {filename} downloaded successfully ({session['rtt']})"
+        print(message)
+        # received cofirm from client
+        client_msg, address = self.recv_message(flow, SESSION_TIMEOUT)
+        if client_msg is not None:
+            print("\033[1;31;40m" + "[FROM] " + str(address) + ": " + client_msg + "\033[0m")
+        session["transfer_id"] = None
+        session["file_name"] = None
+
+    def recv_message(self, flow, idle_timeout=None):
+        # returns (None, None) once nothing has arrived for idle_timeout seconds
+        deadline = time.time() + idle_timeout if idle_timeout else None
+        pieces = []
+        while self.running:
             try:
-                packet, client_address = self.server_socket.recvfrom(PACKET_SIZE)
+                packet, client_address = self.demux.recv(flow, self.TIMEOUT)
+                if packet.split(b" ")[0] == PING_MSG.encode():
+                    # our OK to the PING was lost
+                    with self.lock:
+                        session = self.sessions.get(client_address)
+                    if session is not None:
+                        self.server_socket.sendto(f"OK {session['packet_size']}".encode(), client_address)
+                    continue
                 if packet.count(b"|") >= 1:
-                    checksum, message = packet.split(b"|")
-                    checksum = checksum.decode()
+                    checksum, message = packet.split(b"|", 1)
+                    checksum = checksum.decode(errors="ignore")
                     if self.calculate_checksum(message) == checksum:
                         response = "OK"
                         self.server_socket.sendto(response.encode(), client_address)
-                        return message.decode(), client_address
+                        # long messages arrive in pieces, all but the last flagged CONTINUE
+                        if message.startswith(CONTINUE):
+                            pieces.append(message[len(CONTINUE):])
+                            continue
+                        return (b"".join(pieces) + message).decode(), client_address
                     response = "NOK"
                     self.server_socket.sendto(response.encode(), client_address)
             except socket.timeout:
-                continue
-            except KeyboardInterrupt:
-                print("\nShutting down server...")
-                return None
+                if deadline is not None and time.time() > deadline:
+                    break
+        return None, None
 
+    def send_message(self, message, client_address, session):
+        for piece in split_message(message.encode(), session["packet_size"]):
+            if not self.send_piece(piece, client_address, session):
+                break
 
-    def send_message(self, message, client_address):
+    def send_piece(self, message, client_address, session):
+        flow = session["flow"]
+        rtt = session["rtt"]
         cnt = 1
-        message = message.encode()
+        sends = 0
         checksum = self.calculate_checksum(message).encode()
         packet = b"|".join([checksum, message])
-        while True:
+        while self.running:
             self.server_socket.sendto(packet, client_address)
+            sent_at = time.perf_counter()
+            sends += 1
             try:
-                ack, _ = self.server_socket.recvfrom(PACKET_SIZE)
-                if ack.decode() == "OK":
-                    break
+                ack, _ = self.demux.recv(flow, rtt.rto)
+                if ack == b"OK":
+                    if sends == 1:
+                        rtt.sample(time.perf_counter() - sent_at)
+                    return True
+                if ack.split(b" ")[0] == PING_MSG.encode():
+                    self.server_socket.sendto(f"OK {session['packet_size']}".encode(), client_address)
             except socket.timeout:
+                rtt.backoff()
                 cnt = cnt + 1
                 if cnt >= self.MAX_TRIES:
                     print("Can't send message to client\n")
-                    break
-            except KeyboardInterrupt:
-                return
+                    return False
+        return False
+
+    def get_stats(self):
+        # live RTT/RTO per session control channel and per active chunk flow, file/block cache
+        with self.lock:
+            sessions = {address: {"packet_size": session["packet_size"],
+                                  "file_name": session["file_name"],
+                                  **session["rtt"].snapshot()}
+                        for address, session in self.sessions.items()}
+            flows = {flow: rtt.snapshot() for flow, rtt in self.flow_rtt.items()}
+        return {"sessions": sessions, "flows": flows,
+                "files": self.files.stats(), "cache": self.cache.stats()}
+
+    def get_summary(self):
+        # flat counters, summed over workers by the prefork supervisor
+        stats = self.get_stats()
+        return {"sessions": len(stats["sessions"]), "flows": len(stats["flows"]),
+                "open_files": stats["files"]["open"],
+                "cache_hits": stats["cache"]["hits"], "cache_misses": stats["cache"]["misses"],
+                "cache_hit_bytes": stats["cache"]["hit_bytes"], "cache_disk_bytes": stats["cache"]["disk_bytes"]}
 
 if __name__ == "__main__":
     HOST = input("Enter Server IP address: ")
@@ -262,5 +492,6 @@ if __name__ == "__main__":
 
     server = FileServer(HOST, PORT, dir_path)
     server.start_server()
+    server.demux.stop()
     server.server_socket.close()
     print("\n\033[1;32;40m[NOTIFICATION] Exited the server!\n\033[0m")
@@ -29,3 +29,21 @@ def is_valid_utf8(data: bytes) -> bool:
         return True
     except UnicodeDecodeError:
         return False
+
+
+def file_checksum(path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Calculate MD5 checksum of a whole file, read block by block.
+
+    Args:
+        path: File to hash
+        block_size: Bytes read per step
+
+    Returns:
+        Hexadecimal string representation of the MD5 checksum
+    """
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()